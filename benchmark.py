@@ -0,0 +1,342 @@
+"""Benchmark fill-sheet-data and get-fc-members end to end, against the stand-in Lodestone and Google Sheets API in
+ffxiv_automated_collectible_tracker/standin.py, for synthetic rosters of several sizes.
+The stand-in server runs in its own process, so only this process's time and memory are measured.
+
+    python benchmark.py --roster-size 10 --roster-size 100 --results-file results.json
+"""
+import click
+import copy
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from pathlib import Path
+
+import ffxiv_automated_collectible_tracker.lodestone as lodestoneapi
+from ffxiv_automated_collectible_tracker.metrics import run_metrics
+from ffxiv_automated_collectible_tracker.command_line_interface import run_with_lodestone_client
+from ffxiv_automated_collectible_tracker.ffxiv_gsheet_updater import ACHIEVEMENT, MOUNT, update_spreadsheets
+from ffxiv_automated_collectible_tracker.gsheets import GSheets
+from ffxiv_automated_collectible_tracker.journal import set_journal_dir
+from ffxiv_automated_collectible_tracker.standin import (
+    DEFAULT_ACHIEVEMENTS_PER_CHARACTER,
+    DEFAULT_MOUNTS_PER_CHARACTER,
+    DEFAULT_PAGE_PADDING,
+    DEFAULT_RETRY_AFTER,
+    RESET_PATH,
+    STATS_PATH,
+    SyntheticRoster,
+)
+from ffxiv_automated_collectible_tracker.store import set_store_file
+import ffxiv_automated_collectible_tracker.store as store
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_ROSTER_SIZES = (10, 100, 1000)
+DEFAULT_HEADINGS_PER_SHEET = 20
+# High enough that the rate limits are never what is being measured.
+DEFAULT_BENCHMARK_REQUESTS_PER_SECOND = 10000.0
+BENCHMARK_SPREADSHEET_ID = "benchmark-spreadsheet"
+BENCHMARK_COLOURS = {
+    "ColourHeading": {"r": 255, "g": 178, "b": 253},
+    "ColourHasItem": {"r": 0, "g": 159, "b": 129},
+    "ColourNotItem": {"r": 226, "g": 1, "b": 52},
+    "ColourCharCol": {"r": 0, "g": 194, "b": 249},
+    "ColourAllItem": {"r": 0, "g": 141, "b": 249},
+}
+
+# The columns of the results table: the key of each result, its heading, and how to format its values.
+RESULT_COLUMNS = (
+    ("roster_size", "Roster", "{:>6}"),
+    ("scenario", "Scenario", "{:<22}"),
+    ("wall_time", "Wall (s)", "{:>8.2f}"),
+    ("lodestone_requests", "Lodestone", "{:>9}"),
+    ("sheets_requests", "Sheets", "{:>6}"),
+    ("throttled", "429s", "{:>5}"),
+    ("bytes_in", "KiB in", "{:>7.0f}"),
+    ("bytes_out", "KiB out", "{:>8.0f}"),
+    ("peak_memory", "Peak (MiB)", "{:>10.1f}"),
+)
+
+
+def get_benchmark_config(roster: SyntheticRoster, headings_per_sheet: int = DEFAULT_HEADINGS_PER_SHEET) -> dict:
+    """Build a sheets config with a sheet of mounts, and a sheet of achievements, from the roster's items.
+
+    :param roster: The SyntheticRoster being served.
+    :param headings_per_sheet: The number of items to give each sheet a heading for.
+    :return: The configuration dictionary for the Spreadsheets.
+    """
+    def get_headings(item_names: [str], item_type: str) -> [dict]:
+        return [
+            {"DisplayName": item_name, "ItemName": item_name, "ItemType": item_type}
+            for item_name in item_names[:headings_per_sheet]
+        ]
+
+    return {
+        "Colours": BENCHMARK_COLOURS,
+        "HeadingsRow": 1,
+        "NamesColumn": "A",
+        "Spreadsheets": [{
+            "spreadsheetId": BENCHMARK_SPREADSHEET_ID,
+            "sheets": [
+                {"title": "Mounts", "Values": get_headings(roster.mount_names, MOUNT)},
+                {"title": "Achievements", "Values": get_headings(roster.achievement_names, ACHIEVEMENT)},
+            ],
+        }],
+    }
+
+
+def start_stand_in(roster_args: dict, server_args: dict) -> (subprocess.Popen, str):
+    """Start a stand-in server in a subprocess, on any free port.
+
+    :param roster_args: The options for the roster, as keyword arguments of SyntheticRoster.
+    :param server_args: The options for the server, as keyword arguments of StandInServer.
+    :return: A tuple of the subprocess, and the base URL of the server.
+    """
+    command = [
+        sys.executable,
+        "-m",
+        "ffxiv_automated_collectible_tracker.standin",
+        "--port",
+        "0",
+        "--roster-size",
+        str(roster_args["size"]),
+    ]
+    for name, value in {**roster_args, **server_args}.items():
+        if name != "size":
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.wait()
+        raise click.ClickException(f"The stand-in server exited with code {process.returncode}.")
+    return process, base_url
+
+
+def request_json(url: str, method: str = "GET") -> dict:
+    """
+    :param url: A URL of the stand-in server's control endpoints.
+    :param method: The HTTP method.
+    :return: The JSON response.
+    """
+    with urllib.request.urlopen(urllib.request.Request(url, method=method)) as response:
+        return json.load(response)
+
+
+def measure(base_url: str, run, trace_memory: bool = True) -> dict:
+    """Run a scenario, and measure it.
+
+    :param base_url: The base URL of the stand-in server.
+    :param run: A function that takes no arguments, and runs the scenario.
+    :param trace_memory: Boolean. Measure the peak memory allocated by python, which slows the scenario down.
+    :return: A dictionary of the measurements.
+    """
+    request_json(base_url + RESET_PATH, "POST")
+    run_metrics.reset()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    run()
+    wall_time = time.perf_counter() - started
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    stats = request_json(base_url + STATS_PATH)
+
+    def total(key: str, path_prefix: str = "") -> int:
+        return sum(
+            endpoint_stats[key] for endpoint, endpoint_stats in stats.items()
+            if endpoint.split()[1].startswith(path_prefix)
+        )
+
+    return {
+        "wall_time": wall_time,
+        "lodestone_requests": total("requests", "/lodestone"),
+        "sheets_requests": total("requests", "/v4"),
+        "throttled": total("throttled"),
+        "bytes_in": total("bytes_in") / 1024,
+        "bytes_out": total("bytes_out") / 1024,
+        "peak_memory": peak_memory,
+        "endpoints": stats,
+        "metrics": run_metrics.to_dict(),
+    }
+
+
+def benchmark_roster(
+    roster_args: dict,
+    server_args: dict,
+    lodestone_options: dict,
+    sheets_requests_per_second: float,
+    max_concurrent_characters: int,
+    trace_memory: bool,
+) -> [dict]:
+    """Run every scenario for one roster, each against the same stand-in server, with fresh caches.
+
+    :param roster_args: The options for the roster, as keyword arguments of SyntheticRoster.
+    :param server_args: The options for the server, as keyword arguments of StandInServer.
+    :param lodestone_options: The keyword arguments for the LodestoneClient.
+    :param sheets_requests_per_second: The most Sheets API calls to make per second.
+    :param max_concurrent_characters: The most characters to be fetching from the Lodestone at once.
+    :param trace_memory: Boolean. Measure the peak memory allocated by python.
+    :return: A list of the results of each scenario.
+    """
+    roster = SyntheticRoster(**roster_args)
+    characters_list = roster.characters_list
+    sheets_config = get_benchmark_config(roster)
+    process, base_url = start_stand_in(roster_args, server_args)
+    lodestoneapi.set_lodestone_url(base_url)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            lodestoneapi.set_cache_dir(work_dir)
+            set_journal_dir(work_dir)
+            set_store_file(str(Path(work_dir) / "collections.sqlite3"))
+
+            def fill_sheet_data():
+                gsheets = GSheets(None, requests_per_second=sheets_requests_per_second, api_endpoint=base_url + "/")
+                try:
+                    run_with_lodestone_client(
+                        lodestone_options,
+                        update_spreadsheets,
+                        None,
+                        # The config is filled in with sheet IDs as it is used.
+                        copy.deepcopy(sheets_config),
+                        characters_list,
+                        max_concurrent_characters,
+                        gsheets=gsheets,
+                    )
+                finally:
+                    gsheets.close()
+
+            def get_fc_members():
+                members = run_with_lodestone_client(
+                    lodestone_options, lodestoneapi.get_fc_members_formatted_with_world, roster.world, roster.fc_name
+                )
+                if len(members) != len(characters_list):
+                    raise click.ClickException(f"Found {len(members)} of {len(characters_list)} FC members.")
+
+            scenarios = (
+                ("fill-sheet-data (cold)", fill_sheet_data),
+                # Mount names are cached, achievements are stored, and the spreadsheet is already filled in.
+                ("fill-sheet-data (warm)", fill_sheet_data),
+                ("get-fc-members", get_fc_members),
+            )
+            for scenario, run in scenarios:
+                click.echo(f"Running '{scenario}' for {len(characters_list)} characters...", err=True)
+                result = {"roster_size": len(characters_list), "scenario": scenario}
+                result.update(measure(base_url, run, trace_memory))
+                results.append(result)
+            store.collection_store.close()
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+def format_results_table(results: [dict]) -> str:
+    """
+    :param results: The results of every scenario.
+    :return: The results, as a plain text table.
+    """
+    headings = []
+    for _, heading, value_format in RESULT_COLUMNS:
+        width = int("".join(character for character in value_format.split(".")[0] if character.isdigit()))
+        headings.append(heading.ljust(width) if "<" in value_format else heading.rjust(width))
+    lines = ["  ".join(headings)]
+    for result in results:
+        lines.append("  ".join(
+            "-".rjust(len(heading)) if result[key] is None else value_format.format(result[key])
+            for (key, _, value_format), heading in zip(RESULT_COLUMNS, headings)
+        ))
+    return "\n".join(lines)
+
+
+@click.command()
+@click.option(
+    "--roster-size",
+    "roster_sizes",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=DEFAULT_ROSTER_SIZES,
+    help="The number of characters in a roster. Can be given more than once.",
+)
+@click.option("--mounts-per-character", type=click.IntRange(min=0), default=DEFAULT_MOUNTS_PER_CHARACTER)
+@click.option("--achievements-per-character", type=click.IntRange(min=0), default=DEFAULT_ACHIEVEMENTS_PER_CHARACTER)
+@click.option(
+    "--latency",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    help="Seconds the stand-in server waits before answering each request.",
+)
+@click.option(
+    "--throttle-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    help="The fraction of requests the stand-in server answers with 429 Too Many Requests.",
+)
+@click.option("--retry-after", type=click.FloatRange(min=0), default=DEFAULT_RETRY_AFTER)
+@click.option("--page-padding", type=click.IntRange(min=0), default=DEFAULT_PAGE_PADDING)
+@click.option("--max-concurrent-characters", type=click.IntRange(min=1), default=5)
+@click.option("--parse-workers", type=click.IntRange(min=0), default=0)
+@click.option(
+    "--requests-per-second",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_BENCHMARK_REQUESTS_PER_SECOND,
+    help="The most requests to make to each of the stand-in services per second.",
+)
+@click.option("--trace-memory/--no-trace-memory", default=True, help="Measure peak memory, at some cost to speed.")
+@click.option("--results-file", type=click.File("w"), default=None, help="Also write the results to a JSON file.")
+@click.option("--log-level", type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR"]), default="WARNING")
+def main(
+    roster_sizes,
+    mounts_per_character,
+    achievements_per_character,
+    latency,
+    throttle_rate,
+    retry_after,
+    page_padding,
+    max_concurrent_characters,
+    parse_workers,
+    requests_per_second,
+    trace_memory,
+    results_file,
+    log_level,
+):
+    """Benchmark fill-sheet-data and get-fc-members against a stand-in Lodestone and Google Sheets API."""
+    logging.basicConfig(level=log_level, format='%(message)s', datefmt='%H:%M')
+    server_args = {
+        "latency": latency,
+        "throttle_rate": throttle_rate,
+        "retry_after": retry_after,
+        "page_padding": page_padding,
+    }
+    lodestone_options = {"requests_per_second": requests_per_second, "parse_workers": parse_workers}
+    results = []
+    for roster_size in roster_sizes:
+        roster_args = {
+            "size": roster_size,
+            "mounts_per_character": mounts_per_character,
+            "achievements_per_character": achievements_per_character,
+        }
+        results.extend(benchmark_roster(
+            roster_args,
+            server_args,
+            lodestone_options,
+            requests_per_second,
+            max_concurrent_characters,
+            trace_memory,
+        ))
+    click.echo(format_results_table(results))
+    if results_file is not None:
+        json.dump(results, results_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
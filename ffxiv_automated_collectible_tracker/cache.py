@@ -0,0 +1,107 @@
+"""Small on-disk caches for Lodestone data that rarely, if ever, changes between runs."""
+import json
+import logging
+import os
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CACHE_DIR = ".act_cache"
+# Bump this when the layout of a cache file changes. Cache files with a different version are discarded on load.
+CACHE_VERSION = 1
+
+# Re-used Strings
+VERSION = "version"
+ENTRIES = "entries"
+
+
+class JsonCache:
+    """A versioned key/value store, kept in memory and persisted to a single JSON file."""
+    def __init__(self, filepath: str, version: int = CACHE_VERSION):
+        """
+        :param filepath: The path to the JSON file backing this cache.
+        :param version: The layout version of the cache file.
+        """
+        self.filepath = Path(filepath)
+        self.version = version
+        self.entries = {}
+        self.loaded = False
+        self.dirty = False
+
+    def load(self) -> None:
+        """Read the cache file, if there is one, discarding it if it is unreadable or from another version."""
+        self.loaded = True
+        if not self.filepath.exists():
+            logger.debug(f"No cache file at '{self.filepath}'.")
+            return
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as cache_file:
+                cache_data = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read cache file '{self.filepath}': {e}")
+            return
+        if cache_data.get(VERSION) != self.version:
+            logger.info(f"Discarding cache file '{self.filepath}' from version {cache_data.get(VERSION)}.")
+            return
+        self.entries = cache_data.get(ENTRIES, {})
+        logger.debug(f"Loaded {len(self.entries)} entries from '{self.filepath}'.")
+
+    def save(self) -> None:
+        """Write the cache to disk, if anything has changed since it was loaded."""
+        if not self.dirty:
+            return
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and swap it in, so an interrupted run never leaves a truncated cache behind.
+        tmp_filepath = self.filepath.with_name(self.filepath.name + ".tmp")
+        with open(tmp_filepath, "w", encoding="utf-8") as cache_file:
+            json.dump({VERSION: self.version, ENTRIES: self.entries}, cache_file)
+        os.replace(tmp_filepath, self.filepath)
+        self.dirty = False
+        logger.debug(f"Saved {len(self.entries)} entries to '{self.filepath}'.")
+
+    def get(self, key: str, default=None):
+        """Get a cached value.
+
+        :param key: The cache key.
+        :param default: The value to return if the key is not cached.
+        :return: The cached value, or the default.
+        """
+        if not self.loaded:
+            self.load()
+        return self.entries.get(key, default)
+
+    def set(self, key: str, value) -> None:
+        """Cache a value. It will be written to disk on the next save().
+
+        :param key: The cache key.
+        :param value: A JSON serialisable value.
+        :return: None
+        """
+        if not self.loaded:
+            self.load()
+        if self.entries.get(key) != value:
+            self.entries[key] = value
+            self.dirty = True
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the cache, if it is present.
+
+        :param key: The cache key.
+        :return: None
+        """
+        if not self.loaded:
+            self.load()
+        if key in self.entries:
+            del self.entries[key]
+            self.dirty = True
+
+    def clear(self) -> None:
+        """Remove every value from the cache, without reading the cache file.
+
+        :return: None
+        """
+        self.loaded = True
+        self.entries = {}
+        self.dirty = True
@@ -3,25 +3,113 @@ import click
 import logging
 import yaml
 
-from ffxiv_automated_collectible_tracker.ffxiv_gsheet_updater import update_spreadsheets
-from ffxiv_automated_collectible_tracker.lodestone import get_fc_members_formatted_with_world
+from ffxiv_automated_collectible_tracker.cache import DEFAULT_CACHE_DIR
+from ffxiv_automated_collectible_tracker.ffxiv_gsheet_updater import (
+    DEFAULT_MIN_CYCLE_INTERVAL,
+    DEFAULT_WATCH_REFRESH_TTL,
+    update_spreadsheets,
+    watch_spreadsheets,
+)
+from ffxiv_automated_collectible_tracker.gsheets import (
+    DEFAULT_BATCH_MAX_BYTES,
+    DEFAULT_BATCH_MAX_REQUESTS,
+    set_request_dump_dir,
+)
+from ffxiv_automated_collectible_tracker.journal import set_journal_dir
+from ffxiv_automated_collectible_tracker.lodestone import (
+    DEFAULT_REQUESTS_PER_SECOND,
+    LodestoneClient,
+    get_fc_members_formatted_with_world,
+    set_cache_dir,
+)
+from ffxiv_automated_collectible_tracker.metrics import run_metrics, set_report_file, write_report
+from ffxiv_automated_collectible_tracker.profiling import CPROFILE, PROFILE_FORMATS, start_profile, stop_profile
+from ffxiv_automated_collectible_tracker.scheduler import (
+    DEFAULT_MAX_REFRESH_TTL,
+    DEFAULT_REFRESH_BACKOFF,
+    DEFAULT_REFRESH_TTL,
+)
+from ffxiv_automated_collectible_tracker.store import DEFAULT_STORE_FILE, set_store_file
+import ffxiv_automated_collectible_tracker.store as store
+
+
+def run_with_lodestone_client(lodestone_options: dict, coroutine_function, *args, **kwargs):
+    """Run a coroutine function to completion, passing it a LodestoneClient that is shared for the whole run.
+
+    :param lodestone_options: The keyword arguments for the LodestoneClient.
+    :param coroutine_function: An async function that takes a LodestoneClient as its first argument.
+    :param args: The remaining arguments for the function.
+    :param kwargs: The keyword arguments for the function.
+    :return: The result of the function.
+    """
+    async def run():
+        async with LodestoneClient(**lodestone_options) as lodestone_client:
+            return await coroutine_function(lodestone_client, *args, **kwargs)
+
+    loop = asyncio.get_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        # Reported even for a run that failed, since the requests and retries leading up to it are the useful part.
+        click.echo(run_metrics.format_summary(), err=True)
+        write_report()
 
 
 @click.group()
-def cli():
-    pass
+@click.option("--cache-dir", type=click.Path(file_okay=False), default=DEFAULT_CACHE_DIR)
+@click.option("--store-file", type=click.Path(dir_okay=False), default=DEFAULT_STORE_FILE)
+@click.option(
+    "--parse-workers",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Parse Lodestone pages in this many worker processes. 0 parses them in the main process.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the run's metrics to this file: a Prometheus textfile if it ends in .prom or .txt, otherwise JSON.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Profile the whole run, and write the profile to this file.",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice(PROFILE_FORMATS),
+    default=CPROFILE,
+    help="cprofile for snakeviz, or timeline for speedscope, showing when each asyncio task was running and waiting.",
+)
+@click.option(
+    "--dump-requests-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Write the body of every update sent to Google Sheets to a JSON file in this directory, for debugging.",
+)
+@click.pass_context
+def cli(ctx, cache_dir, store_file, parse_workers, metrics_file, profile, profile_format, dump_requests_dir):
+    if profile is not None:
+        start_profile(profile, profile_format)
+        # The group's context is closed after the subcommand has finished, even if it failed.
+        ctx.call_on_close(stop_profile)
+    set_cache_dir(cache_dir)
+    set_report_file(metrics_file)
+    set_request_dump_dir(dump_requests_dir)
+    set_journal_dir(cache_dir)
+    set_store_file(store_file)
+    ctx.obj = {"parse_workers": parse_workers}
 
 
 @cli.command()
 @click.argument("world", type=str)
 @click.argument("fc-name", type=str)
 @click.option("--characters-file", type=click.File("w"), default="characters.yaml")
-def get_fc_members_list(world, fc_name, characters_file):
+@click.pass_obj
+def get_fc_members_list(lodestone_options, world, fc_name, characters_file):
     """Create the yaml file of FC members."""
-    loop = asyncio.get_event_loop()
-    members = loop.run_until_complete(
-        get_fc_members_formatted_with_world(world, fc_name)
-    )
+    members = run_with_lodestone_client(lodestone_options, get_fc_members_formatted_with_world, world, fc_name)
     yaml.safe_dump(members, characters_file)
 
 
@@ -29,16 +117,149 @@ def get_fc_members_list(world, fc_name, characters_file):
 @click.option("--credentials-file", type=click.Path(exists=True), default=".credentials.json")
 @click.option("--sheet-config-file", type=click.File("r"), default="config.yaml")
 @click.option("--characters-file", type=click.File("r"), default="characters.yaml")
-def fill_sheet_data(credentials_file, sheet_config_file, characters_file):
+@click.option("--max-concurrent-characters", type=click.IntRange(min=1), default=5)
+@click.option("--batch-max-requests", type=click.IntRange(min=1), default=DEFAULT_BATCH_MAX_REQUESTS)
+@click.option("--batch-max-bytes", type=click.IntRange(min=1), default=DEFAULT_BATCH_MAX_BYTES)
+@click.option("--reset-spreadsheets", is_flag=True, help="Rebuild every spreadsheet from scratch.")
+@click.option("--offline", is_flag=True, help="Fill in the sheets from the collection store, without the Lodestone.")
+@click.option("--resume", is_flag=True, help="Skip the work already done by an unfinished run with the same inputs.")
+@click.option(
+    "--refresh-ttl",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_REFRESH_TTL,
+    help="Hours before a character is fetched again. 0 fetches every character.",
+)
+@click.option("--max-refresh-ttl", type=click.FloatRange(min=0), default=DEFAULT_MAX_REFRESH_TTL)
+@click.option("--refresh-backoff", type=click.FloatRange(min=1), default=DEFAULT_REFRESH_BACKOFF)
+@click.option(
+    "--requests-per-second",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_REQUESTS_PER_SECOND,
+    help="The most requests to make to the Lodestone per second, on average.",
+)
+@click.pass_obj
+def fill_sheet_data(
+    lodestone_options,
+    credentials_file,
+    sheet_config_file,
+    characters_file,
+    max_concurrent_characters,
+    batch_max_requests,
+    batch_max_bytes,
+    reset_spreadsheets,
+    offline,
+    resume,
+    refresh_ttl,
+    max_refresh_ttl,
+    refresh_backoff,
+    requests_per_second,
+):
     """Fill in the character data on the Google Sheets."""
     sheets_config = yaml.safe_load(sheet_config_file)
     characters = yaml.safe_load(characters_file)
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(
-        update_spreadsheets(credentials_file, sheets_config, characters)
+    run_with_lodestone_client(
+        {**lodestone_options, "requests_per_second": requests_per_second},
+        update_spreadsheets,
+        credentials_file,
+        sheets_config,
+        characters,
+        max_concurrent_characters,
+        batch_max_requests,
+        batch_max_bytes,
+        reset_spreadsheets,
+        offline,
+        refresh_ttl,
+        max_refresh_ttl,
+        refresh_backoff,
+        resume=resume,
     )
 
 
+@cli.command()
+@click.option("--credentials-file", type=click.Path(exists=True), default=".credentials.json")
+@click.option("--sheet-config-file", type=click.File("r"), default="config.yaml")
+@click.option("--characters-file", type=click.File("r"), default="characters.yaml")
+@click.option("--max-concurrent-characters", type=click.IntRange(min=1), default=5)
+@click.option("--batch-max-requests", type=click.IntRange(min=1), default=DEFAULT_BATCH_MAX_REQUESTS)
+@click.option("--batch-max-bytes", type=click.IntRange(min=1), default=DEFAULT_BATCH_MAX_BYTES)
+@click.option(
+    "--refresh-ttl",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_WATCH_REFRESH_TTL,
+    help="Hours before a character is fetched again.",
+)
+@click.option("--max-refresh-ttl", type=click.FloatRange(min=0), default=DEFAULT_MAX_REFRESH_TTL)
+@click.option("--refresh-backoff", type=click.FloatRange(min=1), default=DEFAULT_REFRESH_BACKOFF)
+@click.option(
+    "--min-cycle-interval",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_MIN_CYCLE_INTERVAL,
+    help="The fewest minutes between refresh cycles.",
+)
+@click.option(
+    "--requests-per-second",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_REQUESTS_PER_SECOND,
+    help="The most requests to make to the Lodestone per second, on average.",
+)
+@click.pass_obj
+def watch(
+    lodestone_options,
+    credentials_file,
+    sheet_config_file,
+    characters_file,
+    max_concurrent_characters,
+    batch_max_requests,
+    batch_max_bytes,
+    refresh_ttl,
+    max_refresh_ttl,
+    refresh_backoff,
+    min_cycle_interval,
+    requests_per_second,
+):
+    """Keep the Google Sheets up to date, refreshing characters as they fall due, until stopped."""
+    sheets_config = yaml.safe_load(sheet_config_file)
+    characters = yaml.safe_load(characters_file)
+    try:
+        run_with_lodestone_client(
+            {**lodestone_options, "requests_per_second": requests_per_second},
+            watch_spreadsheets,
+            credentials_file,
+            sheets_config,
+            characters,
+            max_concurrent_characters,
+            batch_max_requests,
+            batch_max_bytes,
+            refresh_ttl,
+            max_refresh_ttl,
+            refresh_backoff,
+            min_cycle_interval,
+        )
+    except KeyboardInterrupt:
+        click.echo("Stopped.")
+
+
+@cli.command()
+@click.argument("since", type=click.DateTime())
+@click.option("--characters-file", type=click.File("r"), default=None, help="Defaults to every stored character.")
+def changes_since(since, characters_file):
+    """List the collectibles each character has gained or lost since a date, from the collection store."""
+    if characters_file is None:
+        characters = store.collection_store.get_characters()
+    else:
+        characters = yaml.safe_load(characters_file)
+    for char_and_world in characters:
+        changes = store.collection_store.get_changes(char_and_world, since.timestamp())
+        if not changes:
+            continue
+        click.echo(char_and_world)
+        for collection_key, (gained, lost) in changes.items():
+            if gained:
+                click.echo(f"  {collection_key} gained: {', '.join(gained)}")
+            if lost:
+                click.echo(f"  {collection_key} lost: {', '.join(lost)}")
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(message)s', datefmt='%H:%M')
     cli()
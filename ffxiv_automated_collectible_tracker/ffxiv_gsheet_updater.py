@@ -1,14 +1,71 @@
+import asyncio
 import logging
+import time
 from xlsxwriter.utility import xl_cell_to_rowcol
 
 
+import ffxiv_automated_collectible_tracker.journal as journal
 import ffxiv_automated_collectible_tracker.lodestone as lodestoneapi
-from ffxiv_automated_collectible_tracker.gsheets import BatchUpdate, GSheets, DEFAULT_SHEET_NAME
+import ffxiv_automated_collectible_tracker.metrics as metrics
+import ffxiv_automated_collectible_tracker.store as store
+from ffxiv_automated_collectible_tracker.scheduler import (
+    DEFAULT_MAX_REFRESH_TTL,
+    DEFAULT_REFRESH_BACKOFF,
+    DEFAULT_REFRESH_TTL,
+    RefreshScheduler,
+)
+from ffxiv_automated_collectible_tracker.gsheets import (
+    BatchUpdate,
+    GSheets,
+    SpreadsheetSnapshot,
+    get_cnd_fmt_rule_column_formula,
+    get_cond_fmt_rule_text_eq,
+    rule_matches,
+    DEFAULT_BATCH_MAX_BYTES,
+    DEFAULT_BATCH_MAX_REQUESTS,
+    DEFAULT_SHEET_NAME,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+# Item types, as used in the "ItemType" of a heading.
+MOUNT = "Mount"
+ACHIEVEMENT = "Achievement"
+# Hours. The daemon needs a TTL, or it would fetch every character again as soon as it had finished.
+DEFAULT_WATCH_REFRESH_TTL = 6.0
+# Minutes.
+DEFAULT_MIN_CYCLE_INTERVAL = 5.0
+# The key of the character details that holds the collection of each item type.
+COLLECTION_KEYS = {MOUNT: "Mounts", ACHIEVEMENT: "Achievements"}
+
+
+def get_fetch_plan(sheets_config: dict) -> dict:
+    """Work out which items, of which item types, are referenced by the headings of every spreadsheet.
+    Collections that no heading refers to do not need to be fetched from the Lodestone. Item types that cannot be
+    fetched yet are left out, and their headings are left blank.
+
+    :param sheets_config: The configuration dictionary for the Spreadsheets.
+    :return: A dictionary of each referenced item type to the set of item names referenced for it.
+    """
+    fetch_plan = {}
+    unsupported_item_types = set()
+    for spreadsheet_config in sheets_config["Spreadsheets"]:
+        for sheet_config in spreadsheet_config["sheets"]:
+            for heading in sheet_config["Values"]:
+                if "ItemType" not in heading or "ItemName" not in heading:
+                    continue
+                if heading["ItemType"] not in COLLECTION_KEYS:
+                    unsupported_item_types.add(heading["ItemType"])
+                    continue
+                fetch_plan.setdefault(heading["ItemType"], set()).add(heading["ItemName"])
+    for item_type in sorted(unsupported_item_types):
+        logger.warning(f"Item type '{item_type}' is not supported yet. Its headings will be left blank.")
+    logger.info(f"Fetch plan: {', '.join(f'{len(names)} {item_type}' for item_type, names in fetch_plan.items())}.")
+    return fetch_plan
+
+
 def get_colours(sheets_config):
     """Prepare colour dictionaries for Google Spreadsheets using the details from the sheet config.
 
@@ -59,7 +116,91 @@ def get_colours(sheets_config):
     return colourheading, colourcharcol, colourhasitem, colournotitem, colourallitem
 
 
-def prepare_spreadsheet(
+def get_heading_cells(headings: list, existing_heading_count: int, colourheading: dict) -> list:
+    """Build the cells of the headings row, from the column after the character names.
+
+    :param headings: The list of headings for a sheet/tab.
+    :param existing_heading_count: The number of headings already on the sheet/tab. Any beyond the configured headings
+        are blanked out.
+    :param colourheading: Colour dict for the heading row.
+    :return: A list of cell objects.
+    """
+    new_headings = [heading for heading in headings]
+    if existing_heading_count > len(headings):
+        new_headings += [""] * (existing_heading_count - len(headings))
+    cols = []
+    for heading in new_headings:
+        if heading == "":
+            cell_data = {"userEnteredValue": {"stringValue": ""}}
+        else:
+            heading_display_name = heading["DisplayName"]
+            heading_item_type = heading["ItemType"]
+            heading_item_name = heading["ItemName"]
+
+            cell_data = {
+                "userEnteredValue": {"stringValue": heading_display_name},
+                "note": heading_item_type + ":" + heading_item_name,
+                "userEnteredFormat": {
+                    "borders": {
+                        "top": {"style": "SOLID"},
+                        "right": {"style": "SOLID"},
+                        "bottom": {"style": "DOUBLE"},
+                        "left": {"style": "SOLID"}
+                    },
+                    "textFormat": {"bold": True},
+                }
+            }
+            if colourheading:
+                cell_data["userEnteredFormat"]["backgroundColorStyle"] = colourheading
+        cols.append(cell_data)
+    return cols
+
+
+def heading_row_matches(existing_heading: list, headings: list) -> bool:
+    """Check whether an existing headings row holds exactly the configured headings, going by their notes.
+
+    :param existing_heading: The existing cells of the headings row, from the column after the character names.
+    :param headings: The list of headings for a sheet/tab.
+    :return: Boolean. The row has every configured heading, in order, and nothing else.
+    """
+    existing_notes = [cell.get("note", "") for cell in existing_heading]
+    configured_notes = [heading["ItemType"] + ":" + heading["ItemName"] for heading in headings]
+    return bool(headings) and existing_notes == configured_notes
+
+
+def get_conditional_format_rules(
+    sheet_id: int,
+    name_col_index: int,
+    colourhasitem: dict,
+    colournotitem: dict,
+    colourallitem: dict,
+) -> list:
+    """Build the conditional formatting rules for a sheet/tab, in the order they are added.
+    Each rule is added ahead of the others, so on the sheet they end up in the reverse order.
+
+    :param sheet_id: The ID of the sheet/tab.
+    :param name_col_index: The index of the character names column.
+    :param colourhasitem: Colour dict for having an item.
+    :param colournotitem: Colour dict for not having an item.
+    :param colourallitem: Colour dict for having a full row.
+    :return: A list of conditional formatting rules.
+    """
+    rules = []
+    if colourhasitem:
+        rules.append(get_cond_fmt_rule_text_eq(sheet_id, "Y", colourhasitem))
+    if colournotitem:
+        rules.append(get_cond_fmt_rule_text_eq(sheet_id, "N", colournotitem))
+    if colourallitem:
+        rules.append(get_cnd_fmt_rule_column_formula(
+            sheet_id,
+            name_col_index,
+            '=AND(COUNTIF(C1:1,"N")=0,COUNTIF(C1:1,"Y")>1)',
+            colourallitem
+        ))
+    return rules
+
+
+async def prepare_spreadsheet(
     gsheets: GSheets,
     spreadsheet_id: str,
     spreadsheet_config: dict,
@@ -73,6 +214,7 @@ def prepare_spreadsheet(
 ):
     """Reset the specified Spreadsheet to a default state.
     Then set up the sheets, headings, and formatting for collectible tracking.
+    See reconcile_spreadsheet() for a way to do this without clearing the Spreadsheet.
 
     :param gsheets: The gsheets connection object.
     :param spreadsheet_id: The Google Spreadsheet ID.
@@ -86,7 +228,7 @@ def prepare_spreadsheet(
     :param results: The list of total API responses.
     :return: None
     """
-    result = gsheets.reset_spreadsheet(spreadsheet_id)
+    result = await gsheets.reset_spreadsheet(spreadsheet_id)
     results.append(result)
     # Create and setup sheets with headings and formatting.
     logger.info("Creating and setting up sheets.")
@@ -94,84 +236,207 @@ def prepare_spreadsheet(
     for sheet_config in spreadsheet_config["sheets"]:
         sheet_name = sheet_config["title"]
         headings = sheet_config["Values"]
-        sheet_obj = gsheets.add_sheet(spreadsheet_id, sheet_name)
+        sheet_obj = await gsheets.add_sheet(spreadsheet_id, sheet_name)
         sheet_id = sheet_obj["properties"]["sheetId"]
         sheet_config["sheetId"] = sheet_id
 
         # Headings
         logger.info(f"Adding headings to Sheet '{sheet_name}'.")
-        existing_heading_vals = []
         existing_heading = []
-        new_headings = [heading for heading in headings]
         if "rowData" in sheet_obj["data"][0]:
             existing_heading = sheet_obj["data"][0]["rowData"][title_row_index]["values"][name_col_index + 1:]
-            for index, cell in enumerate(existing_heading_vals[-1::-1]):
-                if "effectiveValue" in cell:
-                    break
-                existing_heading_vals.pop()
-        for cell in existing_heading:
-            cell_value = ""
-            if "effectiveValue" in cell:
-                cell_value = cell["effectiveValue"]["stringValue"]
-            existing_heading_vals.append(cell_value)
-        if len(existing_heading_vals) > len(headings):
-            new_headings += [""] * (len(existing_heading_vals) - len(headings))
-        cols = []
-        for heading in new_headings:
-            if heading == "":
-                cell_data = {"userEnteredValue": {"stringValue": ""}}
-            else:
-                heading_display_name = heading["DisplayName"]
-                heading_item_type = heading["ItemType"]
-                heading_item_name = heading["ItemName"]
-
-                cell_data = {
-                    "userEnteredValue": {"stringValue": heading_display_name},
-                    "note": heading_item_type + ":" + heading_item_name,
-                    "userEnteredFormat": {
-                        "borders": {
-                            "top": {"style": "SOLID"},
-                            "right": {"style": "SOLID"},
-                            "bottom": {"style": "DOUBLE"},
-                            "left": {"style": "SOLID"}
-                        },
-                        "textFormat": {"bold": True},
-                    }
-                }
-                if colourheading:
-                    cell_data["userEnteredFormat"]["backgroundColorStyle"] = colourheading
-            cols.append(cell_data)
+        cols = get_heading_cells(headings, len(existing_heading), colourheading)
 
         batchupdate.add_row(sheet_id, title_row_index, name_col_index + 1, cols)
 
         logger.info(f"Adding formatting to Sheet '{sheet_name}'.")
         # Formatting
         batchupdate.freeze_row_col(sheet_id, title_row_index, name_col_index)
-        if colourhasitem:
-            batchupdate.add_cond_fmt_rule_text_eq(sheet_id, "Y", colourhasitem)
-        if colournotitem:
-            batchupdate.add_cond_fmt_rule_text_eq(sheet_id, "N", colournotitem)
-        if colourallitem:
-            batchupdate.add_cnd_fmt_rule_column_formula(
-                sheet_id,
-                name_col_index,
-                '=AND(COUNTIF(C1:1,"N")=0,COUNTIF(C1:1,"Y")>1)',
-                colourallitem
-            )
-    result = batchupdate.execute()
+        for rule in get_conditional_format_rules(sheet_id, name_col_index, colourhasitem, colournotitem, colourallitem):
+            batchupdate.add_cond_fmt_rule(rule)
+    result = await batchupdate.execute()
     results.append(result)
     logger.info("Completing Spreadsheet Reset...")
 
-    spreadsheet_simple = gsheets.get_sheet_list(spreadsheet_id)
+    spreadsheet_simple = await gsheets.get_sheet_list(spreadsheet_id)
     if DEFAULT_SHEET_NAME in spreadsheet_simple:
-        result = gsheets.delete_sheet(spreadsheet_id, DEFAULT_SHEET_NAME)
+        result = await gsheets.delete_sheet(spreadsheet_id, DEFAULT_SHEET_NAME)
         results.append(result)
 
 
+async def reconcile_spreadsheet(
+    gsheets: GSheets,
+    spreadsheet_id: str,
+    spreadsheet_config: dict,
+    title_row_index: int,
+    name_col_index: int,
+    colourhasitem: dict,
+    colournotitem: dict,
+    colourallitem: dict,
+    results: list,
+):
+    """Bring the sheets, frozen rows and columns, and conditional formatting of the specified Spreadsheet in line with
+    its config, only sending the changes that are needed, and keeping the existing cells.
+    The headings are left to be written along with the character rows.
+
+    :param gsheets: The gsheets connection object.
+    :param spreadsheet_id: The Google Spreadsheet ID.
+    :param spreadsheet_config: The configuration dictionary for the Spreadsheet.
+    :param title_row_index: The index of the headings\title row.
+    :param name_col_index: The index of the character names column.
+    :param colourhasitem: Colour dict for having an item.
+    :param colournotitem: Colour dict for not having an item.
+    :param colourallitem: Colour dict for having a full row.
+    :param results: The list of total API responses.
+    :return: None
+    """
+    layout = await gsheets.get_spreadsheet_layout(spreadsheet_id)
+    existing_sheets = sorted(layout.get("sheets", []), key=lambda sheet: sheet["properties"].get("index", 0))
+    configured_names = [sheet_config["title"] for sheet_config in spreadsheet_config["sheets"]]
+    sheets_by_name = {sheet["properties"]["title"]: sheet for sheet in existing_sheets}
+    unconfigured_sheets = {
+        index: sheet
+        for index, sheet in enumerate(existing_sheets)
+        if sheet["properties"]["title"] not in configured_names
+    }
+    sheet_order = [sheet["properties"]["title"] for sheet in existing_sheets]
+    next_sheet_id = max([sheet["properties"]["sheetId"] for sheet in existing_sheets], default=0) + 1
+    heading_snapshot = None
+    if unconfigured_sheets and any(sheet_name not in sheets_by_name for sheet_name in configured_names):
+        heading_snapshot = await gsheets.get_spreadsheet_snapshot(
+            spreadsheet_id,
+            [sheet["properties"]["title"] for sheet in unconfigured_sheets.values()],
+            row_index=title_row_index,
+        )
+
+    logger.info(f"Reconciling sheets of Spreadsheet '{spreadsheet_id}'.")
+    batchupdate = gsheets.create_new_batchupdate(spreadsheet_id)
+    for index, sheet_config in enumerate(spreadsheet_config["sheets"]):
+        sheet_name = sheet_config["title"]
+        sheet = sheets_by_name.get(sheet_name)
+        if sheet is None and heading_snapshot is not None:
+            # An unknown sheet with exactly the configured headings is the configured sheet under an old name.
+            # Re-using it rather than deleting it keeps its cells. Any other unknown sheet is deleted below.
+            candidate_indexes = sorted(unconfigured_sheets, key=lambda sheet_index: sheet_index != index)
+            for sheet_index in candidate_indexes:
+                existing_heading = heading_snapshot.get_row(
+                    unconfigured_sheets[sheet_index]["properties"]["title"], title_row_index, name_col_index + 1
+                )
+                if heading_row_matches(existing_heading, sheet_config["Values"]):
+                    sheet = unconfigured_sheets.pop(sheet_index)
+                    break
+        if sheet is not None and sheet["properties"]["title"] != sheet_name:
+            old_sheet_name = sheet["properties"]["title"]
+            logger.info(f"Renaming Sheet '{old_sheet_name}' to '{sheet_name}'.")
+            batchupdate.rename_sheet(sheet["properties"]["sheetId"], sheet_name)
+            sheet_order[sheet_order.index(old_sheet_name)] = sheet_name
+        if sheet is None:
+            logger.info(f"Adding Sheet '{sheet_name}'.")
+            sheet = {"properties": {"sheetId": next_sheet_id, "title": sheet_name}}
+            next_sheet_id += 1
+            batchupdate.add_new_sheet(sheet["properties"]["sheetId"], sheet_name)
+            sheet_order.append(sheet_name)
+        sheet_id = sheet["properties"]["sheetId"]
+        sheet_config["sheetId"] = sheet_id
+
+        grid_properties = sheet["properties"].get("gridProperties", {})
+        frozen_rows = grid_properties.get("frozenRowCount", 0)
+        frozen_cols = grid_properties.get("frozenColumnCount", 0)
+        if frozen_rows != title_row_index + 1 or frozen_cols != name_col_index + 1:
+            batchupdate.freeze_row_col(sheet_id, title_row_index, name_col_index)
+
+        rules = get_conditional_format_rules(sheet_id, name_col_index, colourhasitem, colournotitem, colourallitem)
+        existing_rules = sheet.get("conditionalFormats", [])
+        rules_match = len(existing_rules) == len(rules) and all(
+            rule_matches(existing_rule, rule) for existing_rule, rule in zip(existing_rules, rules[::-1])
+        )
+        if not rules_match:
+            logger.info(f"Replacing conditional formatting of Sheet '{sheet_name}'.")
+            for rule_index in reversed(range(len(existing_rules))):
+                batchupdate.delete_cond_fmt_rule(sheet_id, rule_index)
+            for rule in rules:
+                batchupdate.add_cond_fmt_rule(rule)
+
+    # Sheets are only deleted after any new sheets are added, so the Spreadsheet is never left without a sheet.
+    for sheet in unconfigured_sheets.values():
+        logger.info(f"Deleting Sheet '{sheet['properties']['title']}'.")
+        batchupdate.delete_sheet(sheet["properties"]["sheetId"])
+        sheet_order.remove(sheet["properties"]["title"])
+
+    sheet_ids = {sheet_config["title"]: sheet_config["sheetId"] for sheet_config in spreadsheet_config["sheets"]}
+    for index, sheet_name in enumerate(configured_names):
+        if sheet_order.index(sheet_name) != index:
+            batchupdate.move_sheet(sheet_ids[sheet_name], index)
+            sheet_order.remove(sheet_name)
+            sheet_order.insert(index, sheet_name)
+
+    result = await batchupdate.execute()
+    if result is not None:
+        results.append(result)
+
+
+def update_heading_row(
+    batchupdate: BatchUpdate,
+    sheet_id: int,
+    sheet_name: str,
+    snapshot: SpreadsheetSnapshot,
+    headings: list,
+    title_row_index: int,
+    name_col_index: int,
+    colourheading: dict,
+):
+    """Add instructions for any changes to the headings row of a single sheet to the provided BatchUpdate object.
+
+    :param batchupdate: A BatchUpdate object to append instructions to.
+    :param sheet_id: The ID of the current sheet/tab.
+    :param sheet_name: The human readable name of the current sheet/tab.
+    :param snapshot: The existing cells of the Spreadsheet.
+    :param headings: The list of headings for this sheet/tab.
+    :param title_row_index: The index of the headings\title row.
+    :param name_col_index: The index of the character names column.
+    :param colourheading: Colour dict for the heading row.
+    :return: None
+    """
+    existing_heading = snapshot.get_row(sheet_name, title_row_index, name_col_index + 1)
+    cols = get_heading_cells(headings, len(existing_heading), colourheading)
+    existing_cells = [
+        snapshot.get_cell(sheet_name, title_row_index, name_col_index + 1 + offset) for offset in range(len(cols))
+    ]
+    batchupdate.add_row_changes(sheet_id, title_row_index, name_col_index + 1, cols, existing_cells)
+
+
+def clear_removed_rows(
+    batchupdate: BatchUpdate,
+    sheet_id: int,
+    sheet_name: str,
+    snapshot: SpreadsheetSnapshot,
+    title_row_index: int,
+    name_col_index: int,
+    characters_count: int,
+):
+    """Add instructions to blank out any rows below the last character, left over from a longer characters list.
+
+    :param batchupdate: A BatchUpdate object to append instructions to.
+    :param sheet_id: The ID of the current sheet/tab.
+    :param sheet_name: The human readable name of the current sheet/tab.
+    :param snapshot: The existing cells of the Spreadsheet.
+    :param title_row_index: The index of the headings\title row.
+    :param name_col_index: The index of the character names column.
+    :param characters_count: The number of characters in the characters list.
+    :return: None
+    """
+    for row_index in range(title_row_index + characters_count + 1, snapshot.get_last_row_index(sheet_name) + 1):
+        existing_row_cells = snapshot.get_row(sheet_name, row_index, name_col_index)
+        if existing_row_cells:
+            cols = [{"userEnteredValue": {"stringValue": ""}} for _ in existing_row_cells]
+            batchupdate.add_row(sheet_id, row_index, name_col_index, cols)
+
+
 def update_char_row_in_sheet(
     batchupdate: BatchUpdate,
     sheet_id: int,
-    sheet_obj: dict,
+    sheet_name: str,
+    snapshot: SpreadsheetSnapshot,
     headings: list,
     title_row_index: int,
     name_col_index: int,
@@ -183,7 +448,8 @@ def update_char_row_in_sheet(
 
     :param batchupdate: A BatchUpdate object to append instructions to.
     :param sheet_id: The ID of the current sheet/tab.
-    :param sheet_obj: A dictionary with additional details of the current sheet/tab.
+    :param sheet_name: The human readable name of the current sheet/tab.
+    :param snapshot: The existing cells of the Spreadsheet.
     :param headings: The list of headings for this sheet/tab.
     :param title_row_index: The index of the headings\title row.
     :param name_col_index: The index of the character names column.
@@ -197,8 +463,8 @@ def update_char_row_in_sheet(
     first_name, second_name = fullname.split()
     char_and_world = "@".join([fullname, world])
     char_id = character_details["ID"]
-    character_mounts = character_details["Mounts"]
-    character_achievements = character_details["Achievements"]
+    character_mounts = character_details.get("Mounts")
+    character_achievements = character_details.get("Achievements")
     cols = []
 
     hyperlink = f"https://eu.finalfantasyxiv.com/lodestone/character/{char_id}/"
@@ -221,16 +487,7 @@ def update_char_row_in_sheet(
         cell_data["userEnteredFormat"]["backgroundColorStyle"] = colourcharcol
     cols.append(cell_data)
 
-    existing_row_cells = []
-    if "rowData" in sheet_obj["data"][0]:
-        if len(sheet_obj["data"][0]["rowData"]) > title_row_index + charnum:
-            if "values" in sheet_obj["data"][0]["rowData"][title_row_index + charnum]:
-                if len(sheet_obj["data"][0]["rowData"][title_row_index + charnum]["values"]) > name_col_index:
-                    existing_row_cells = sheet_obj["data"][0]["rowData"][title_row_index + charnum]["values"][name_col_index:]
-    for index, cell in enumerate(existing_row_cells[-1::-1]):
-        if "effectiveValue" in cell:
-            break
-        existing_row_cells.pop()
+    existing_row_cells = snapshot.get_row(sheet_name, title_row_index + charnum, name_col_index)
 
     values = [""] * len(headings)
     if len(existing_row_cells) > len(headings):
@@ -241,9 +498,9 @@ def update_char_row_in_sheet(
         heading_item_type = heading["ItemType"]
         heading_item_name = heading["ItemName"]
         list_to_use = None
-        if heading_item_type == "Mount":
+        if heading_item_type == MOUNT:
             list_to_use = character_mounts
-        elif heading_item_type == "Achievement":
+        elif heading_item_type == ACHIEVEMENT:
             list_to_use = character_achievements
 
         if list_to_use:
@@ -269,48 +526,168 @@ def update_char_row_in_sheet(
             cell_data = {"userEnteredValue": {"stringValue": ""}}
         cols.append(cell_data)
 
-    batchupdate.add_row(sheet_id, title_row_index + charnum, name_col_index, cols)
+    existing_cells = [
+        snapshot.get_cell(sheet_name, title_row_index + charnum, name_col_index + offset) for offset in range(len(cols))
+    ]
+    batchupdate.add_row_changes(sheet_id, title_row_index + charnum, name_col_index, cols, existing_cells)
+
+
+async def iter_characters_details(
+    lodestone_client: lodestoneapi.LodestoneClient,
+    characters_list: [str],
+    fetch_plan: dict,
+    max_concurrent_characters: int = 1,
+):
+    """Get the Lodestone details for every character, once each, however many spreadsheets they appear on.
+    Characters are fetched concurrently, and yielded in the order they complete. Every fetch is recorded in the
+    collection store.
+
+    :param lodestone_client: The LodestoneClient to make requests with.
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :param fetch_plan: The item types to fetch, as made by get_fetch_plan().
+    :param max_concurrent_characters: The most characters to be fetching from the Lodestone at once.
+    :return: An async generator of tuples of {name}@{world} and that character's lodestone details.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent_characters)
+
+    async def get_char_details(char_and_world: str) -> (str, dict):
+        async with semaphore:
+            logger.info(f"{char_and_world=}")
+            fullname, world = char_and_world.split("@")
+            with metrics.run_metrics.time_phase("fetch_character"):
+                character_details = await lodestoneapi.get_char_details(
+                    lodestone_client,
+                    fullname,
+                    world,
+                    achievements=ACHIEVEMENT in fetch_plan,
+                    mounts=MOUNT in fetch_plan,
+                )
+            # A character who is not on the Lodestone is recorded too, so their lookups back off like any other.
+            store.collection_store.record(char_and_world, character_details)
+            return char_and_world, character_details
+
+    unique_characters = list(dict.fromkeys(characters_list))
+    tasks = [asyncio.ensure_future(get_char_details(character)) for character in unique_characters]
+    try:
+        for next_completed in asyncio.as_completed(tasks):
+            yield await next_completed
+    finally:
+        # If a fetch failed, or the caller stopped early, the other fetches must not carry on with the shared client.
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def iter_stored_characters_details(characters_list: [str]):
+    """Get the details for every character from the collection store, as last fetched, without using the Lodestone.
+    Characters that have never been fetched are skipped.
+
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :return: An async generator of tuples of {name}@{world} and that character's stored details.
+    """
+    for char_and_world in dict.fromkeys(characters_list):
+        character_details = store.collection_store.get_details(char_and_world)
+        if character_details is None:
+            logger.warning(f"No stored details for '{char_and_world}'. Skipping.")
+            continue
+        yield char_and_world, character_details
+
+
+async def iter_refreshed_characters_details(
+    lodestone_client: lodestoneapi.LodestoneClient,
+    characters_list: [str],
+    fetch_plan: dict,
+    max_concurrent_characters: int,
+    refresh_scheduler: RefreshScheduler,
+    fetched_characters: set = frozenset(),
+):
+    """Get the details for every character, fetching only those that are due a refresh from the Lodestone, and
+    serving the rest from the collection store.
+    Stored characters are yielded first, since they are ready straight away.
+
+    :param lodestone_client: The LodestoneClient to make requests with.
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :param fetch_plan: The item types to fetch, as made by get_fetch_plan().
+    :param max_concurrent_characters: The most characters to be fetching from the Lodestone at once.
+    :param refresh_scheduler: The RefreshScheduler that decides which characters are due.
+    :param fetched_characters: Characters that have already been fetched in this run, and are not due again as long
+        as their details are in the collection store.
+    :return: An async generator of tuples of {name}@{world} and that character's details.
+    """
+    required_keys = [COLLECTION_KEYS[item_type] for item_type in fetch_plan]
+    stored_fetched_characters = set()
+    if fetched_characters:
+        stored_fetched_characters = set(refresh_scheduler.collection_store.get_refresh_states(fetched_characters))
+    due_characters = refresh_scheduler.get_due_characters(
+        [char_and_world for char_and_world in characters_list if char_and_world not in stored_fetched_characters],
+        required_keys,
+    )
+    due_characters_set = set(due_characters)
+    fresh_characters = [
+        char_and_world for char_and_world in characters_list if char_and_world not in due_characters_set
+    ]
+    metrics.run_metrics.record_cache("collection_store", hits=len(fresh_characters), misses=len(due_characters))
+    async for char_and_world, character_details in iter_stored_characters_details(fresh_characters):
+        yield char_and_world, character_details
+    fetched_characters_details = iter_characters_details(
+        lodestone_client, due_characters, fetch_plan, max_concurrent_characters
+    )
+    try:
+        async for char_and_world, character_details in fetched_characters_details:
+            yield char_and_world, character_details
+    finally:
+        await fetched_characters_details.aclose()
+
+
+def get_character_rows(characters_list: [str]) -> dict:
+    """Work out which rows each character is listed on, once for the whole run.
+
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :return: A dictionary of each character to the list of their row numbers, below the title row, counting from 1.
+    """
+    character_rows = {}
+    for charnum, char_and_world in enumerate(characters_list, start=1):
+        character_rows.setdefault(char_and_world, []).append(charnum)
+    return character_rows
 
 
-async def update_formatted_spreadsheet(
-    gsheets,
-    spreadsheet_id,
+def update_formatted_spreadsheet(
+    batchupdate,
     spreadsheet_config,
+    snapshot,
     title_row_index,
     name_col_index,
-    characters_list,
+    character_rows,
+    char_and_world,
+    character_details,
     colourcharcol,
-    results,
 ):
-    """Loop through sheets and characters to update a spreadsheet.
+    """Loop through sheets to add the updates for a character's rows in a spreadsheet to the spreadsheet's BatchUpdate.
 
-    :param gsheets: The gsheets connection object.
-    :param spreadsheet_id: The Google Spreadsheet ID.
+    :param batchupdate: The BatchUpdate object collecting every update for the Spreadsheet.
     :param spreadsheet_config: The configuration dictionary for the Spreadsheet.
+    :param snapshot: The existing cells of the Spreadsheet.
     :param title_row_index: The index of the headings\title row.
     :param name_col_index: The index of the character names column.
-    :param characters_list: A list of Final Fantasy XIV character names.
+    :param character_rows: The row numbers of each character, below the title row, as made by get_character_rows().
+    :param char_and_world: The name of the character to update, in the form {name}@{world}.
+    :param character_details: A dictionary of the character's lodestone details.
     :param colourcharcol: Colour dict for character column.
-    :param results: The list of total API responses.
     :return: None
     """
-    for charnum, char_and_world in enumerate(characters_list, start=1):
-        logger.info(f"{char_and_world=}")
-        fullname, world = char_and_world.split("@")
-        character_details = await lodestoneapi.get_char_details(fullname, world, achievements=True, mounts=True)
-
-        batchupdate = gsheets.create_new_batchupdate(spreadsheet_id)
+    for charnum in character_rows.get(char_and_world, ()):
         for sheet_config in spreadsheet_config["sheets"]:
             sheet_name = sheet_config["title"]
 
             headings = sheet_config["Values"]
             sheet_id = sheet_config["sheetId"]
-            sheet_obj = gsheets.get_sheet(spreadsheet_id, sheet_name)
 
             update_char_row_in_sheet(
                 batchupdate,
                 sheet_id,
-                sheet_obj,
+                sheet_name,
+                snapshot,
                 headings,
                 title_row_index,
                 name_col_index,
@@ -318,23 +695,52 @@ async def update_formatted_spreadsheet(
                 charnum,
                 character_details,
             )
-        result = batchupdate.execute()
-        results.append(result)
 
 
 async def update_spreadsheets(
+    lodestone_client: lodestoneapi.LodestoneClient,
     cred_filename: str,
     sheets_config: dict,
     characters_list: [str] = None,
+    max_concurrent_characters: int = 1,
+    batch_max_requests: int = DEFAULT_BATCH_MAX_REQUESTS,
+    batch_max_bytes: int = DEFAULT_BATCH_MAX_BYTES,
+    reset_spreadsheets: bool = False,
+    offline: bool = False,
+    refresh_ttl: float = DEFAULT_REFRESH_TTL,
+    max_refresh_ttl: float = DEFAULT_MAX_REFRESH_TTL,
+    refresh_backoff: float = DEFAULT_REFRESH_BACKOFF,
+    gsheets: GSheets = None,
+    push_each_character: bool = False,
+    resume: bool = False,
 ) -> list:
-    """
+    """Fetch the Lodestone details of every character, and write them into every configured spreadsheet as they arrive.
 
+    :param lodestone_client: The LodestoneClient to make requests with.
     :param cred_filename: The filepath to the file with the google sheets credentials.
-    :param sheets_config:
-    :param characters_list:
-    :return:
+    :param sheets_config: The configuration dictionary for the Spreadsheets.
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :param max_concurrent_characters: The most characters to be fetching from the Lodestone at once.
+    :param batch_max_requests: The most requests to send to Google Sheets in a single BatchUpdate POST.
+    :param batch_max_bytes: The most bytes of requests to send to Google Sheets in a single BatchUpdate POST.
+    :param reset_spreadsheets: Boolean. Rebuild every spreadsheet from scratch, rather than only changing what differs
+        from the config.
+    :param offline: Boolean. Fill in the spreadsheets from the collection store, without using the Lodestone.
+    :param refresh_ttl: How many hours a character's stored details stay fresh, while they are changing. Fresh
+        characters are served from the collection store instead of the Lodestone.
+    :param max_refresh_ttl: The most hours a character's stored details stay fresh.
+    :param refresh_backoff: What to multiply the TTL by for every fetch of a character in a row that found nothing new.
+    :param gsheets: A GSheets object to re-use. If not given, one is created from cred_filename for this call, and
+        closed at the end of it.
+    :param push_each_character: Boolean. Send each character's changes as soon as they are fetched, rather than
+        leaving the BatchUpdates to send themselves when full and at the end.
+    :param resume: Boolean. Skip the work done by an earlier run with the same config and characters that did not
+        finish, as recorded in its run journal.
+    :return: The list of total API responses.
     """
-    gsheets = GSheets(cred_filename)
+    own_gsheets = gsheets is None
+    if own_gsheets:
+        gsheets = GSheets(cred_filename, batch_max_requests, batch_max_bytes)
 
     name_col = sheets_config["NamesColumn"]
     title_row = str(sheets_config["HeadingsRow"])
@@ -342,34 +748,211 @@ async def update_spreadsheets(
 
     colourheading, colourcharcol, colourhasitem, colournotitem, colourallitem = get_colours(sheets_config)
 
+    character_rows = get_character_rows(characters_list)
     results = []
-    for spreadsheet_config in sheets_config["Spreadsheets"]:
-        spreadsheet_id = spreadsheet_config["spreadsheetId"]
-
-        logger.info(f"{spreadsheet_id=}")
-
-        prepare_spreadsheet(
-            gsheets,
-            spreadsheet_id,
-            spreadsheet_config,
-            title_row_index,
-            name_col_index,
-            colourheading,
-            colourhasitem,
-            colournotitem,
-            colourallitem,
-            results
-        )
-
-        await update_formatted_spreadsheet(
-            gsheets,
-            spreadsheet_id,
-            spreadsheet_config,
-            title_row_index,
-            name_col_index,
-            characters_list,
-            colourcharcol,
-            results,
+    snapshots = {}
+    batchupdates = {}
+    run_journal = journal.RunJournal(
+        journal.journal_filepath, journal.get_run_key(sheets_config, characters_list), resume
+    )
+
+    async def prepare_for_characters(spreadsheet_config: dict):
+        with metrics.run_metrics.time_phase("prepare_spreadsheet"):
+            spreadsheet_id = spreadsheet_config["spreadsheetId"]
+
+            logger.info(f"{spreadsheet_id=}")
+
+            # A resumed run must not reset a spreadsheet again, and lose the rows that were committed to it.
+            if reset_spreadsheets and not run_journal.is_prepared(spreadsheet_id):
+                await prepare_spreadsheet(
+                    gsheets,
+                    spreadsheet_id,
+                    spreadsheet_config,
+                    title_row_index,
+                    name_col_index,
+                    colourheading,
+                    colourhasitem,
+                    colournotitem,
+                    colourallitem,
+                    results
+                )
+            else:
+                await reconcile_spreadsheet(
+                    gsheets,
+                    spreadsheet_id,
+                    spreadsheet_config,
+                    title_row_index,
+                    name_col_index,
+                    colourhasitem,
+                    colournotitem,
+                    colourallitem,
+                    results
+                )
+            run_journal.mark_prepared(spreadsheet_id)
+            # Each sheet's existing cells are read once here, rather than once per character.
+            sheet_names = [sheet_config["title"] for sheet_config in spreadsheet_config["sheets"]]
+            snapshot = await gsheets.get_spreadsheet_snapshot(spreadsheet_id, sheet_names)
+            snapshots[spreadsheet_id] = snapshot
+            # Every row for this spreadsheet goes into one BatchUpdate, which sends itself whenever it fills its budget.
+            batchupdate = gsheets.create_new_batchupdate(spreadsheet_id)
+            batchupdates[spreadsheet_id] = batchupdate
+            for sheet_config in spreadsheet_config["sheets"]:
+                sheet_name = sheet_config["title"]
+                sheet_id = sheet_config["sheetId"]
+                headings = sheet_config["Values"]
+                update_heading_row(
+                    batchupdate,
+                    sheet_id,
+                    sheet_name,
+                    snapshot,
+                    headings,
+                    title_row_index,
+                    name_col_index,
+                    colourheading,
+                )
+                clear_removed_rows(
+                    batchupdate, sheet_id, sheet_name, snapshot, title_row_index, name_col_index, len(characters_list)
+                )
+
+    # The spreadsheets are prepared in parallel with each other, and with the first characters being fetched.
+    preparing_spreadsheets = asyncio.ensure_future(asyncio.gather(
+        *[prepare_for_characters(spreadsheet_config) for spreadsheet_config in sheets_config["Spreadsheets"]]
+    ))
+
+    characters_details = None
+    try:
+        # Every spreadsheet is rendered from the same details, so the Lodestone is only scraped once per character.
+        if offline:
+            characters_details = iter_stored_characters_details(characters_list)
+        else:
+            fetch_plan = get_fetch_plan(sheets_config)
+            refresh_scheduler = RefreshScheduler(
+                store.collection_store, refresh_ttl, max_refresh_ttl, refresh_backoff
+            )
+            characters_details = iter_refreshed_characters_details(
+                lodestone_client,
+                characters_list,
+                fetch_plan,
+                max_concurrent_characters,
+                refresh_scheduler,
+                run_journal.fetched,
+            )
+        async for char_and_world, character_details in characters_details:
+            run_journal.mark_fetched(char_and_world)
+            await preparing_spreadsheets
+            with metrics.run_metrics.time_phase("render_rows"):
+                for spreadsheet_config in sheets_config["Spreadsheets"]:
+                    spreadsheet_id = spreadsheet_config["spreadsheetId"]
+                    if run_journal.is_committed(spreadsheet_id, char_and_world):
+                        continue
+                    update_formatted_spreadsheet(
+                        batchupdates[spreadsheet_id],
+                        spreadsheet_config,
+                        snapshots[spreadsheet_id],
+                        title_row_index,
+                        name_col_index,
+                        character_rows,
+                        char_and_world,
+                        character_details,
+                        colourcharcol,
+                    )
+                    run_journal.add_pending(spreadsheet_id, char_and_world, batchupdates[spreadsheet_id].requests_added)
+            if push_each_character:
+                await asyncio.gather(*[batchupdate.execute() for batchupdate in batchupdates.values()])
+            for spreadsheet_id, batchupdate in batchupdates.items():
+                run_journal.mark_sent(spreadsheet_id, batchupdate.requests_sent)
+        await preparing_spreadsheets
+
+        with metrics.run_metrics.time_phase("send_updates"):
+            await asyncio.gather(*[batchupdate.execute() for batchupdate in batchupdates.values()])
+        for batchupdate in batchupdates.values():
+            results.extend(batchupdate.responses)
+        run_journal.finish()
+    except Exception:
+        # Stop any fetches still in flight, rather than leaving them to run on into a resumed run.
+        if characters_details is not None:
+            await characters_details.aclose()
+        # Send the rows of every character fetched before the failure, so that a resumed run does not redo them.
+        await asyncio.gather(preparing_spreadsheets, return_exceptions=True)
+        await asyncio.gather(
+            *[batchupdate.execute() for batchupdate in batchupdates.values()], return_exceptions=True
         )
+        for spreadsheet_id, batchupdate in batchupdates.items():
+            run_journal.mark_sent(spreadsheet_id, batchupdate.requests_sent)
+        raise
+    finally:
+        if own_gsheets:
+            gsheets.close()
 
     return results
+
+
+async def watch_spreadsheets(
+    lodestone_client: lodestoneapi.LodestoneClient,
+    cred_filename: str,
+    sheets_config: dict,
+    characters_list: [str],
+    max_concurrent_characters: int = 1,
+    batch_max_requests: int = DEFAULT_BATCH_MAX_REQUESTS,
+    batch_max_bytes: int = DEFAULT_BATCH_MAX_BYTES,
+    refresh_ttl: float = DEFAULT_WATCH_REFRESH_TTL,
+    max_refresh_ttl: float = DEFAULT_MAX_REFRESH_TTL,
+    refresh_backoff: float = DEFAULT_REFRESH_BACKOFF,
+    min_cycle_interval: float = DEFAULT_MIN_CYCLE_INTERVAL,
+) -> None:
+    """Keep every configured spreadsheet up to date, until stopped.
+    Each cycle fetches the characters that are due a refresh, and sends each character's changed cells as soon as
+    they arrive. Between cycles, this sleeps until the next character is due. One GSheets client, and the one
+    LodestoneClient, are kept for the whole time.
+
+    :param lodestone_client: The LodestoneClient to make requests with.
+    :param cred_filename: The filepath to the file with the google sheets credentials.
+    :param sheets_config: The configuration dictionary for the Spreadsheets.
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :param max_concurrent_characters: The most characters to be fetching from the Lodestone at once.
+    :param batch_max_requests: The most requests to send to Google Sheets in a single BatchUpdate POST.
+    :param batch_max_bytes: The most bytes of requests to send to Google Sheets in a single BatchUpdate POST.
+    :param refresh_ttl: How many hours a character's stored details stay fresh, while they are changing.
+    :param max_refresh_ttl: The most hours a character's stored details stay fresh.
+    :param refresh_backoff: What to multiply the TTL by for every fetch of a character in a row that found nothing new.
+    :param min_cycle_interval: The fewest minutes between the start of one cycle and the next.
+    :return: None
+    """
+    gsheets = GSheets(cred_filename, batch_max_requests, batch_max_bytes)
+    refresh_scheduler = RefreshScheduler(store.collection_store, refresh_ttl, max_refresh_ttl, refresh_backoff)
+    required_keys = [COLLECTION_KEYS[item_type] for item_type in get_fetch_plan(sheets_config)]
+    # The first cycle always runs, to bring the layout in line with the config and fill in stored characters.
+    next_due = 0.0
+    try:
+        while True:
+            cycle_started = time.time()
+            if next_due <= cycle_started:
+                try:
+                    await update_spreadsheets(
+                        lodestone_client,
+                        cred_filename,
+                        sheets_config,
+                        characters_list,
+                        max_concurrent_characters,
+                        batch_max_requests,
+                        batch_max_bytes,
+                        refresh_ttl=refresh_ttl,
+                        max_refresh_ttl=max_refresh_ttl,
+                        refresh_backoff=refresh_backoff,
+                        gsheets=gsheets,
+                        push_each_character=True,
+                    )
+                except Exception as e:
+                    # The daemon outlives Lodestone outages and Google quota errors. Whatever was not done is still
+                    # due next cycle.
+                    logger.exception(f"Refresh cycle failed: {e!r}")
+                    next_due = 0.0
+                else:
+                    next_due = refresh_scheduler.get_next_due(characters_list, required_keys)
+                lodestoneapi.save_caches()
+                metrics.write_report()
+            wake_at = max(next_due, cycle_started + min_cycle_interval * 60)
+            logger.info(f"Next refresh cycle in {(wake_at - time.time()) / 60:.1f} minutes.")
+            await asyncio.sleep(max(0.0, wake_at - time.time()))
+    finally:
+        gsheets.close()
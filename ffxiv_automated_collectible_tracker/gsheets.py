@@ -1,16 +1,44 @@
+import asyncio
+import collections
+import httplib2
+import itertools
 import json
 import logging
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from pathlib import Path
+from urllib.parse import urlsplit
 from xlsxwriter.utility import xl_cell_to_rowcol
 
+import ffxiv_automated_collectible_tracker.metrics as metrics
+from ffxiv_automated_collectible_tracker.ratelimit import (
+    RETRYABLE_STATUSES,
+    RetryPolicy,
+    get_rate_limiter,
+    parse_retry_after,
+)
+
 
 logger = logging.getLogger(__name__)
 
 
 DEFAULT_SHEET_NAME = "Sheet1"
+# Budgets for a single BatchUpdate POST. Google rejects payloads over 10MB, so stay well below that.
+DEFAULT_BATCH_MAX_REQUESTS = 1000
+DEFAULT_BATCH_MAX_BYTES = 2 * 1024 * 1024
+# The most Google Sheets API calls to have in flight at once.
+DEFAULT_SHEETS_WORKERS = 4
+# Google allows 60 requests per minute per user, for reads and writes each.
+SHEETS_API_HOST = "sheets.googleapis.com"
+DEFAULT_SHEETS_REQUESTS_PER_SECOND = 1.0
+DEFAULT_SHEETS_REQUESTS_BURST = 10
 
 # Re-used Strings
 REQUESTS = "requests"
@@ -18,10 +46,14 @@ REQUESTS = "requests"
 ADDSHEET = "addSheet"
 AUTORESIZE = "autoResizeDimensions"
 ADDCNDFMTRULE = "addConditionalFormatRule"
+DELETECNDFMTRULE = "deleteConditionalFormatRule"
 DELETESHEET = "deleteSheet"
 UPDATESHEETPROPERTIES = "updateSheetProperties"
 UPDATECELLS = "updateCells"
 REPEATCELL = "repeatCell"
+# Request types that do the same thing however many times they are sent, so a BatchUpdate made only of these can be
+# retried after a server error without knowing whether the first attempt was applied.
+IDEMPOTENT_REQUEST_TYPES = (AUTORESIZE, UPDATESHEETPROPERTIES, UPDATECELLS, REPEATCELL)
 # Common Keywords
 SHEETS = "sheets"
 SHEETID = "sheetId"
@@ -29,36 +61,323 @@ CELL = "cell"
 PROPERTIES = "properties"
 FIELDS = "fields"
 
+# Picks the spreadsheet ID out of the URI of an API call.
+SPREADSHEET_ID_REGEX = re.compile(r"/spreadsheets/(?P<spreadsheet_id>[^/:?]+)")
+
+# The parts of a cell that are compared to decide whether it needs to be written, and the only parts that are written.
+DIFF_CELL_FIELDS = ("userEnteredValue", "userEnteredFormat", "note")
+UPDATECELLS_FIELDS = ",".join(DIFF_CELL_FIELDS)
+# The API leaves out fields that are at their default value, such as a colour channel of 0, or an alpha of 1.
+DEFAULT_FIELD_VALUES = ("", 0, False)
+DEFAULT_NAMED_FIELD_VALUES = {"alpha": 1}
+FLOAT_TOLERANCE = 1e-4
+
+# The layout of each sheet, without any cells, for reconciling a spreadsheet with its config.
+LAYOUT_FIELDS = (
+    "sheets(properties(sheetId,title,index,gridProperties(frozenRowCount,frozenColumnCount)),conditionalFormats)"
+)
+
+# Only the parts of each sheet that the collectible tracker reads, to keep spreadsheet snapshots small.
+SNAPSHOT_FIELDS = (
+    "sheets(properties(sheetId,title),"
+    "data(startRow,startColumn,rowData(values(userEnteredValue,effectiveValue,userEnteredFormat,note))))"
+)
+
+
+request_dump_dir = None
+_request_dump_counter = itertools.count()
+
+
+def set_request_dump_dir(dump_dir: str) -> None:
+    """Write the body of every BatchUpdate POST to a JSON file in a directory, for debugging.
+
+    :param dump_dir: The directory to write the files to. None stops the bodies from being written.
+    :return: None
+    """
+    global request_dump_dir
+    request_dump_dir = None if dump_dir is None else Path(dump_dir)
+
+
+def summarise_requests(requests: list, request_sizes: list) -> str:
+    """Summarise BatchUpdate requests for the log, without serialising them again.
+
+    :param requests: The requests.
+    :param request_sizes: The number of bytes of each request, serialised.
+    :return: The number of requests and bytes of each request type, largest first.
+    """
+    type_counts = collections.Counter()
+    type_bytes = collections.Counter()
+    for request, request_bytes in zip(requests, request_sizes):
+        for request_type in request:
+            type_counts[request_type] += 1
+            type_bytes[request_type] += request_bytes
+    return ", ".join(
+        f"{request_type}: {type_counts[request_type]} ({request_bytes} bytes)"
+        for request_type, request_bytes in type_bytes.most_common()
+    )
+
+
+def _value_matches(existing, desired, field_name: str = None) -> bool:
+    """Check if a part of an existing cell already has every property of the desired value.
+    Properties of the existing cell that are not in the desired value are ignored, since the API fills in properties
+    such as border widths, and both the plain and "Style" versions of colours.
+
+    :param existing: A value from an existing cell, or None if it is missing.
+    :param desired: The desired value, or None if nothing is asked for.
+    :param field_name: The name of the field these values are for.
+    :return: Boolean. True if writing the desired value would not change anything that was asked for.
+    """
+    if desired is None:
+        return True
+    if isinstance(desired, dict):
+        if existing is None:
+            existing = {}
+        if not isinstance(existing, dict):
+            return False
+        return all(_value_matches(existing.get(key), value, key) for key, value in desired.items())
+    if existing is None:
+        if field_name in DEFAULT_NAMED_FIELD_VALUES:
+            return desired == DEFAULT_NAMED_FIELD_VALUES[field_name]
+        return desired in DEFAULT_FIELD_VALUES
+    if isinstance(desired, float) or isinstance(existing, float):
+        return isinstance(existing, (int, float)) and abs(existing - desired) < FLOAT_TOLERANCE
+    return existing == desired
+
+
+def cell_matches(existing_cell: dict, desired_cell: dict) -> bool:
+    """Check if an existing cell already looks like the desired cell.
+    Every field that is written is compared. A field left out of the desired cell would be cleared by writing it, so
+    the existing field must be empty, or at its default values, too.
+
+    :param existing_cell: A cell object from the API, or an empty dictionary for an empty cell.
+    :param desired_cell: A cell object, as it would be written.
+    :return: Boolean. True if the cell does not need to be written.
+    """
+    for field in DIFF_CELL_FIELDS:
+        if field in desired_cell:
+            if not _value_matches(existing_cell.get(field), desired_cell[field], field):
+                return False
+        # Compared the other way round, every property of the existing field must match a missing one.
+        elif not _value_matches(None, existing_cell.get(field), field):
+            return False
+    return True
+
+
+def rule_matches(existing_rule: dict, desired_rule: dict) -> bool:
+    """Check if an existing conditional formatting rule already does what the desired rule does.
+
+    :param existing_rule: A conditional formatting rule from the API.
+    :param desired_rule: A conditional formatting rule, as it would be added.
+    :return: Boolean. True if the rule does not need to be replaced.
+    """
+    return _value_matches(existing_rule, desired_rule)
+
+
+def get_changed_runs(existing_cells: list, desired_cells: list) -> list:
+    """Find the runs of adjacent cells that need to be written.
+
+    :param existing_cells: The existing cell objects.
+    :param desired_cells: The desired cell objects, lined up with the existing cells.
+    :return: A list of tuples of the offset of the first cell of a run, and the desired cells of that run.
+    """
+    runs = []
+    run_start = None
+    for offset, desired_cell in enumerate(desired_cells):
+        existing_cell = existing_cells[offset] if offset < len(existing_cells) else {}
+        changed = not cell_matches(existing_cell, desired_cell)
+        if changed and run_start is None:
+            run_start = offset
+        elif not changed and run_start is not None:
+            runs.append((run_start, desired_cells[run_start:offset]))
+            run_start = None
+    if run_start is not None:
+        runs.append((run_start, desired_cells[run_start:]))
+    return runs
+
+
+def get_cond_fmt_rule_text_eq(sheet_id: int, text: str, colour_object: dict) -> dict:
+    """Get a conditional formatting rule for setting the background and text colour to the specified colour,
+    when the cell contents are equal to the specified text.
+
+    :param sheet_id: The ID of the sheet/tab the rule applies to.
+    :param text: The value that the cell contents should match to trigger this formatting rule.
+    :param colour_object: A dictionary describing the colour to apply.
+    :return: A dictionary describing the conditional formatting rule.
+    """
+    return {
+        "ranges": [{"sheetId": sheet_id, "startRowIndex": 0, "startColumnIndex": 0}],
+        "booleanRule": {
+            "condition": {
+                "type": "TEXT_EQ",
+                "values": [{"userEnteredValue": text}]
+            },
+            "format": {
+                "backgroundColorStyle": colour_object,
+                "textFormat": {"foregroundColorStyle": colour_object}
+            }
+        }
+    }
+
+
+def get_cnd_fmt_rule_column_formula(sheet_id: int, col_index: int, formula: str, colour_object: dict) -> dict:
+    """Get a conditional formatting rule for setting the background colour of a column to the specified colour,
+    when the specified formula returns TRUE.
+
+    :param sheet_id: The ID of the sheet/tab the rule applies to.
+    :param col_index: The index of the column where the colour should be adjusted.
+    :param formula: The formula to use to decide when to change the column colour.
+    :param colour_object: A dictionary describing the colour to apply.
+    :return: A dictionary describing the conditional formatting rule.
+    """
+    return {
+        "ranges": [
+            {"sheetId": sheet_id, "startRowIndex": 0, "startColumnIndex": col_index, "endColumnIndex": col_index+1}
+        ],
+        "booleanRule": {
+            "condition": {
+                "type": "CUSTOM_FORMULA",
+                "values": [{"userEnteredValue": formula}]
+            },
+            "format": {
+                "backgroundColorStyle": colour_object,
+            }
+        }
+    }
+
 
 class BatchUpdate:
-    """This object allows for construction BatchUpdate JSON blocks in a very dynamic but readable manner."""
-    def __init__(self, spreadsheet_resource, spreadsheet_id) -> dict:
+    """This object allows for construction BatchUpdate JSON blocks in a very dynamic but readable manner.
+    Requests accumulate until execute() is called, or until they would take the update over its request count or byte
+    budget, at which point the requests so far are POSTed on their own in the background, in order.
+    """
+    def __init__(
+        self,
+        gsheets: "GSheets",
+        spreadsheet_id,
+        max_requests: int = DEFAULT_BATCH_MAX_REQUESTS,
+        max_bytes: int = DEFAULT_BATCH_MAX_BYTES,
+    ) -> dict:
         """
-        :param spreadsheet_resource: The spreadsheet_resource attribute of a GSheets object.
+        :param gsheets: The GSheets object to send the update with.
         :param spreadsheet_id: The ID of the Spreadsheet this update is intended for.
+        :param max_requests: The most requests to send in a single POST.
+        :param max_bytes: The most bytes of serialised requests to send in a single POST.
         """
-        self.spreadsheet_resource = spreadsheet_resource
+        self.gsheets = gsheets
         self.spreadsheet_id = spreadsheet_id
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
         self.body = {REQUESTS: []}
-
-    def execute(self):
-        """POST the BatchUpdate JSON to the GoogleSheets API."""
-        logger.info(json.dumps(self.body, indent=4))
-        batchupdate = self.spreadsheet_resource.batchUpdate(
+        self.body_bytes = 0
+        # The serialised size of each measured request in the body, for logging.
+        self.request_sizes = []
+        self.measured_requests = 0
+        self.responses = []
+        self.last_post = None
+        # Running totals, so callers can tell when the requests they added have been sent.
+        self.requests_added = 0
+        self.requests_sent = 0
+
+    async def execute(self):
+        """POST the BatchUpdate JSON to the GoogleSheets API, and wait for every earlier POST of this update to finish.
+
+        :return: The API response for the final POST, or None if there were no requests left to send.
+        """
+        self._check_budget()
+        if self.body[REQUESTS]:
+            self._post(self.body[REQUESTS])
+        if self.last_post is None:
+            return None
+        last_post = self.last_post
+        self.last_post = None
+        return await last_post
+
+    def _post(self, requests: list) -> None:
+        """Schedule a POST of some requests of this BatchUpdate, after any earlier POSTs, and forget them.
+
+        :param requests: The requests to send. These must be the oldest requests of this update.
+        :return: None
+        """
+        body = {REQUESTS: requests}
+        request_sizes = self.request_sizes[:len(requests)]
+        self.last_post = asyncio.ensure_future(self._send(body, request_sizes, self.last_post))
+        self.body[REQUESTS] = self.body[REQUESTS][len(requests):]
+        self.request_sizes = self.request_sizes[len(requests):]
+        self.body_bytes = 0
+        self.measured_requests = 0
+
+    async def _send(self, body: dict, request_sizes: list, previous_post: asyncio.Future = None) -> dict:
+        """POST a BatchUpdate body, once the previous POST of this update has finished.
+
+        :param body: The BatchUpdate JSON.
+        :param request_sizes: The serialised size of each request in the body.
+        :param previous_post: The future for the previous POST, if there was one.
+        :return: The API response.
+        """
+        if previous_post is not None:
+            await previous_post
+        logger.info(
+            f"Sending {len(body[REQUESTS])} requests of {sum(request_sizes)} bytes to Spreadsheet: "
+            f"'{self.spreadsheet_id}'. {summarise_requests(body[REQUESTS], request_sizes)}"
+        )
+        # A full body runs to megabytes of JSON, so it is only serialised when it will be written somewhere.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(body, indent=4))
+        if request_dump_dir is not None:
+            self._dump(body)
+        batchupdate = self.gsheets.spreadsheets_resource.batchUpdate(
             spreadsheetId=self.spreadsheet_id,
-            body=self.body
+            body=body
+        )
+        idempotent = all(
+            request_type in IDEMPOTENT_REQUEST_TYPES for request in body[REQUESTS] for request_type in request
         )
-        results = batchupdate.execute()
+        results = await self.gsheets.execute_request(batchupdate, idempotent=idempotent)
         logger.debug(results)
+        self.responses.append(results)
+        self.requests_sent += len(body[REQUESTS])
         return results
 
+    def _dump(self, body: dict) -> None:
+        """Write a BatchUpdate body to a new file in the request dump directory.
+
+        :param body: The BatchUpdate JSON.
+        :return: None
+        """
+        request_dump_dir.mkdir(parents=True, exist_ok=True)
+        dump_filename = f"{self.spreadsheet_id}-{int(time.time())}-{next(_request_dump_counter)}.json"
+        dump_filepath = request_dump_dir / dump_filename
+        with open(dump_filepath, "w", encoding="utf-8") as dump_file:
+            json.dump(body, dump_file, indent=4)
+        logger.info(f"Wrote BatchUpdate body to '{dump_filepath}'.")
+
+    def _check_budget(self) -> None:
+        """Measure the most recently added request, which the calling code has now finished filling in.
+        If it would take this update over budget, POST the requests before it.
+
+        :return: None
+        """
+        requests = self.body[REQUESTS]
+        if self.measured_requests == len(requests):
+            return
+        request_bytes = len(json.dumps(requests[-1]))
+        over_budget = len(requests) > self.max_requests or self.body_bytes + request_bytes > self.max_bytes
+        if over_budget and len(requests) > 1:
+            logger.info(f"Sending {len(requests) - 1} requests of {self.body_bytes} bytes, to stay within budget.")
+            self._post(requests[:-1])
+        self.body_bytes += request_bytes
+        self.request_sizes.append(request_bytes)
+        self.measured_requests = len(self.body[REQUESTS])
+
     def add_new_request(self, request_obj: dict) -> None:
         """Allow the appending of an existing request object.
 
         :param request_obj: A dictionary.
         :return: None
         """
+        self._check_budget()
         self.body[REQUESTS].append(request_obj)
+        self.requests_added += 1
 
     def create_new_request(self, request_type: str) -> dict:
         """Create a new request as part of this update, and return the dictionary for the calling code to provide
@@ -69,7 +388,7 @@ class BatchUpdate:
         """
         request_params = {}
         new_request = {request_type: request_params}
-        self.body[REQUESTS].append(new_request)
+        self.add_new_request(new_request)
         return request_params
 
     def freeze_row_col(self, sheet_id: int, row_index: int, col_index: int) -> None:
@@ -89,6 +408,27 @@ class BatchUpdate:
         }
         updateproperties_request[FIELDS] = "gridProperties.frozenRowCount,gridProperties.frozenColumnCount"
 
+    def add_cond_fmt_rule(self, rule: dict) -> None:
+        """Add a conditional formatting rule, ahead of any existing rules.
+
+        :param rule: A dictionary describing the conditional formatting rule, including the ranges it applies to.
+        :return: None
+        """
+        addcndfmt_request = self.create_new_request(ADDCNDFMTRULE)
+        addcndfmt_request["rule"] = rule
+        addcndfmt_request["index"] = 0
+
+    def delete_cond_fmt_rule(self, sheet_id: int, index: int) -> None:
+        """Delete a conditional formatting rule.
+
+        :param sheet_id: The ID of the sheet/tab of this Spreadsheet.
+        :param index: The index of the rule in the sheet's list of conditional formatting rules.
+        :return: None
+        """
+        deletecndfmt_request = self.create_new_request(DELETECNDFMTRULE)
+        deletecndfmt_request[SHEETID] = sheet_id
+        deletecndfmt_request["index"] = index
+
     def add_cond_fmt_rule_text_eq(self, sheet_id: int, text: str, colour_object: dict) -> None:
         """Add a conditional formatting rule for setting the background and text colour to the specified colour,
         when the cell contents are equal to the specified text.
@@ -98,21 +438,7 @@ class BatchUpdate:
         :param colour_object: A dictionary describing the colour to apply.
         :return: None
         """
-        addcndfmt_request = self.create_new_request(ADDCNDFMTRULE)
-        addcndfmt_request["rule"] = {
-            "ranges": [{"sheetId": sheet_id, "startRowIndex": 0, "startColumnIndex": 0}],
-            "booleanRule": {
-                "condition": {
-                    "type": "TEXT_EQ",
-                    "values": [{"userEnteredValue": text}]
-                },
-                "format": {
-                    "backgroundColorStyle": colour_object,
-                    "textFormat": {"foregroundColorStyle": colour_object}
-                }
-            }
-        }
-        addcndfmt_request["index"] = 0
+        self.add_cond_fmt_rule(get_cond_fmt_rule_text_eq(sheet_id, text, colour_object))
 
     def add_cnd_fmt_rule_column_formula(self, sheet_id: int, col_index: int, formula: str, colour_object: dict) -> None:
         """Add a conditional formatting rule for setting the background colour of a column to the specified colour,
@@ -124,22 +450,52 @@ class BatchUpdate:
         :param colour_object: A dictionary describing the colour to apply.
         :return: None
         """
-        addcndfmt_request = self.create_new_request(ADDCNDFMTRULE)
-        addcndfmt_request["rule"] = {
-            "ranges": [
-                {"sheetId": sheet_id, "startRowIndex": 0, "startColumnIndex": col_index, "endColumnIndex": col_index+1}
-            ],
-            "booleanRule": {
-                "condition": {
-                    "type": "CUSTOM_FORMULA",
-                    "values": [{"userEnteredValue": formula}]
-                },
-                "format": {
-                    "backgroundColorStyle": colour_object,
-                }
-            }
+        self.add_cond_fmt_rule(get_cnd_fmt_rule_column_formula(sheet_id, col_index, formula, colour_object))
+
+    def add_new_sheet(self, sheet_id: int, sheet_name: str) -> None:
+        """Add a sheet/tab, with a chosen ID so later requests in this update can refer to it.
+
+        :param sheet_id: An ID for the sheet/tab that is not used by any other sheet of this Spreadsheet.
+        :param sheet_name: The human readable name for the new sheet/tab.
+        :return: None
+        """
+        addsheet_request = self.create_new_request(ADDSHEET)
+        addsheet_request[PROPERTIES] = {
+            SHEETID: sheet_id,
+            "title": sheet_name,
+            "hidden": False
         }
-        addcndfmt_request["index"] = 0
+
+    def rename_sheet(self, sheet_id: int, sheet_name: str) -> None:
+        """Change the human readable name of a sheet/tab.
+
+        :param sheet_id: The ID of the sheet/tab of this Spreadsheet.
+        :param sheet_name: The new human readable name for the sheet/tab.
+        :return: None
+        """
+        updateproperties_request = self.create_new_request(UPDATESHEETPROPERTIES)
+        updateproperties_request[PROPERTIES] = {SHEETID: sheet_id, "title": sheet_name}
+        updateproperties_request[FIELDS] = "title"
+
+    def move_sheet(self, sheet_id: int, index: int) -> None:
+        """Move a sheet/tab to a new position among the sheets/tabs.
+
+        :param sheet_id: The ID of the sheet/tab of this Spreadsheet.
+        :param index: The new position of the sheet/tab.
+        :return: None
+        """
+        updateproperties_request = self.create_new_request(UPDATESHEETPROPERTIES)
+        updateproperties_request[PROPERTIES] = {SHEETID: sheet_id, "index": index}
+        updateproperties_request[FIELDS] = "index"
+
+    def delete_sheet(self, sheet_id: int) -> None:
+        """Delete a sheet/tab.
+
+        :param sheet_id: The ID of the sheet/tab of this Spreadsheet.
+        :return: None
+        """
+        deletesheet_request = self.create_new_request(DELETESHEET)
+        deletesheet_request[SHEETID] = sheet_id
 
     def add_row(self, sheet_id: int, row_index: int, col_index: int, cell_list: list) -> None:
         """Add a row to the sheet.
@@ -151,14 +507,35 @@ class BatchUpdate:
         :return: None
         """
         updatecells_request = self.create_new_request(UPDATECELLS)
-        # The FIELDS property basically determines what properties of the cells will be updated by this request.
-        # If "*" is provided, and no value is provided for a field for the cell, then it will be set to default.
-        # updatecells_request[FIELDS] = "userEnteredValue.stringValue,formattedValue,note"
-        updatecells_request[FIELDS] = "*"
+        # The FIELDS property determines what properties of the cells will be updated by this request. Any of them
+        # without a value in a cell is cleared. Only the fields that cell_matches() compares are written, so a cell
+        # that matches is never one that writing would change.
+        updatecells_request[FIELDS] = UPDATECELLS_FIELDS
         updatecells_request["start"] = {"sheetId": sheet_id, "rowIndex": row_index, "columnIndex": col_index}
         # The cell_list, a list of cells, will be the values of a single row.
         updatecells_request["rows"] = [{"values": cell_list}]
 
+    def add_row_changes(
+        self,
+        sheet_id: int,
+        row_index: int,
+        col_index: int,
+        cell_list: list,
+        existing_cell_list: list,
+    ) -> None:
+        """Add a row to the sheet, only writing the cells that differ from the existing cells.
+        Adjacent changed cells are written together.
+
+        :param sheet_id: The ID of the sheet/tab of this Spreadsheet.
+        :param row_index: The index to add the row at.
+        :param col_index: The column the row should start at.
+        :param cell_list: A list of cell objects.
+        :param existing_cell_list: A list of the existing cell objects, starting at the same column.
+        :return: None
+        """
+        for offset, changed_cells in get_changed_runs(existing_cell_list, cell_list):
+            self.add_row(sheet_id, row_index, col_index + offset, changed_cells)
+
     def add_col(self, sheet_id: int, row_index: int, col_index: int, cell_list: list) -> None:
         """Add a column to the sheet.
 
@@ -169,10 +546,10 @@ class BatchUpdate:
         :return: None
         """
         updatecells_request = self.create_new_request(UPDATECELLS)
-        # The FIELDS property basically determines what properties of the cells will be updated by this request.
-        # If "*" is provided, and no value is provided for a field for the cell, then it will be set to default.
-        # updatecells_request[FIELDS] = "userEnteredValue.stringValue,formattedValue,note"
-        updatecells_request[FIELDS] = "*"
+        # The FIELDS property determines what properties of the cells will be updated by this request. Any of them
+        # without a value in a cell is cleared. Only the fields that cell_matches() compares are written, so a cell
+        # that matches is never one that writing would change.
+        updatecells_request[FIELDS] = UPDATECELLS_FIELDS
         updatecells_request["start"] = {"sheetId": sheet_id, "rowIndex": row_index, "columnIndex": col_index}
         # The cell_list, a list of cells, needs to be separated into a cell per row.
         rows = []
@@ -181,19 +558,182 @@ class BatchUpdate:
         updatecells_request["rows"] = rows
 
 
+class SpreadsheetSnapshot:
+    """The existing cells of the sheets/tabs of a Spreadsheet, indexed by sheet name, row and column."""
+    def __init__(self, spreadsheet: dict):
+        """
+        :param spreadsheet: A spreadsheet object, including grid data, from the GoogleSheets API.
+        """
+        self.sheet_properties = {}
+        self.cells = {}
+        self.row_lengths = {}
+        for sheet in spreadsheet.get(SHEETS, []):
+            sheet_name = sheet[PROPERTIES]["title"]
+            self.sheet_properties[sheet_name] = sheet[PROPERTIES]
+            for grid_data in sheet.get("data", []):
+                start_row = grid_data.get("startRow", 0)
+                start_col = grid_data.get("startColumn", 0)
+                for row_offset, row_data in enumerate(grid_data.get("rowData", [])):
+                    row_index = start_row + row_offset
+                    values = row_data.get("values", [])
+                    for col_offset, cell in enumerate(values):
+                        self.cells[(sheet_name, row_index, start_col + col_offset)] = cell
+                    if values:
+                        row_length = max(self.row_lengths.get((sheet_name, row_index), 0), start_col + len(values))
+                        self.row_lengths[(sheet_name, row_index)] = row_length
+
+    def get_cell(self, sheet_name: str, row_index: int, col_index: int) -> dict:
+        """Get an existing cell.
+
+        :param sheet_name: The human readable name of a sheet.
+        :param row_index: The index of the row.
+        :param col_index: The index of the column.
+        :return: The cell object, or an empty dictionary if the cell is empty.
+        """
+        return self.cells.get((sheet_name, row_index, col_index), {})
+
+    def get_last_row_index(self, sheet_name: str) -> int:
+        """Get the index of the last row of a sheet with any cells.
+
+        :param sheet_name: The human readable name of a sheet.
+        :return: The index of the row, or -1 if the sheet has no cells.
+        """
+        row_indexes = [row_index for row_sheet_name, row_index in self.row_lengths if row_sheet_name == sheet_name]
+        return max(row_indexes, default=-1)
+
+    def get_row(self, sheet_name: str, row_index: int, col_index: int = 0) -> list:
+        """Get the existing cells of a row, up to the last cell with a value.
+
+        :param sheet_name: The human readable name of a sheet.
+        :param row_index: The index of the row.
+        :param col_index: The column the row should start at.
+        :return: A list of cell objects.
+        """
+        row_cells = [
+            self.get_cell(sheet_name, row_index, cell_col_index)
+            for cell_col_index in range(col_index, self.row_lengths.get((sheet_name, row_index), 0))
+        ]
+        while row_cells and "effectiveValue" not in row_cells[-1]:
+            row_cells.pop()
+        return row_cells
+
+
 class GSheets:
     """I could have used an exisitng API module, but this was more fun."""
-    def __init__(self, service_account_filename: str):
+    def __init__(
+        self,
+        service_account_filename: str,
+        batch_max_requests: int = DEFAULT_BATCH_MAX_REQUESTS,
+        batch_max_bytes: int = DEFAULT_BATCH_MAX_BYTES,
+        max_workers: int = DEFAULT_SHEETS_WORKERS,
+        requests_per_second: float = DEFAULT_SHEETS_REQUESTS_PER_SECOND,
+        retry_policy: RetryPolicy = None,
+        api_endpoint: str = None,
+    ):
         """
-        :param service_account_filename: The path to the file containing your google API auth credentials.
+        :param service_account_filename: The path to the file containing your google API auth credentials. If None,
+            no credentials are sent, which only a stand-in server, such as the one in standin.py, will accept.
+        :param batch_max_requests: The most requests to send in a single BatchUpdate POST.
+        :param batch_max_bytes: The most bytes of serialised requests to send in a single BatchUpdate POST.
+        :param max_workers: The most API calls to have in flight at once.
+        :param requests_per_second: The most API calls to make per second, on average.
+        :param retry_policy: How to retry failed API calls. Uses the RetryPolicy defaults if not given.
+        :param api_endpoint: The URL to send API calls to, instead of the Google Sheets API, such as
+            "http://127.0.0.1:8080/".
         """
-        logging.debug("Reading credentials for Google Sheets API from '%s'" % service_account_filename)
-        creds = service_account.Credentials.from_service_account_file(service_account_filename)
-        service_resource = build('sheets', 'v4', credentials=creds)
+        self.batch_max_requests = batch_max_requests
+        self.batch_max_bytes = batch_max_bytes
+        if service_account_filename is None:
+            self.credentials = AnonymousCredentials()
+        else:
+            logging.debug("Reading credentials for Google Sheets API from '%s'" % service_account_filename)
+            self.credentials = service_account.Credentials.from_service_account_file(service_account_filename)
+        client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+        service_resource = build('sheets', 'v4', credentials=self.credentials, client_options=client_options)
         self.spreadsheets_resource = service_resource.spreadsheets()
         self.spreadsheets_values_resource = self.spreadsheets_resource.values()
+        # The google API client is blocking, so its calls are made on worker threads to keep the event loop free.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gsheets")
+        self.thread_local = threading.local()
+        api_host = urlsplit(api_endpoint).netloc if api_endpoint else SHEETS_API_HOST
+        self.rate_limiter = get_rate_limiter(api_host, requests_per_second, DEFAULT_SHEETS_REQUESTS_BURST)
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def _get_thread_http(self) -> AuthorizedHttp:
+        """Get the authorised http connection for the current worker thread. httplib2 is not thread safe, so each
+        worker thread gets its own.
+
+        :return: An authorised http connection.
+        """
+        if not hasattr(self.thread_local, "http"):
+            self.thread_local.http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self.thread_local.http
+
+    async def execute_request(self, http_request, idempotent: bool = True):
+        """Execute a google API request on a worker thread, without blocking the event loop.
+        The request waits its turn within the Sheets API rate limit, and is retried if it fails in a way that is worth
+        retrying.
 
-    def get_spreadsheet(self, spreadsheet_id: str, include_grid_data=True) -> dict:
+        :param http_request: A request built from one of the API resources.
+        :param idempotent: Boolean. The request can safely be sent again after a server error.
+        :return: The API response.
+        """
+        loop = asyncio.get_running_loop()
+        # Such as "spreadsheets.batchUpdate".
+        endpoint = (http_request.methodId or http_request.method).replace("sheets.", "", 1)
+        spreadsheet_id_match = SPREADSHEET_ID_REGEX.search(http_request.uri)
+        if spreadsheet_id_match:
+            metrics.run_metrics.record_sheets_call(spreadsheet_id_match.group("spreadsheet_id"), endpoint)
+        bytes_sent = len(http_request.body or "")
+        response_sizes = []
+        postproc = http_request.postproc
+
+        def measure_postproc(resp, content):
+            # The body of the response is only seen here, before the API client parses it.
+            response_sizes.append(len(content))
+            return postproc(resp, content)
+
+        http_request.postproc = measure_postproc
+
+        async def execute_once():
+            started = time.monotonic()
+            status = None
+            bytes_received = 0
+            try:
+                result = await loop.run_in_executor(
+                    self.executor, lambda: http_request.execute(http=self._get_thread_http())
+                )
+                status = 200
+                bytes_received = response_sizes.pop() if response_sizes else 0
+                return result
+            except HttpError as e:
+                status = e.resp.status
+                bytes_received = len(e.content or b"")
+                raise e
+            finally:
+                metrics.run_metrics.record_request(
+                    metrics.SHEETS, endpoint, time.monotonic() - started, status, bytes_sent, bytes_received
+                )
+
+        def get_retry_info(exception: Exception) -> (bool, float):
+            if not isinstance(exception, HttpError):
+                return False, None
+            status = exception.resp.status
+            # "Too Many Requests" is never applied, but a server error may have been, part way through.
+            retryable = status == 429 or (idempotent and status in RETRYABLE_STATUSES)
+            return retryable, parse_retry_after(exception.resp.get("retry-after"))
+
+        def on_retry(exception: Exception) -> None:
+            metrics.run_metrics.record_retry(metrics.SHEETS, endpoint)
+
+        description = f"{http_request.method} {http_request.uri.split('?')[0]}"
+        return await self.retry_policy.call(execute_once, get_retry_info, self.rate_limiter, description, on_retry)
+
+    def close(self) -> None:
+        """Stop the worker threads, once any API calls in flight have finished."""
+        self.executor.shutdown(wait=True)
+
+    async def get_spreadsheet(self, spreadsheet_id: str, include_grid_data=True) -> dict:
         """Get a spreadsheet object.
 
         :param spreadsheet_id: The ID for the Google Spreadsheet to be gotten.
@@ -205,11 +745,50 @@ class GSheets:
             spreadsheetId=spreadsheet_id,
             includeGridData=include_grid_data
         )
-        result = spreadsheet_get_http.execute()
+        result = await self.execute_request(spreadsheet_get_http)
+        logger.debug(result)
+        return result
+
+    async def get_spreadsheet_layout(self, spreadsheet_id: str) -> dict:
+        """Get the sheets/tabs of a spreadsheet, with their frozen rows and columns, and conditional formatting, but no
+        cells.
+
+        :param spreadsheet_id: The ID for the Google Spreadsheet.
+        :return: Dictionary. Spreadsheet details.
+        """
+        logger.info(f"Getting layout of Spreadsheet: '{spreadsheet_id}'.")
+        spreadsheet_get_http = self.spreadsheets_resource.get(
+            spreadsheetId=spreadsheet_id,
+            includeGridData=False,
+            fields=LAYOUT_FIELDS,
+        )
+        result = await self.execute_request(spreadsheet_get_http)
         logger.debug(result)
         return result
 
-    def get_sheet(self, spreadsheet_id: str, sheet_name: str) -> dict:
+    async def get_spreadsheet_snapshot(
+        self, spreadsheet_id: str, sheet_names: list, row_index: int = None
+    ) -> SpreadsheetSnapshot:
+        """Get the existing cells of several sheets/tabs in a single request.
+
+        :param spreadsheet_id: The ID for the Google Spreadsheet.
+        :param sheet_names: The human readable names of the sheets.
+        :param row_index: The index of a single row to get of each sheet, if not all of them.
+        :return: A SpreadsheetSnapshot of the sheets.
+        """
+        logger.info(f"Getting snapshot of {len(sheet_names)} sheets of Spreadsheet: '{spreadsheet_id}'.")
+        row_range = "" if row_index is None else f"!{row_index + 1}:{row_index + 1}"
+        spreadsheet_get_http = self.spreadsheets_resource.get(
+            spreadsheetId=spreadsheet_id,
+            ranges=["'%s'%s" % (sheet_name, row_range) for sheet_name in sheet_names],
+            includeGridData=True,
+            fields=SNAPSHOT_FIELDS,
+        )
+        result = await self.execute_request(spreadsheet_get_http)
+        logger.debug(result)
+        return SpreadsheetSnapshot(result)
+
+    async def get_sheet(self, spreadsheet_id: str, sheet_name: str) -> dict:
         """Get a sheet/tab using the human readable name for it.
 
         :param spreadsheet_id: The ID for the Google Spreadsheet.
@@ -222,22 +801,13 @@ class GSheets:
             ranges=["'%s'" % sheet_name],
             includeGridData=True
         )
-        result = None
-        while result is None:
-            try:
-                result = spreadsheets_values_get_http.execute()
-            except HttpError as e:
-                if e.status_code != 429:
-                    raise e
-            time.sleep(1)
-            logger.info(f"Too Many Requests to Google...")
-            result = None
+        result = await self.execute_request(spreadsheets_values_get_http)
         logger.debug(result)
         sheet = result["sheets"][0]
         logger.debug(f"Found Sheet: {sheet}")
         return sheet
 
-    def add_sheet(self, spreadsheet_id: str, sheet_name: str) -> dict:
+    async def add_sheet(self, spreadsheet_id: str, sheet_name: str) -> dict:
         """Create a sheet/tab.
 
         :param spreadsheet_id: The ID for the Google Spreadsheet.
@@ -247,22 +817,22 @@ class GSheets:
         sheet_name = "%s" % sheet_name
         logger.info(f"Adding New Sheet: '{sheet_name}'.")
         try:
-            batchupdate = BatchUpdate(self.spreadsheets_resource, spreadsheet_id)
+            batchupdate = BatchUpdate(self, spreadsheet_id)
             addsheet_request = batchupdate.create_new_request(ADDSHEET)
             addsheet_request[PROPERTIES] = {
                 "title": sheet_name,
                 "hidden": False
             }
-            result = batchupdate.execute()
+            result = await batchupdate.execute()
             logger.debug(result)
         except HttpError as e:
             logger.info(f"Did not add new Sheet: '{sheet_name}'.'")
             logger.debug(e)
-        sheet = self.get_sheet(spreadsheet_id, sheet_name)
+        sheet = await self.get_sheet(spreadsheet_id, sheet_name)
         # Result already logged by get_sheet()
         return sheet
 
-    def reset_spreadsheet(self, spreadsheet_id: str, default_sheet_name: str = DEFAULT_SHEET_NAME) -> dict:
+    async def reset_spreadsheet(self, spreadsheet_id: str, default_sheet_name: str = DEFAULT_SHEET_NAME) -> dict:
         """Reset a Google Spreadsheet to a single blank "Sheet1" sheet/tab.
 
         :param spreadsheet_id: The ID for the Google Spreadsheet.
@@ -270,35 +840,35 @@ class GSheets:
         :return: Dictionary containing the API response.
         """
         logger.info(f"Resetting Spreadsheet: '{spreadsheet_id}', to single Sheer: '{default_sheet_name}'")
-        self.add_sheet(spreadsheet_id, default_sheet_name)
-        spreadsheet = self.get_spreadsheet(spreadsheet_id)
+        await self.add_sheet(spreadsheet_id, default_sheet_name)
+        spreadsheet = await self.get_spreadsheet(spreadsheet_id)
 
-        batchupdate = BatchUpdate(self.spreadsheets_resource, spreadsheet_id)
+        batchupdate = BatchUpdate(self, spreadsheet_id)
         for sheet in spreadsheet[SHEETS]:
             if sheet[PROPERTIES]["title"] != default_sheet_name:
                 sheet_id = sheet[PROPERTIES][SHEETID]
                 logger.info(f"Scheduling to delete Sheet: `{sheet_id}`")
                 deletesheet_request = batchupdate.create_new_request(DELETESHEET)
                 deletesheet_request[SHEETID] = sheet_id
-        result = batchupdate.execute()
+        result = await batchupdate.execute()
         logger.debug(result)
         return result
 
-    def get_sheet_list(self, spreadsheet_id: str) -> list:
+    async def get_sheet_list(self, spreadsheet_id: str) -> list:
         """Get a list of the names of sheets/tabs in a Google Spreadsheet.
 
         :param spreadsheet_id: The ID for the Google Spreadsheet.
         :return: The list of sheet names.
         """
         logger.info(f"Getting sheet list for Spreadsheet: '{spreadsheet_id}'.")
-        spreadsheet_config_simple = self.get_spreadsheet(spreadsheet_id, include_grid_data=False)
+        spreadsheet_config_simple = await self.get_spreadsheet(spreadsheet_id, include_grid_data=False)
         sheet_list = []
         for sheet in spreadsheet_config_simple["sheets"]:
             sheet_list.append(sheet['properties']["title"])
         logger.debug(f"Found sheets: {sheet_list}")
         return sheet_list
 
-    def get_cells_simple(self, spreadsheet_id: str, sheet_range: str) -> dict:
+    async def get_cells_simple(self, spreadsheet_id: str, sheet_range: str) -> dict:
         """Get a range of cells from a sheet.
         Do not includeGridData to return minimal result details.
 
@@ -311,11 +881,11 @@ class GSheets:
             spreadsheetId=spreadsheet_id,
             range=[sheet_range],
         )
-        result = spreadsheets_values_get_http.execute()
+        result = await self.execute_request(spreadsheets_values_get_http)
         logger.debug(result)
         return result
 
-    def get_cells_complex(self, spreadsheet_id: str, sheet_range: str) -> dict:
+    async def get_cells_complex(self, spreadsheet_id: str, sheet_range: str) -> dict:
         """Get a range of cells from a sheet.
         includeGridData will include an enormous amount of information in the response.
 
@@ -329,11 +899,11 @@ class GSheets:
             ranges=[sheet_range],
             includeGridData=True
         )
-        results = get.execute()
+        results = await self.execute_request(get)
         logger.debug(results)
         return results
 
-    def delete_sheet(self, spreadsheet_id: str, sheet_name: str) -> dict:
+    async def delete_sheet(self, spreadsheet_id: str, sheet_name: str) -> dict:
         """Delete a sheet/tab from a Google Spreadsheet.
 
         :param spreadsheet_id: The ID for the Google Spreadsheet.
@@ -341,19 +911,19 @@ class GSheets:
         :return: The API response.
         """
         logger.info(f"Deleting Sheet: `{sheet_name}`.")
-        sheet = self.get_sheet(spreadsheet_id, sheet_name)
+        sheet = await self.get_sheet(spreadsheet_id, sheet_name)
         if sheet:
             sheet_id = sheet[PROPERTIES][SHEETID]
 
-            batchupdate = BatchUpdate(self.spreadsheets_resource, spreadsheet_id)
+            batchupdate = BatchUpdate(self, spreadsheet_id)
             deletesheet_request = batchupdate.create_new_request(DELETESHEET)
             deletesheet_request[SHEETID] = sheet_id
-            result = batchupdate.execute()
+            result = await batchupdate.execute()
             logger.debug(result)
             return result
         logger.debug(f"The sheet `{sheet_name}` was not found to be deleted.")
 
-    def fix_column_width(self, spreadsheet_id: str, sheet_id: int, col_letter: str) -> dict:
+    async def fix_column_width(self, spreadsheet_id: str, sheet_id: int, col_letter: str) -> dict:
         """Adjust the width of a column.
 
         :param spreadsheet_id: The ID for the Google Spreadsheet.
@@ -364,7 +934,7 @@ class GSheets:
         logger.info(f"Fixing column width for column {col_letter}, of sheet `{sheet_id}`.")
         name_col_index = xl_cell_to_rowcol(col_letter+"0")[1]
 
-        batchupdate = BatchUpdate(self.spreadsheets_resource, spreadsheet_id)
+        batchupdate = BatchUpdate(self, spreadsheet_id)
         autoresize_request = batchupdate.create_new_request(AUTORESIZE)
         autoresize_request["dimensions"] = {
             SHEETID: sheet_id,
@@ -372,11 +942,11 @@ class GSheets:
             "startIndex": name_col_index,
             "endIndex": name_col_index+1
         }
-        result = batchupdate.execute()
+        result = await batchupdate.execute()
         logger.debug(result)
         return result
 
     def create_new_batchupdate(self, spreadsheet_id: str) -> BatchUpdate:
         """Create and return a new BatchUpdate object."""
-        batchupdate = BatchUpdate(self.spreadsheets_resource, spreadsheet_id)
+        batchupdate = BatchUpdate(self, spreadsheet_id, self.batch_max_requests, self.batch_max_bytes)
         return batchupdate
@@ -0,0 +1,206 @@
+"""A journal of the progress of a fill-sheet-data run, so a run that dies part way through can be resumed.
+The journal records which spreadsheets have had their layout prepared, which characters have been fetched, and which
+characters' rows each spreadsheet has committed.
+Each of these is appended to the journal file as a record of its own, and the file is deleted when a run finishes.
+"""
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+from ffxiv_automated_collectible_tracker.cache import DEFAULT_CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+
+# One JSON record per line, so each step of a run only appends to the file.
+JOURNAL_FILENAME = "run_journal.jsonl"
+journal_filepath = Path(DEFAULT_CACHE_DIR) / JOURNAL_FILENAME
+
+# Re-used Strings
+RUN_KEY = "run_key"
+PREPARED = "prepared"
+FETCHED = "fetched"
+COMMITTED = "committed"
+CHARACTERS = "characters"
+
+
+def set_journal_dir(journal_dir: str) -> None:
+    """Keep the run journal in a different directory.
+
+    :param journal_dir: The directory to keep the journal file in.
+    :return: None
+    """
+    global journal_filepath
+    journal_filepath = Path(journal_dir) / JOURNAL_FILENAME
+
+
+def get_run_key(sheets_config: dict, characters_list: [str]) -> str:
+    """Identify a run by its inputs. A journal can only be resumed by a run with the same config and characters.
+
+    :param sheets_config: The configuration dictionary for the Spreadsheets.
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :return: A hex digest of the inputs.
+    """
+    run_inputs = json.dumps([sheets_config, characters_list], sort_keys=True, default=str)
+    return hashlib.sha256(run_inputs.encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """The progress of a single run, appended to the journal file one record at a time as it is made."""
+    def __init__(self, filepath: str, run_key: str, resume: bool = False):
+        """
+        :param filepath: The path to the journal file.
+        :param run_key: The key of this run, as made by get_run_key().
+        :param resume: Boolean. Carry on from the journal left by an earlier run with the same key, if there is one.
+        """
+        self.filepath = Path(filepath)
+        self.pending = {}
+        self.prepared = set()
+        self.fetched = set()
+        self.committed = {}
+        records = self._read_records() if resume else []
+        if records and records[0].get(RUN_KEY) == run_key:
+            for record in records[1:]:
+                self._apply(record)
+            logger.info(
+                f"Resuming run: {len(self.fetched)} characters already fetched, "
+                f"{sum(map(len, self.committed.values()))} spreadsheet rows already committed."
+            )
+        elif resume:
+            logger.warning("No journal of an earlier run with this config and these characters. Starting afresh.")
+        # Start the file again, with only what is already known, so it never ends in a record cut short by a crash.
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.filepath, "w", encoding="utf-8") as journal_file:
+            for record in [{RUN_KEY: run_key}] + self._get_state_records():
+                journal_file.write(json.dumps(record) + "\n")
+
+    def _read_records(self) -> [dict]:
+        """Read every record of the journal file, up to any record that was cut short.
+
+        :return: The list of records. The first is the run key, if there is one.
+        """
+        if not self.filepath.exists():
+            return []
+        records = []
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    records.append(json.loads(line))
+        except (OSError, ValueError) as e:
+            # A run that died mid-write leaves its last record cut short. Every record before it still stands.
+            logger.warning(f"Could not read all of journal file '{self.filepath}': {e}")
+        return records
+
+    def _apply(self, record: dict) -> None:
+        """Replay a record of the journal file.
+
+        :param record: The record.
+        :return: None
+        """
+        if PREPARED in record:
+            self.prepared.add(record[PREPARED])
+        elif FETCHED in record:
+            self.fetched.add(record[FETCHED])
+        elif COMMITTED in record:
+            self.committed.setdefault(record[COMMITTED], set()).update(record[CHARACTERS])
+
+    def _get_state_records(self) -> [dict]:
+        """
+        :return: The records that make up everything this journal knows.
+        """
+        return (
+            [{PREPARED: spreadsheet_id} for spreadsheet_id in sorted(self.prepared)]
+            + [{FETCHED: char_and_world} for char_and_world in sorted(self.fetched)]
+            + [
+                {COMMITTED: spreadsheet_id, CHARACTERS: sorted(characters)}
+                for spreadsheet_id, characters in self.committed.items()
+            ]
+        )
+
+    def _append(self, record: dict) -> None:
+        """Add a record to the end of the journal file.
+
+        :param record: The record.
+        :return: None
+        """
+        with open(self.filepath, "a", encoding="utf-8") as journal_file:
+            journal_file.write(json.dumps(record) + "\n")
+
+    def is_prepared(self, spreadsheet_id: str) -> bool:
+        """
+        :param spreadsheet_id: The ID of the Spreadsheet.
+        :return: Boolean. The spreadsheet's layout was prepared by this run, or the run being resumed.
+        """
+        return spreadsheet_id in self.prepared
+
+    def mark_prepared(self, spreadsheet_id: str) -> None:
+        """Record that a spreadsheet's layout has been brought in line with the config.
+
+        :param spreadsheet_id: The ID of the Spreadsheet.
+        :return: None
+        """
+        if spreadsheet_id in self.prepared:
+            return
+        self.prepared.add(spreadsheet_id)
+        self._append({PREPARED: spreadsheet_id})
+
+    def is_fetched(self, char_and_world: str) -> bool:
+        """
+        :param char_and_world: The character, in the form {name}@{world}.
+        :return: Boolean. The character's details were fetched by this run, or the run being resumed.
+        """
+        return char_and_world in self.fetched
+
+    def mark_fetched(self, char_and_world: str) -> None:
+        """Record that a character's details have been fetched, and stored.
+
+        :param char_and_world: The character, in the form {name}@{world}.
+        :return: None
+        """
+        if char_and_world in self.fetched:
+            return
+        self.fetched.add(char_and_world)
+        self._append({FETCHED: char_and_world})
+
+    def is_committed(self, spreadsheet_id: str, char_and_world: str) -> bool:
+        """
+        :param spreadsheet_id: The ID of the Spreadsheet.
+        :param char_and_world: The character, in the form {name}@{world}.
+        :return: Boolean. The character's rows have already been sent to the spreadsheet.
+        """
+        return char_and_world in self.committed.get(spreadsheet_id, ())
+
+    def add_pending(self, spreadsheet_id: str, char_and_world: str, requests_added: int) -> None:
+        """Note that a character's rows have been added to a spreadsheet's BatchUpdate, but may not have been sent.
+
+        :param spreadsheet_id: The ID of the Spreadsheet.
+        :param char_and_world: The character, in the form {name}@{world}.
+        :param requests_added: The number of requests added to the BatchUpdate so far, including the character's.
+        :return: None
+        """
+        self.pending.setdefault(spreadsheet_id, []).append((char_and_world, requests_added))
+
+    def mark_sent(self, spreadsheet_id: str, requests_sent: int) -> None:
+        """Commit every pending character whose rows have now been sent to a spreadsheet.
+
+        :param spreadsheet_id: The ID of the Spreadsheet.
+        :param requests_sent: The number of requests of the spreadsheet's BatchUpdate that have been sent.
+        :return: None
+        """
+        pending = self.pending.get(spreadsheet_id, [])
+        sent_count = 0
+        while sent_count < len(pending) and pending[sent_count][1] <= requests_sent:
+            sent_count += 1
+        if not sent_count:
+            return
+        sent_characters = [char_and_world for char_and_world, _ in pending[:sent_count]]
+        self.committed.setdefault(spreadsheet_id, set()).update(sent_characters)
+        del pending[:sent_count]
+        self._append({COMMITTED: spreadsheet_id, CHARACTERS: sent_characters})
+
+    def finish(self) -> None:
+        """Delete the journal, since the run it describes is complete."""
+        if self.filepath.exists():
+            self.filepath.unlink()
@@ -4,184 +4,647 @@ source.
 """
 import asyncio
 import aiohttp
-import copy
+import collections
+import concurrent.futures
 import logging
+import multiprocessing
 import re
-import requests
+import time
 
-from bs4 import BeautifulSoup as bs
-from pathlib import PurePosixPath
+from bs4 import BeautifulSoup as bs, SoupStrainer
+from pathlib import Path, PurePosixPath
+from urllib.parse import urlsplit
+
+import ffxiv_automated_collectible_tracker.metrics as metrics
+import ffxiv_automated_collectible_tracker.store as store
+from ffxiv_automated_collectible_tracker.cache import DEFAULT_CACHE_DIR, JsonCache
+from ffxiv_automated_collectible_tracker.ratelimit import (
+    DEFAULT_MAX_CONCURRENCY,
+    RETRYABLE_STATUSES,
+    AdaptiveConcurrencyLimiter,
+    RetryPolicy,
+    get_rate_limiter,
+    parse_retry_after,
+)
 
 
 logger = logging.getLogger(__name__)
 
-_website_url = "eu.finalfantasyxiv.com"
+_website_url = "https://eu.finalfantasyxiv.com"
 _lodestone_url = f"{_website_url}/lodestone"
-char_uri = f"https://{_lodestone_url}/character"
-fc_url = f"https://{_lodestone_url}/freecompany"
+char_uri = f"{_lodestone_url}/character"
+fc_url = f"{_lodestone_url}/freecompany"
+# A gentle default request rate, since the Lodestone does not publish its limits.
+DEFAULT_REQUESTS_PER_SECOND = 10
 achievement_name_regex = re.compile('^.*\sachievement\s"(?P<achievement_name>.*)"\searned!$')
 
+# lxml is several times faster than python's own parser, but is optional.
+try:
+    import lxml  # noqa: F401
+    html_parser = "lxml"
+except ImportError:
+    html_parser = "html.parser"
+
+
+def _class_regex(*class_names: str) -> re.Pattern:
+    """Build a regex matching a class attribute that contains any of the given classes.
+    While parsing, a SoupStrainer sees the whole class attribute as one string, so a plain class name only matches
+    elements with exactly that one class.
+
+    :param class_names: The class names to match.
+    :return: The compiled regex.
+    """
+    return re.compile(rf"(^|\s)({'|'.join(map(re.escape, class_names))})(\s|$)")
+
+
+# Each extractor only builds the parts of its page that it reads.
+_char_search_strainer = SoupStrainer("a", class_=_class_regex("entry__link"))
+_mount_list_strainer = SoupStrainer("li", class_=_class_regex("mount__list_icon"))
+_mount_tooltip_strainer = SoupStrainer("h4")
+_achievement_page_strainer = SoupStrainer(
+    ["li", "p"], class_=_class_regex("btn__pager__current", "entry__activity__txt")
+)
+_fc_page_strainer = SoupStrainer(["div", "li"], class_=_class_regex("ldst__window", "btn__pager__current"))
+
+# Mount names are the same for every character, so they are shared by the whole process and kept between runs.
+mount_name_cache = JsonCache(Path(DEFAULT_CACHE_DIR) / "mount_names.json")
+# Character IDs, keyed by {name}@{world}. These only change when a character is renamed or transferred.
+char_id_cache = JsonCache(Path(DEFAULT_CACHE_DIR) / "character_ids.json")
+
+
+def set_cache_dir(cache_dir: str) -> None:
+    """Point the Lodestone caches at a different directory.
+
+    :param cache_dir: The directory to keep the cache files in.
+    :return: None
+    """
+    global mount_name_cache, char_id_cache
+    mount_name_cache = JsonCache(Path(cache_dir) / "mount_names.json")
+    char_id_cache = JsonCache(Path(cache_dir) / "character_ids.json")
+
+
+def set_lodestone_url(website_url: str) -> None:
+    """Send every Lodestone request to a different server, such as the stand-in server in standin.py.
+
+    :param website_url: The scheme and host of the server, such as "http://127.0.0.1:8080".
+    :return: None
+    """
+    global _website_url, _lodestone_url, char_uri, fc_url
+    _website_url = website_url.rstrip("/")
+    _lodestone_url = f"{_website_url}/lodestone"
+    char_uri = f"{_lodestone_url}/character"
+    fc_url = f"{_lodestone_url}/freecompany"
+
+
+def set_html_parser(parser: str) -> None:
+    """Choose the parser BeautifulSoup uses for Lodestone pages.
+
+    :param parser: The name of any parser BeautifulSoup supports, such as "lxml" or "html.parser".
+    :return: None
+    """
+    global html_parser
+    html_parser = parser
+
+
+def save_caches() -> None:
+    """Write every Lodestone cache with unsaved changes to disk."""
+    for cache in (mount_name_cache, char_id_cache):
+        cache.save()
+
+
+def _get_retry_info(exception: Exception) -> (bool, float):
+    """Decide whether a failed Lodestone request is worth retrying.
+
+    :param exception: The exception raised by the request.
+    :return: A tuple of whether to retry, and the Retry-After delay in seconds if the Lodestone gave one.
+    """
+    if isinstance(exception, aiohttp.ClientResponseError):
+        retry_after = parse_retry_after(exception.headers.get("Retry-After")) if exception.headers else None
+        return exception.status in RETRYABLE_STATUSES, retry_after
+    return isinstance(exception, (aiohttp.ClientConnectionError, asyncio.TimeoutError)), None
+
+
+class LodestoneClient:
+    """A single pooled http session, shared by every Lodestone request made during a run."""
+    def __init__(
+        self,
+        limit_per_host: int = DEFAULT_MAX_CONCURRENCY,
+        keepalive_timeout: float = 30,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        retry_policy: RetryPolicy = None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter = None,
+        parse_workers: int = 0,
+    ):
+        """
+        :param limit_per_host: The most connections to keep open to the Lodestone at once.
+        :param keepalive_timeout: How long, in seconds, to keep an idle connection open for re-use.
+        :param requests_per_second: The most requests to make to the Lodestone per second, on average.
+        :param retry_policy: How to retry failed requests. Uses the RetryPolicy defaults if not given.
+        :param concurrency_limiter: Decides how many requests to have in flight at once, from how the Lodestone is
+            responding. Uses the AdaptiveConcurrencyLimiter defaults, up to limit_per_host, if not given.
+        :param parse_workers: The number of worker processes to parse pages in. If 0, pages are parsed on the event
+            loop.
+        """
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.rate_limiter = get_rate_limiter(urlsplit(_website_url).netloc, requests_per_second, limit_per_host)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.concurrency_limiter = concurrency_limiter or AdaptiveConcurrencyLimiter(max_limit=limit_per_host)
+        self.parse_workers = parse_workers
+        self.parse_executor = None
+        self.session = None
+        # Futures for the names of mounts whose tooltips are being requested, by mount ID.
+        self.mount_name_fetches = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self) -> None:
+        """Open the http session, and start the parse workers if there are any.
+        This must be called from within the event loop that will use the session.
+        """
+        connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, keepalive_timeout=self.keepalive_timeout)
+        self.session = aiohttp.ClientSession(connector=connector)
+        if self.parse_workers:
+            # Spawn, rather than fork, since this process already has threads running for the Sheets API.
+            self.parse_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=set_html_parser,
+                initargs=(html_parser,),
+            )
+
+    async def close(self) -> None:
+        """Close the http session, and any connections it has open, stop the parse workers, and save the Lodestone
+        caches.
+        """
+        save_caches()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown()
+            self.parse_executor = None
+
+    async def get_text(self, url: str, params: dict = None, endpoint: str = None) -> str:
+        """Request a URL, within the Lodestone rate and concurrency limits, retrying it if it fails in a way that is
+        worth retrying.
+
+        :param url: The URL to request.
+        :param params: A dictionary of query parameters.
+        :param endpoint: The kind of page being requested, for the run metrics. Defaults to the path of the URL.
+        :return: The body of the response.
+        :raises aiohttp.ClientResponseError: If the Lodestone responds with an error that is not worth retrying, or
+            keeps responding with errors.
+        """
+        if endpoint is None:
+            endpoint = urlsplit(url).path
+
+        async def get_text_once() -> str:
+            async with self.concurrency_limiter.slot(lambda e: _get_retry_info(e)[0]):
+                started = time.monotonic()
+                status = None
+                body = b""
+                try:
+                    async with self.session.get(url, params=params) as response:
+                        status = response.status
+                        body = await response.read()
+                        response.raise_for_status()
+                        return await response.text()
+                finally:
+                    metrics.run_metrics.record_request(
+                        metrics.LODESTONE, endpoint, time.monotonic() - started, status, bytes_received=len(body)
+                    )
+
+        def on_retry(exception: Exception) -> None:
+            metrics.run_metrics.record_retry(metrics.LODESTONE, endpoint)
+
+        return await self.retry_policy.call(get_text_once, _get_retry_info, self.rate_limiter, url, on_retry)
+
+    async def extract(self, extractor, html: str, *extractor_args):
+        """Run an extractor on the body of a page, in a parse worker if there are any.
+        Only the body and the small extracted result are passed between processes, never the parse tree.
+
+        :param extractor: A module level function that takes the body of a page, and returns what is needed from it.
+        :param html: The body of the page.
+        :param extractor_args: Any further arguments for the extractor.
+        :return: The result of the extractor.
+        """
+        started = time.perf_counter()
+        if self.parse_executor is None:
+            result = extractor(html, *extractor_args)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.parse_executor, extractor, html, *extractor_args)
+        # With parse workers, this includes any time the page spent waiting for a free worker.
+        metrics.run_metrics.record_parse(extractor.__name__, time.perf_counter() - started)
+        return result
+
+    async def get_extract(self, url: str, extractor, *extractor_args, params: dict = None):
+        """Request a URL, and extract what is needed from the page.
+
+        :param url: The URL to request.
+        :param extractor: A module level function that takes the body of a page, and returns what is needed from it.
+        :param extractor_args: Any further arguments for the extractor.
+        :param params: A dictionary of query parameters.
+        :return: The result of the extractor.
+        """
+        # Each extractor reads one kind of page, so it names the endpoint.
+        endpoint = extractor.__name__.replace("extract_", "", 1)
+        return await self.extract(extractor, await self.get_text(url, params, endpoint), *extractor_args)
+
+
+def _parse(html: str, strainer: SoupStrainer) -> bs:
+    """Run BeautifulSoup on a page, building only the elements the strainer matches, and everything inside them.
+
+    :param html: The body of a Lodestone page.
+    :param strainer: The SoupStrainer for the elements that are needed.
+    :return: BeautifulSoup.
+    """
+    return bs(html, html_parser, parse_only=strainer)
+
+
+def _get_soup_total_pages(soup: bs) -> int:
+    """Get the number of pages from the pager on a paged Lodestone list.
+
+    :param soup: The BeautifulSoup of a page of the list.
+    :return: The number of pages, or 0 if there is no pager.
+    """
+    pages_li = soup.find("li", class_="btn__pager__current")
+    if not pages_li:
+        return 0
+    return int(pages_li.text.split()[-1])
+
+
+def extract_char_id(html: str, char_name: str) -> str:
+    """Get a character's lodestone ID from a page of character search results.
+
+    :param html: The body of the search results page.
+    :param char_name: The full name of the character.
+    :return: String. The lodestone ID for the character, or None if they are not in the results.
+    """
+    entries = _parse(html, _char_search_strainer).find_all("a", class_="entry__link")
+    try:
+        char_entry = [entry for entry in entries if entry.find("p", class_="entry__name").text == char_name][0]
+        return PurePosixPath(char_entry["href"]).parts[-1]
+    except IndexError as e:
+        logger.error(e)
+
+
+def extract_mount_hrefs(html: str) -> [str]:
+    """Get the tooltip hrefs from a character's mount page.
+
+    :param html: The body of the mount page.
+    :return: A list of the tooltip href for each of the character's mounts.
+    """
+    mount_lis = _parse(html, _mount_list_strainer).find_all(
+        "li", attrs={"data-tooltip_href": True}, class_="mount__list_icon"
+    )
+    return [mount_li.attrs["data-tooltip_href"] for mount_li in mount_lis]
+
+
+def extract_mount_name(html: str) -> str:
+    """Get the human readable name of a mount from its tooltip.
+
+    :param html: The body of the mount tooltip.
+    :return: The name of the mount.
+    """
+    return _parse(html, _mount_tooltip_strainer).h4.text
+
+
+def extract_achievement_page(html: str) -> ([str], int):
+    """Get the human readable names of the achievements listed on a page of a character's achievements.
 
-async def get_char_details(char_name: str, world: str, achievements: bool = False, mounts: bool = False) -> dict:
+    :param html: The body of the page of achievements.
+    :return: A tuple of the achievement names, in the order they are listed, and the total number of pages.
+    """
+    soup = _parse(html, _achievement_page_strainer)
+    achievements = [
+        achievement_name_regex.fullmatch(p.text).group("achievement_name")
+        for p in soup.find_all("p", class_="entry__activity__txt")
+    ]
+    return achievements, _get_soup_total_pages(soup)
+
+
+def extract_fc_id(html: str, fc_name: str) -> str:
+    """Get a Free Company's lodestone ID from a page of Free Company search results.
+
+    :param html: The body of the search results page.
+    :param fc_name: The name of the FC.
+    :return: String. The lodestone ID for the FC.
+    :raises IndexError: If the FC is not in the results.
+    """
+    search_results = _parse(html, _fc_page_strainer).find("div", class_="ldst__window")
+    entries = search_results.find_all("a", class_="entry__block")
+    fc_entry = [entry for entry in entries if entry.find("p", class_="entry__name").text == fc_name][0]
+    return PurePosixPath(fc_entry["href"]).parts[-1]
+
+
+def extract_fc_member_page(html: str) -> ([(str, str)], int):
+    """Get the members listed on a page of a Free Company's members.
+
+    :param html: The body of the page of members.
+    :return: A tuple of the (name, character ID) of each member, in the order they are listed, and the total number
+        of pages. A character ID is None if the member is not linked to their character page.
+    """
+    soup = _parse(html, _fc_page_strainer)
+    members = []
+    for p in soup.find("div", class_="ldst__window").find_all("p", class_="entry__name"):
+        member_link = p.find_parent("a", href=True)
+        members.append((p.text, PurePosixPath(member_link["href"]).parts[-1] if member_link else None))
+    return members, _get_soup_total_pages(soup)
+
+
+async def get_char_details(
+    client: LodestoneClient,
+    char_name: str,
+    world: str,
+    achievements: bool = False,
+    mounts: bool = False,
+) -> dict:
     """Make queries for a characters ID, achievements, and mounts.
 
+    :param client: The LodestoneClient to make requests with.
     :param char_name: The full name of the character.
     :param world: The name of the world that character is from.
     :param achievements: Boolean. Get the character's achievements.
     :param mounts: Boolean. Get the character's mounts.
-    :return: Dictionary. All the requested data.
+    :return: Dictionary. All the requested data. If the character cannot be found on the Lodestone, their ID is None,
+        and they have no collections.
+    """
+    char_and_world = f"{char_name}@{world}"
+    char_id = char_id_cache.get(char_and_world)
+    from_cache = char_id is not None
+    metrics.run_metrics.record_cache("character_ids", hits=int(from_cache), misses=int(not from_cache))
+    if not from_cache:
+        char_id = await get_char_id(client, char_name, world)
+    try:
+        char_details = await _get_char_collections(client, char_id, char_name, world, achievements, mounts)
+    except aiohttp.ClientResponseError as e:
+        if e.status != 404 or not from_cache:
+            raise e
+        # The character has been renamed, transferred, or deleted since their ID was cached.
+        logger.info(f"Cached character id '{char_id}' for '{char_and_world}' was not found. Searching again.")
+        char_id_cache.delete(char_and_world)
+        char_id = await get_char_id(client, char_name, world)
+        char_details = await _get_char_collections(client, char_id, char_name, world, achievements, mounts)
+    # Like the mount name cache, this is only written to disk when the client is closed, not once per character.
+    if char_id is not None:
+        char_id_cache.set(char_and_world, char_id)
+    return char_details
+
+
+async def _get_char_collections(
+    client: LodestoneClient,
+    char_id: str,
+    char_name: str,
+    world: str,
+    achievements: bool,
+    mounts: bool,
+) -> dict:
+    """Make queries for a character's achievements and mounts, using an already known ID.
+
+    :param client: The LodestoneClient to make requests with.
+    :param char_id: The lodestone ID for a character.
+    :param char_name: The full name of the character.
+    :param world: The name of the world that character is from.
+    :param achievements: Boolean. Get the character's achievements.
+    :param mounts: Boolean. Get the character's mounts.
+    :return: Dictionary. All the requested data. A character with no ID has no collections.
     """
-    char_id = get_char_id(char_name, world)
     char_details = {"ID": char_id, "Name": char_name, "World": world}
+    if char_id is None:
+        # The character is not on the Lodestone, so there are no pages of theirs to request.
+        logger.warning(f"Could not find '{char_name}@{world}' on the Lodestone. Skipping their collections.")
+        return char_details
     if achievements:
-        char_achievements = await get_char_achievements(char_id)
+        stored_details = store.collection_store.get_details(f"{char_name}@{world}") or {}
+        # Achievements stored under another ID belong to whoever had this name before a rename or transfer.
+        known_achievements = stored_details.get("Achievements") if stored_details.get("ID") == char_id else None
+        char_achievements = await get_char_achievements(client, char_id, known_achievements)
         char_details["Achievements"] = char_achievements
     if mounts:
-        char_mounts = await get_char_mounts(char_id)
+        char_mounts = await get_char_mounts(client, char_id)
         char_details["Mounts"] = char_mounts
     return char_details
 
 
-def get_char_id(char_name: str, world: str) -> str:
+async def get_char_id(client: LodestoneClient, char_name: str, world: str) -> str:
     """Get the lodestone ID for a character.
 
+    :param client: The LodestoneClient to make requests with.
     :param char_name: The full name of the character.
     :param world: The name of the world that character is from.
     :return: String. The lodestone ID for a character.
     """
     logger.info(f"Getting character id for '{char_name}'.")
-    response = requests.get(char_uri, params={"q": f"\"{char_name}\"", "worldname": world})
-    response_soup = bs(response.text, "html.parser")
-    entries = response_soup.find_all("a", class_="entry__link")
-    try:
-        char_entry = [entry for entry in entries if entry.find("p", class_="entry__name").text == char_name][0]
-        char_id = PurePosixPath(char_entry["href"]).parts[-1]
-        return char_id
-    except IndexError as e:
-        logger.error(e)
+    return await client.get_extract(
+        char_uri, extract_char_id, char_name, params={"q": f"\"{char_name}\"", "worldname": world}
+    )
 
 
-async def _get_url_soup(session: aiohttp.ClientSession, url_list: [str]) -> [bs]:
-    """Asynchronously pop a url from the queue, request it, and run BeautifulSoup on the results.
+async def _get_url_extract(client: LodestoneClient, url: str, extractor):
+    """Request a URL, and extract what is needed from the page.
 
-    :param session: An async http session.
-    :param url_list: The list of URLs to be queried.
-    :return: BeautifulSoup.
+    :param client: The LodestoneClient to make requests with.
+    :param url: The URL to be queried.
+    :param extractor: A module level function that takes the body of the page, and returns what is needed from it.
+    :return: The result of the extractor.
     """
-    soups = []
-    while url_list:
-        url = url_list.pop()
-        logger.info(f"Getting URL: {url}...")
-        data = None
-        while data is None:
-            async with session.get(url) as response:
-                data = await response.text()
-            if response.status == 429:
-                await asyncio.sleep(1)
-                logger.info(f"Too Many Requests. Retrying {url}...")
-                data = None
-        soup = bs(data, "html.parser")
-        soups.append(soup)
-    return soups
-
-
-async def _batch_get_url_soups(url_list: [str]) -> [bs]:
-    """Asynchronously get a list of BeautifulSoups for a list of URLs.
+    logger.info(f"Getting URL: {url}...")
+    return await client.get_extract(url, extractor)
 
-    :param url_list: A list of URL strings.
-    :return:  A list of BeautifulSoups.
-    """
-    this_url_list = copy.deepcopy(url_list)
-    soups = []
-    async with aiohttp.ClientSession() as session:
-        soup_gathering_tasks = [_get_url_soup(session, this_url_list) for _ in range(10)]
-        [soups.extend(subset_of_soups) for subset_of_soups in await asyncio.gather(*soup_gathering_tasks)]
-    return soups
 
+async def _iter_extract_urls(client: LodestoneClient, url_list: [str], extractor):
+    """Asynchronously request a list of URLs, and yield what is needed from each page as soon as it, and every page
+    before it, is done.
+    Only as many URLs as the client's concurrency limit allows are requested ahead of the page being waited on, so the
+    number of pages held at once is bounded by the concurrency limit, not by the number of URLs.
 
-async def get_char_mounts(char_id: str) -> [str]:
+    :param client: The LodestoneClient to make requests with.
+    :param url_list: A list of URL strings.
+    :param extractor: A module level function that takes the body of a page, and returns what is needed from it.
+    :return: An async generator of the results of the extractor, in the same order as the URLs.
+    """
+    url_iter = iter(url_list)
+    pending = collections.deque()
+    try:
+        while True:
+            while len(pending) < max(1, int(client.concurrency_limiter.limit)):
+                url = next(url_iter, None)
+                if url is None:
+                    break
+                pending.append(asyncio.ensure_future(_get_url_extract(client, url, extractor)))
+            if not pending:
+                return
+            yield await pending.popleft()
+    finally:
+        # Stop requesting pages nobody is going to read.
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def get_char_mounts(client: LodestoneClient, char_id: str) -> [str]:
     """Given a lodestone character ID, get the complete list of human readable names of their mount collection.
 
+    :param client: The LodestoneClient to make requests with.
     :param char_id: The lodestone ID for a character.
     :return: A list of the human readable names of that character's mount collection.
     """
     logger.info(f"Getting mounts for '{char_id}'.")
     char_mounts_url = f"{char_uri}/{char_id}/mount"
-    response = requests.get(char_mounts_url)
-    response_soup = bs(response.text, "html.parser")
-    mount_lis = response_soup.find_all("li", attrs={"data-tooltip_href": True}, class_="mount__list_icon")
-    mount_urls = ["https://" + _website_url + mount_li.attrs["data-tooltip_href"] for mount_li in mount_lis]
-    mounts = [soup.h4.text for soup in await _batch_get_url_soups(mount_urls)]
+    mount_hrefs = await client.get_extract(char_mounts_url, extract_mount_hrefs)
+
+    # The tooltip href is per character, but ends with an ID that is the same for every character with that mount.
+    mount_ids = {mount_href: PurePosixPath(mount_href).parts[-1] for mount_href in mount_hrefs}
+    unknown_hrefs = [
+        mount_href for mount_href in mount_hrefs if mount_name_cache.get(mount_ids[mount_href]) is None
+    ]
+    cached_count = len(mount_hrefs) - len(unknown_hrefs)
+    logger.info(f"{cached_count} of {len(mount_hrefs)} mount names cached for '{char_id}'.")
+    metrics.run_metrics.record_cache("mount_names", hits=cached_count, misses=len(unknown_hrefs))
+    if unknown_hrefs:
+        await _fetch_mount_names(client, {mount_ids[mount_href]: mount_href for mount_href in unknown_hrefs})
+
+    # Like the other caches, this is only written to disk when the client is closed, not once per character.
+    mounts = [mount_name_cache.get(mount_ids[mount_href]) for mount_href in mount_hrefs]
     return mounts
 
 
-async def get_char_achievements(char_id: str) -> [str]:
+async def _fetch_mount_names(client: LodestoneClient, mount_hrefs: dict) -> None:
+    """Fill in the mount name cache for mounts that are not in it yet.
+    Characters fetched at the same time often have the same mounts, so a tooltip already being requested for another
+    character is waited on, rather than requested again.
+
+    :param client: The LodestoneClient to make requests with.
+    :param mount_hrefs: A dictionary of each mount ID to a tooltip href for it.
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    other_fetches = []
+    own_hrefs = {}
+    for mount_id, mount_href in mount_hrefs.items():
+        if mount_id in client.mount_name_fetches:
+            other_fetches.append(client.mount_name_fetches[mount_id])
+        else:
+            client.mount_name_fetches[mount_id] = loop.create_future()
+            own_hrefs[mount_id] = mount_href
+
+    own_id_iter = iter(own_hrefs)
+    mount_urls = [_website_url + mount_href for mount_href in own_hrefs.values()]
+    try:
+        async for mount_name in _iter_extract_urls(client, mount_urls, extract_mount_name):
+            mount_id = next(own_id_iter)
+            mount_name_cache.set(mount_id, mount_name)
+            client.mount_name_fetches.pop(mount_id).set_result(mount_name)
+    except BaseException as e:
+        for mount_id in own_hrefs:
+            mount_name_fetch = client.mount_name_fetches.pop(mount_id, None)
+            if mount_name_fetch is None:
+                continue
+            if isinstance(e, Exception):
+                mount_name_fetch.set_exception(e)
+                # Only characters waiting on the fetch need to see the error, so it is not logged as unretrieved.
+                mount_name_fetch.exception()
+            else:
+                mount_name_fetch.cancel()
+        raise
+    # Shielded, so a character that is cancelled while waiting does not cancel the fetch for everyone else.
+    await asyncio.gather(*[asyncio.shield(mount_name_fetch) for mount_name_fetch in other_fetches])
+
+
+async def get_char_achievements(client: LodestoneClient, char_id: str, known_achievements: [str] = None) -> [str]:
     """Given a lodestone character ID, get the complete list of human readable names of their achievements.
+    The Lodestone lists achievements newest first. If the character's achievements are already known, from the
+    collection store, pages are walked one at a time, stopping at the first already known achievement.
 
+    :param client: The LodestoneClient to make requests with.
     :param char_id: The lodestone ID for a character.
-    :return: A list of the human readable names of that character's achievements.
+    :param known_achievements: The character's achievements as last fetched, newest first, if there are any.
+    :return: A list of the human readable names of that character's achievements, newest first.
     """
     logger.info(f"Getting achievements for '{char_id}'.")
     char_acvhievements_url = f"{char_uri}/{char_id}/achievement"
-    response = requests.get(char_acvhievements_url)
-    response_soup = bs(response.text, "html.parser")
-
-    pages_li = response_soup.find("li", class_="btn__pager__current")
-    if not pages_li:
+    page_achievements, total_pages = await client.get_extract(char_acvhievements_url, extract_achievement_page)
+    if not total_pages:
         return []
 
-    total_pages = int(pages_li.text.split()[-1])
     achievement_urls = [char_acvhievements_url + "/?page=%s" % (page_num + 1) for page_num in range(total_pages)]
 
-    achievements = [
-        achievement_name_regex.fullmatch(p.text).group("achievement_name")
-        for soup in await _batch_get_url_soups(achievement_urls)
-        for p in soup.find_all("p", class_="entry__activity__txt")
-    ]
-
+    metrics.run_metrics.record_cache(
+        "achievements", hits=int(known_achievements is not None), misses=int(known_achievements is None)
+    )
+    if known_achievements is None:
+        # Nothing is known about this character yet, so every page is needed. The first page is already here.
+        achievements = page_achievements
+        async for other_page_achievements, _ in _iter_extract_urls(
+            client, achievement_urls[1:], extract_achievement_page
+        ):
+            achievements.extend(other_page_achievements)
+    else:
+        known_achievements_set = set(known_achievements)
+        new_achievements = []
+        for page_num, achievement_url in enumerate(achievement_urls):
+            if page_num > 0:
+                page_achievements, _ = await client.get_extract(achievement_url, extract_achievement_page)
+            reached_known = False
+            for achievement in page_achievements:
+                if achievement in known_achievements_set:
+                    reached_known = True
+                    break
+                new_achievements.append(achievement)
+            if reached_known:
+                break
+        logger.info(f"Found {len(new_achievements)} new achievements for '{char_id}' in {page_num + 1} pages.")
+        achievements = new_achievements + known_achievements
     return achievements
 
 
-async def get_fc_members(world: str, fc_name: str) -> [str]:
+async def get_fc_members(client: LodestoneClient, world: str, fc_name: str) -> [str]:
     """Get the names of all of the members of a Free Company.
+    The character IDs on the member pages are added to the character ID cache along the way.
 
+    :param client: The LodestoneClient to make requests with.
     :param world: The name of the world the FC is on.
     :param fc_name:The name of the FC
     :return: The list of names of the members of the FC.
     """
     logger.info(f"Getting Free Company '{fc_name}'.")
-    response = requests.get(fc_url, params={"q": fc_name, "worldname": world})
-    response_soup = bs(response.text, "html.parser")
-    search_results = response_soup.find("div", class_="ldst__window")
-    entries = search_results.find_all("a", class_="entry__block")
-    char_entry = [entry for entry in entries if entry.find("p", class_="entry__name").text == fc_name][0]
-    fc_id = PurePosixPath(char_entry["href"]).parts[-1]
+    fc_id = await client.get_extract(fc_url, extract_fc_id, fc_name, params={"q": fc_name, "worldname": world})
 
     logger.info(f"Getting members for '{fc_id}'.")
     fc_members_url = f"{fc_url}/{fc_id}/member"
+    page_members, total_pages = await client.get_extract(fc_members_url, extract_fc_member_page)
 
-    response = requests.get(fc_members_url)
-    response_soup = bs(response.text, "html.parser")
+    members_urls = [fc_members_url + "/?page=%s" % (page_num + 1) for page_num in range(total_pages)]
 
-    response_soup.find("li", class_="btn__pager__current")
-    total_pages = int(response_soup.find("li", class_="btn__pager__current").text.split()[-1])
+    members = []
 
-    members_urls = [fc_members_url + "/?page=%s" % (page_num + 1) for page_num in range(total_pages)]
+    def add_page_members(page_members: [(str, str)]) -> None:
+        for member_name, member_char_id in page_members:
+            members.append(member_name)
+            if member_char_id:
+                char_id_cache.set(f"{member_name}@{world}", member_char_id)
 
-    members = [
-        p.text
-        for soup in await _batch_get_url_soups(members_urls)
-        for p in soup.find("div", class_="ldst__window").find_all("p", class_="entry__name")
-    ]
+    # The first page is already here.
+    add_page_members(page_members)
+    async for page_members, _ in _iter_extract_urls(client, members_urls[1:], extract_fc_member_page):
+        add_page_members(page_members)
 
     return members
 
 
-async def get_fc_members_formatted_with_world(world: str, fc_name: str) -> [str]:
+async def get_fc_members_formatted_with_world(client: LodestoneClient, world: str, fc_name: str) -> [str]:
     """Get the names of all of the members of a Free Company, in the form {name}@{world}.
 
+    :param client: The LodestoneClient to make requests with.
     :param world: The name of the world the FC is on.
     :param fc_name:The name of the FC
     :return: The list of names of the members of the FC, in the form {name}@{world}.
     """
-    return ["%s@%s" % (member, world) for member in await get_fc_members(world, fc_name)]
+    return ["%s@%s" % (member, world) for member in await get_fc_members(client, world, fc_name)]
@@ -0,0 +1,451 @@
+"""Metrics collected over a run, to tell whether a slow run was down to the Lodestone, Google, or this code.
+Every request to either service is counted by endpoint and status, along with its latency, any retries, and the bytes
+it sent and received. Page parsing time, cache hit rates, Sheets API calls per spreadsheet, and the time spent in each
+phase of a run are collected too.
+At the end of a run, the metrics can be printed as a summary table, and written to a JSON file or a Prometheus
+textfile.
+"""
+import bisect
+import contextlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds. The upper bounds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds. The upper bounds of the parse time histogram buckets.
+PARSE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+# The prefix of every metric name in a Prometheus textfile.
+PROMETHEUS_PREFIX = "act"
+PROMETHEUS_SUFFIXES = (".prom", ".txt")
+
+# Services
+LODESTONE = "lodestone"
+SHEETS = "sheets"
+
+report_filepath = None
+
+
+def set_report_file(filepath: str) -> None:
+    """Write the metrics to a file whenever write_report() is called.
+
+    :param filepath: The path to write to. A path ending in .prom or .txt gets a Prometheus textfile, and anything
+        else gets JSON. None stops reports from being written.
+    :return: None
+    """
+    global report_filepath
+    report_filepath = None if filepath is None else Path(filepath)
+
+
+def _escape_label_value(value) -> str:
+    """
+    :param value: The value of a Prometheus label.
+    :return: The value, escaped for the Prometheus text exposition format.
+    """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets, as a Prometheus histogram keeps them."""
+    def __init__(self, buckets: tuple):
+        """
+        :param buckets: The upper bounds of the buckets, in ascending order. Values above the last bound are counted
+            in an extra, unbounded bucket.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Count a value.
+
+        :param value: The value.
+        :return: None
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def get_quantile(self, quantile: float) -> float:
+        """Estimate a quantile of the observed values, assuming they are spread evenly within each bucket.
+
+        :param quantile: The quantile, between 0 and 1.
+        :return: The estimated value, or None if nothing has been observed.
+        """
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        cumulative_count = 0
+        for bucket_index, bucket_count in enumerate(self.counts):
+            if cumulative_count + bucket_count >= rank and bucket_count:
+                lower_bound = self.buckets[bucket_index - 1] if bucket_index else 0.0
+                upper_bound = self.buckets[bucket_index] if bucket_index < len(self.buckets) else self.max
+                estimate = lower_bound + (upper_bound - lower_bound) * (rank - cumulative_count) / bucket_count
+                return min(estimate, self.max)
+            cumulative_count += bucket_count
+        return self.max
+
+    def to_dict(self) -> dict:
+        """
+        :return: The histogram, as a JSON serialisable dictionary.
+        """
+        return {
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+
+class EndpointMetrics:
+    """The requests made to one endpoint of a service."""
+    def __init__(self):
+        self.statuses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def requests(self) -> int:
+        """
+        :return: The number of attempts at requests, whatever their outcome.
+        """
+        return sum(self.statuses.values())
+
+    @property
+    def throttled(self) -> int:
+        """
+        :return: The number of requests answered with 429 Too Many Requests.
+        """
+        return self.statuses.get("429", 0)
+
+    @property
+    def errors(self) -> int:
+        """
+        :return: The number of requests that did not get a successful response, including those that were throttled.
+        """
+        return sum(count for status, count in self.statuses.items() if not status.startswith("2"))
+
+
+class RunMetrics:
+    """Every metric collected during a run, or since the last reset()."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget every metric collected so far."""
+        self.started = time.time()
+        self.endpoints = {}
+        self.parse_times = {}
+        self.caches = {}
+        self.sheets_calls = {}
+        self.phases = {}
+
+    def _get_endpoint(self, service: str, endpoint: str) -> EndpointMetrics:
+        """
+        :param service: The service, such as LODESTONE.
+        :param endpoint: The name of the endpoint.
+        :return: The metrics for the endpoint, created if this is the first request to it.
+        """
+        if (service, endpoint) not in self.endpoints:
+            self.endpoints[(service, endpoint)] = EndpointMetrics()
+        return self.endpoints[(service, endpoint)]
+
+    def record_request(
+        self,
+        service: str,
+        endpoint: str,
+        latency: float,
+        status: int = None,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+    ) -> None:
+        """Count a single attempt at a request.
+
+        :param service: The service, such as LODESTONE.
+        :param endpoint: The name of the endpoint.
+        :param latency: How long the attempt took, in seconds.
+        :param status: The HTTP status of the response, or None if there was no response.
+        :param bytes_sent: The size of the body of the request.
+        :param bytes_received: The size of the body of the response.
+        :return: None
+        """
+        endpoint_metrics = self._get_endpoint(service, endpoint)
+        status_key = "none" if status is None else str(status)
+        endpoint_metrics.statuses[status_key] = endpoint_metrics.statuses.get(status_key, 0) + 1
+        endpoint_metrics.latency.observe(latency)
+        endpoint_metrics.bytes_sent += bytes_sent
+        endpoint_metrics.bytes_received += bytes_received
+
+    def record_retry(self, service: str, endpoint: str) -> None:
+        """Count a request being retried.
+
+        :param service: The service, such as LODESTONE.
+        :param endpoint: The name of the endpoint.
+        :return: None
+        """
+        self._get_endpoint(service, endpoint).retries += 1
+
+    def record_parse(self, extractor_name: str, seconds: float) -> None:
+        """Count a page being parsed.
+
+        :param extractor_name: The name of the extractor that parsed the page.
+        :param seconds: How long the parse took.
+        :return: None
+        """
+        if extractor_name not in self.parse_times:
+            self.parse_times[extractor_name] = Histogram(PARSE_BUCKETS)
+        self.parse_times[extractor_name].observe(seconds)
+
+    def record_cache(self, cache_name: str, hits: int = 0, misses: int = 0) -> None:
+        """Count lookups in a cache.
+
+        :param cache_name: The name of the cache.
+        :param hits: The number of lookups that found what they were looking for.
+        :param misses: The number of lookups that did not.
+        :return: None
+        """
+        cache_hits, cache_misses = self.caches.get(cache_name, (0, 0))
+        self.caches[cache_name] = (cache_hits + hits, cache_misses + misses)
+
+    def record_sheets_call(self, spreadsheet_id: str, endpoint: str) -> None:
+        """Count a call to the Sheets API for a spreadsheet, however many attempts it took.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :param endpoint: The name of the endpoint.
+        :return: None
+        """
+        spreadsheet_calls = self.sheets_calls.setdefault(spreadsheet_id, {})
+        spreadsheet_calls[endpoint] = spreadsheet_calls.get(endpoint, 0) + 1
+
+    @contextlib.contextmanager
+    def time_phase(self, phase: str):
+        """Time a phase of a run. Phases that run concurrently are timed separately, so their times can add up to
+        more than the run took.
+
+        :param phase: The name of the phase.
+        :return: A context manager.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            runs, total_seconds, max_seconds = self.phases.get(phase, (0, 0.0, 0.0))
+            seconds = time.perf_counter() - started
+            self.phases[phase] = (runs + 1, total_seconds + seconds, max(max_seconds, seconds))
+
+    def to_dict(self) -> dict:
+        """
+        :return: Every metric, as a JSON serialisable dictionary.
+        """
+        return {
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "endpoints": [
+                {
+                    "service": service,
+                    "endpoint": endpoint,
+                    "statuses": endpoint_metrics.statuses,
+                    "retries": endpoint_metrics.retries,
+                    "bytes_sent": endpoint_metrics.bytes_sent,
+                    "bytes_received": endpoint_metrics.bytes_received,
+                    "latency": endpoint_metrics.latency.to_dict(),
+                }
+                for (service, endpoint), endpoint_metrics in self.endpoints.items()
+            ],
+            "parse_times": {
+                extractor_name: histogram.to_dict() for extractor_name, histogram in self.parse_times.items()
+            },
+            "caches": {
+                cache_name: {"hits": hits, "misses": misses} for cache_name, (hits, misses) in self.caches.items()
+            },
+            "sheets_calls": self.sheets_calls,
+            "phases": {
+                phase: {"runs": runs, "total_seconds": total_seconds, "max_seconds": max_seconds}
+                for phase, (runs, total_seconds, max_seconds) in self.phases.items()
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        :return: Every metric, in the Prometheus text exposition format, for the node exporter's textfile collector.
+        """
+        lines = []
+
+        def add_metric(name: str, metric_type: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}")
+            for sample_suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label_value(label)}"' for key, label in labels.items())
+                if label_text:
+                    label_text = f"{{{label_text}}}"
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{sample_suffix}{label_text} {value}")
+
+        def get_histogram_samples(histogram: Histogram, labels: dict) -> list:
+            samples = []
+            cumulative_count = 0
+            for bound, bucket_count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+                cumulative_count += bucket_count
+                samples.append(("_bucket", {**labels, "le": bound}, cumulative_count))
+            samples.append(("_sum", labels, histogram.sum))
+            samples.append(("_count", labels, histogram.count))
+            return samples
+
+        endpoints = [
+            ({"service": service, "endpoint": endpoint}, endpoint_metrics)
+            for (service, endpoint), endpoint_metrics in self.endpoints.items()
+        ]
+        add_metric("requests_total", "counter", "Request attempts, by response status.", [
+            ("", {**labels, "status": status}, count)
+            for labels, endpoint_metrics in endpoints for status, count in endpoint_metrics.statuses.items()
+        ])
+        add_metric("request_duration_seconds", "histogram", "Request attempt latency.", [
+            sample for labels, endpoint_metrics in endpoints
+            for sample in get_histogram_samples(endpoint_metrics.latency, labels)
+        ])
+        add_metric("request_retries_total", "counter", "Requests retried after a failed attempt.", [
+            ("", labels, endpoint_metrics.retries) for labels, endpoint_metrics in endpoints
+        ])
+        add_metric("request_sent_bytes_total", "counter", "Bytes of request bodies sent.", [
+            ("", labels, endpoint_metrics.bytes_sent) for labels, endpoint_metrics in endpoints
+        ])
+        add_metric("response_received_bytes_total", "counter", "Bytes of response bodies received.", [
+            ("", labels, endpoint_metrics.bytes_received) for labels, endpoint_metrics in endpoints
+        ])
+        add_metric("parse_duration_seconds", "histogram", "Time spent parsing Lodestone pages.", [
+            sample for extractor_name, histogram in self.parse_times.items()
+            for sample in get_histogram_samples(histogram, {"extractor": extractor_name})
+        ])
+        add_metric("cache_lookups_total", "counter", "Cache lookups, by whether they were hits.", [
+            ("", {"cache": cache_name, "result": result}, count)
+            for cache_name, (hits, misses) in self.caches.items()
+            for result, count in (("hit", hits), ("miss", misses))
+        ])
+        add_metric("sheets_calls_total", "counter", "Sheets API calls, by spreadsheet.", [
+            ("", {"spreadsheet_id": spreadsheet_id, "endpoint": endpoint}, count)
+            for spreadsheet_id, spreadsheet_calls in self.sheets_calls.items()
+            for endpoint, count in spreadsheet_calls.items()
+        ])
+        add_metric("phase_duration_seconds_total", "counter", "Time spent in each phase of a run.", [
+            ("", {"phase": phase}, total_seconds) for phase, (_, total_seconds, _) in self.phases.items()
+        ])
+        add_metric("phase_runs_total", "counter", "The number of times each phase of a run has run.", [
+            ("", {"phase": phase}, runs) for phase, (runs, _, _) in self.phases.items()
+        ])
+        add_metric("last_report_timestamp_seconds", "gauge", "When this report was written.", [
+            ("", {}, time.time())
+        ])
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self) -> str:
+        """
+        :return: The main metrics, as plain text tables.
+        """
+        def format_table(headings: [str], rows: [list], text_columns: int = 1) -> [str]:
+            cells = [headings] + [[str(cell) for cell in row] for row in rows]
+            widths = [max(len(row[column]) for row in cells) for column in range(len(headings))]
+            return [
+                "  ".join(
+                    cell.ljust(width) if column < text_columns else cell.rjust(width)
+                    for column, (cell, width) in enumerate(zip(row, widths))
+                ).rstrip()
+                for row in cells
+            ]
+
+        def format_seconds(seconds: float) -> str:
+            return "-" if seconds is None else f"{seconds:.3f}"
+
+        lines = [f"Run metrics, over {time.time() - self.started:.1f}s:"]
+        if self.endpoints:
+            lines += format_table(
+                ["Endpoint", "Requests", "Errors", "429s", "Retries", "p50 (s)", "p95 (s)", "Max (s)", "KiB out",
+                 "KiB in"],
+                [
+                    [
+                        f"{service} {endpoint}",
+                        endpoint_metrics.requests,
+                        endpoint_metrics.errors,
+                        endpoint_metrics.throttled,
+                        endpoint_metrics.retries,
+                        format_seconds(endpoint_metrics.latency.get_quantile(0.5)),
+                        format_seconds(endpoint_metrics.latency.get_quantile(0.95)),
+                        format_seconds(endpoint_metrics.latency.max),
+                        f"{endpoint_metrics.bytes_sent / 1024:.0f}",
+                        f"{endpoint_metrics.bytes_received / 1024:.0f}",
+                    ]
+                    for (service, endpoint), endpoint_metrics in sorted(self.endpoints.items())
+                ],
+            )
+        if self.parse_times:
+            lines += [""] + format_table(
+                ["Extractor", "Pages", "Total (s)", "Mean (ms)", "Max (ms)"],
+                [
+                    [
+                        extractor_name,
+                        histogram.count,
+                        format_seconds(histogram.sum),
+                        f"{histogram.sum / histogram.count * 1000:.2f}",
+                        f"{histogram.max * 1000:.2f}",
+                    ]
+                    for extractor_name, histogram in sorted(self.parse_times.items())
+                ],
+            )
+        if self.caches:
+            lines += [""] + format_table(
+                ["Cache", "Hits", "Misses", "Hit rate"],
+                [
+                    [cache_name, hits, misses, f"{hits / (hits + misses):.0%}" if hits + misses else "-"]
+                    for cache_name, (hits, misses) in sorted(self.caches.items())
+                ],
+            )
+        if self.sheets_calls:
+            lines += [""] + format_table(
+                ["Spreadsheet", "Sheets API calls"],
+                [
+                    [
+                        spreadsheet_id,
+                        ", ".join(f"{count} {endpoint}" for endpoint, count in sorted(spreadsheet_calls.items())),
+                    ]
+                    for spreadsheet_id, spreadsheet_calls in sorted(self.sheets_calls.items())
+                ],
+                text_columns=2,
+            )
+        if self.phases:
+            lines += [""] + format_table(
+                ["Phase", "Runs", "Total (s)", "Max (s)"],
+                [
+                    [phase, runs, format_seconds(total_seconds), format_seconds(max_seconds)]
+                    for phase, (runs, total_seconds, max_seconds) in self.phases.items()
+                ],
+            )
+        return "\n".join(lines)
+
+
+run_metrics = RunMetrics()
+
+
+def write_report() -> None:
+    """Write the metrics to the report file, if one has been set with set_report_file()."""
+    if report_filepath is None:
+        return
+    if report_filepath.suffix in PROMETHEUS_SUFFIXES:
+        report = run_metrics.to_prometheus()
+    else:
+        report = json.dumps(run_metrics.to_dict(), indent=4)
+    report_filepath.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file and swap it in, so a collector never reads a half written report.
+    tmp_filepath = report_filepath.with_name(report_filepath.name + ".tmp")
+    with open(tmp_filepath, "w", encoding="utf-8") as report_file:
+        report_file.write(report)
+    os.replace(tmp_filepath, report_filepath)
+    logger.debug(f"Wrote metrics report to '{report_filepath}'.")
@@ -0,0 +1,201 @@
+"""Profiling of a whole run, to find where the time goes as it moves between the network, parsing Lodestone pages, and
+building Google Sheets requests.
+A cProfile profile can be loaded in snakeviz. A timeline profile records when each asyncio task was running, and when it
+was waiting, and can be loaded in speedscope.
+"""
+import asyncio
+import collections.abc
+import cProfile
+import json
+import logging
+import time
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+
+# Profile formats
+CPROFILE = "cprofile"
+TIMELINE = "timeline"
+PROFILE_FORMATS = (CPROFILE, TIMELINE)
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+# The frames a task's time is split between in a timeline.
+RUNNING = "running"
+WAITING = "waiting"
+
+active_profiler = None
+
+
+class TaskTimeline:
+    """The steps of one asyncio task. The event loop runs a task one step at a time, from one await that suspends it to
+    the next, so the gaps between its steps are the time it spent waiting.
+    """
+    def __init__(self, name: str):
+        """
+        :param name: The name of the task's coroutine function.
+        """
+        self.name = name
+        self.created = time.perf_counter()
+        # (started, ended) of each step, in order.
+        self.steps = []
+        self.finished = None
+
+
+class TimedCoroutine(collections.abc.Coroutine):
+    """A coroutine that records each step of another coroutine on a TaskTimeline."""
+    def __init__(self, coroutine, task_timeline: TaskTimeline):
+        """
+        :param coroutine: The coroutine to run.
+        :param task_timeline: The TaskTimeline to record its steps on.
+        """
+        self.coroutine = coroutine
+        self.task_timeline = task_timeline
+
+    def send(self, value):
+        return self._step(self.coroutine.send, value)
+
+    def throw(self, *args):
+        return self._step(self.coroutine.throw, *args)
+
+    def close(self):
+        return self.coroutine.close()
+
+    def __await__(self):
+        return self.coroutine.__await__()
+
+    def _step(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except BaseException:
+            # A coroutine ends by raising StopIteration with its result, or by raising its exception.
+            self.task_timeline.finished = time.perf_counter()
+            raise
+        finally:
+            self.task_timeline.steps.append((started, time.perf_counter()))
+
+
+class CProfileProfiler:
+    """Profiles every function call made by the main process with cProfile."""
+    def __init__(self, filepath: Path):
+        """
+        :param filepath: The path to write the profile to.
+        """
+        self.filepath = filepath
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+        self.profile.dump_stats(self.filepath)
+
+
+class TimelineProfiler:
+    """Records when each asyncio task of the event loop was running, and when it was waiting."""
+    def __init__(self, filepath: Path):
+        """
+        :param filepath: The path to write the speedscope profile to.
+        """
+        self.filepath = filepath
+        self.loop = None
+        self.previous_task_factory = None
+        self.started = None
+        self.ended = None
+        self.task_timelines = []
+
+    def start(self) -> None:
+        self.loop = asyncio.get_event_loop()
+        self.previous_task_factory = self.loop.get_task_factory()
+        self.loop.set_task_factory(self.create_task)
+        self.started = time.perf_counter()
+
+    def create_task(self, loop: asyncio.AbstractEventLoop, coroutine, **kwargs) -> asyncio.Task:
+        """The task factory of the event loop while it is profiled.
+
+        :param loop: The event loop.
+        :param coroutine: The coroutine the task runs.
+        :param kwargs: The other keyword arguments for the Task.
+        :return: A Task that runs the coroutine, recording each of its steps.
+        """
+        name = getattr(coroutine, "__qualname__", type(coroutine).__qualname__)
+        task_timeline = TaskTimeline(name)
+        self.task_timelines.append(task_timeline)
+        return asyncio.Task(TimedCoroutine(coroutine, task_timeline), loop=loop, **kwargs)
+
+    def stop(self) -> None:
+        self.ended = time.perf_counter()
+        self.loop.set_task_factory(self.previous_task_factory)
+        with open(self.filepath, "w", encoding="utf-8") as profile_file:
+            json.dump(self.to_speedscope(), profile_file)
+
+    def to_speedscope(self) -> dict:
+        """
+        :return: The timeline in speedscope's file format, with one evented profile per task. Each task's profile is
+            split into the frames "running" and "waiting", under a frame for its coroutine function.
+        """
+        frame_indexes = {RUNNING: 0, WAITING: 1}
+        profiles = []
+        for task_index, task_timeline in enumerate(self.task_timelines):
+            task_frame = frame_indexes.setdefault(task_timeline.name, len(frame_indexes))
+            # A task still unfinished at the end of the run was waiting until then.
+            finished = task_timeline.finished or self.ended
+            events = [{"type": "O", "frame": task_frame, "at": task_timeline.created}]
+            waiting_since = task_timeline.created
+            for started, ended in task_timeline.steps:
+                if started > waiting_since:
+                    events.append({"type": "O", "frame": frame_indexes[WAITING], "at": waiting_since})
+                    events.append({"type": "C", "frame": frame_indexes[WAITING], "at": started})
+                events.append({"type": "O", "frame": frame_indexes[RUNNING], "at": started})
+                events.append({"type": "C", "frame": frame_indexes[RUNNING], "at": ended})
+                waiting_since = ended
+            if finished > waiting_since:
+                events.append({"type": "O", "frame": frame_indexes[WAITING], "at": waiting_since})
+                events.append({"type": "C", "frame": frame_indexes[WAITING], "at": finished})
+            events.append({"type": "C", "frame": task_frame, "at": max(finished, waiting_since)})
+            for event in events:
+                event["at"] -= self.started
+            profiles.append({
+                "type": "evented",
+                "name": f"{task_timeline.name} #{task_index}",
+                "unit": "seconds",
+                "startValue": events[0]["at"],
+                "endValue": events[-1]["at"],
+                "events": events,
+            })
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": "ffxiv_automated_collectible_tracker",
+            "exporter": "ffxiv_automated_collectible_tracker.profiling",
+            "shared": {"frames": [{"name": name} for name in frame_indexes]},
+            "profiles": profiles,
+        }
+
+
+def start_profile(filepath: str, profile_format: str = CPROFILE) -> None:
+    """Start profiling everything that runs until stop_profile() is called.
+
+    :param filepath: The path to write the profile to.
+    :param profile_format: CPROFILE for a cProfile profile, for snakeviz. TIMELINE for a timeline of each asyncio task,
+        for speedscope. A timeline only covers event loops run with asyncio.get_event_loop().
+    :return: None
+    """
+    global active_profiler
+    profiler_class = {CPROFILE: CProfileProfiler, TIMELINE: TimelineProfiler}[profile_format]
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    active_profiler = profiler_class(filepath)
+    active_profiler.start()
+
+
+def stop_profile() -> None:
+    """Stop profiling, and write the profile started by start_profile() to its file."""
+    global active_profiler
+    if active_profiler is None:
+        return
+    active_profiler.stop()
+    logger.info(f"Wrote profile to '{active_profiler.filepath}'.")
+    active_profiler = None
@@ -0,0 +1,298 @@
+"""Rate limiting and retrying, shared by the Lodestone and Google Sheets clients.
+Both services answer too many requests with HTTP 429, so every call goes through a token bucket for its host, and is
+retried with exponential backoff when it fails in a way that is worth retrying.
+"""
+import asyncio
+import contextlib
+import email.utils
+import logging
+import random
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+# HTTP statuses that mean "try again later", rather than "this request is wrong".
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_INITIAL_CONCURRENCY = 10
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 32
+# How much to cut the concurrency limit by when the host is struggling.
+DEFAULT_DECREASE_FACTOR = 0.5
+# A response slower than this multiple of the usual latency counts as a sign the host is struggling.
+DEFAULT_LATENCY_TOLERANCE = 2.0
+# How quickly the usual latency follows the latest responses, between 0 and 1.
+LATENCY_SMOOTHING = 0.1
+
+
+class TokenBucket:
+    """Allow a steady rate of calls, with short bursts up to a set capacity."""
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: The number of calls allowed per second, on average.
+        :param capacity: The most calls that can be made at once, after a quiet period.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = None
+        self.lock_loop = None
+
+    def set_rate(self, rate: float, capacity: float) -> None:
+        """Change the rate and capacity of the bucket, keeping the tokens it has built up, up to the new capacity.
+
+        :param rate: The number of calls allowed per second, on average.
+        :param capacity: The most calls that can be made at once, after a quiet period.
+        :return: None
+        """
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.rate = rate
+        self.capacity = capacity
+
+    async def acquire(self) -> None:
+        """Wait until a call is allowed, and use up a token for it."""
+        # A bucket can outlive its event loop, for example between the runs of a test suite, and a lock only works on
+        # the loop it was first used on.
+        loop = asyncio.get_running_loop()
+        if self.lock is None or self.lock_loop is not loop:
+            self.lock = asyncio.Lock()
+            self.lock_loop = loop
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Stop every caller of this bucket for a while, for example when the host has asked for a break.
+
+        :param seconds: How long to pause for.
+        :return: None
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limit the number of calls in flight, finding the most the host can sustain by additive increase, multiplicative
+    decrease (AIMD).
+    Every fast, successful call made at the limit raises it a little, so it grows by about one per round of calls. A
+    call that was throttled, failed with a server error, or was much slower than usual cuts the limit by a factor.
+    """
+    def __init__(
+        self,
+        initial_limit: float = DEFAULT_INITIAL_CONCURRENCY,
+        min_limit: float = DEFAULT_MIN_CONCURRENCY,
+        max_limit: float = DEFAULT_MAX_CONCURRENCY,
+        decrease_factor: float = DEFAULT_DECREASE_FACTOR,
+        latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+    ):
+        """
+        :param initial_limit: The number of calls allowed in flight at the start.
+        :param min_limit: The fewest calls the limit can be cut to.
+        :param max_limit: The most calls the limit can be raised to.
+        :param decrease_factor: What to multiply the limit by when the host is struggling.
+        :param latency_tolerance: How many times slower than usual a call can be before it counts as a struggle.
+        """
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.usual_latency = None
+        self.last_decrease = 0.0
+        self.condition = None
+
+    async def acquire(self) -> None:
+        """Wait until there is room under the limit for another call."""
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float = None, overloaded: bool = False) -> None:
+        """Give back the room taken by a call, adjusting the limit by how the call went.
+
+        :param latency: How long the call took, in seconds, or None if it did not finish.
+        :param overloaded: Boolean. The call failed in a way that shows the host is struggling.
+        :return: None
+        """
+        async with self.condition:
+            # Only a limit that is actually being reached has shown that it can go higher.
+            limit_reached = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if overloaded:
+                self._decrease("the host is overloaded")
+            elif latency is not None:
+                if self.usual_latency is None:
+                    self.usual_latency = latency
+                slow = latency > self.usual_latency * self.latency_tolerance
+                self.usual_latency += LATENCY_SMOOTHING * (latency - self.usual_latency)
+                if slow:
+                    self._decrease(f"a call took {latency:.2f}s")
+                elif limit_reached:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def _decrease(self, reason: str) -> None:
+        """Cut the limit, unless it was already cut within the last round of calls.
+        Calls already in flight when the host started struggling will all report it, but only deserve one cut.
+
+        :param reason: Why the limit is being cut, for the logs.
+        :return: None
+        """
+        now = time.monotonic()
+        if now - self.last_decrease < (self.usual_latency or 0):
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        logger.info(f"Cutting concurrency to {int(self.limit)} because {reason}.")
+
+    @contextlib.asynccontextmanager
+    async def slot(self, is_overloaded=None):
+        """Hold room under the limit for the duration of a call, and report how it went on the way out.
+
+        :param is_overloaded: A function that takes an exception raised by the call, and returns whether it shows the
+            host is struggling.
+        :return: An async context manager.
+        """
+        await self.acquire()
+        start = time.monotonic()
+        latency = None
+        overloaded = False
+        try:
+            yield
+            latency = time.monotonic() - start
+        except Exception as e:
+            overloaded = is_overloaded is not None and is_overloaded(e)
+            if not overloaded:
+                # The host answered, just not with what was wanted, so the call still says how fast it is.
+                latency = time.monotonic() - start
+            raise e
+        finally:
+            await self.release(latency, overloaded)
+
+
+# One bucket per host, shared by every client talking to that host.
+_rate_limiters = {}
+
+
+def get_rate_limiter(host: str, rate: float, capacity: float) -> TokenBucket:
+    """Get the token bucket for a host, creating it if this is the first call for that host.
+    A bucket that already exists is changed to the given rate and capacity, so the latest client to ask sets the limit.
+
+    :param host: The host name.
+    :param rate: The number of calls allowed per second.
+    :param capacity: The most calls that can be made at once.
+    :return: The TokenBucket for the host.
+    """
+    rate_limiter = _rate_limiters.get(host)
+    if rate_limiter is None:
+        rate_limiter = _rate_limiters[host] = TokenBucket(rate, capacity)
+    elif (rate_limiter.rate, rate_limiter.capacity) != (rate, capacity):
+        logger.debug(f"Changing the rate limit for '{host}' to {rate}/s, with bursts of {capacity}.")
+        rate_limiter.set_rate(rate, capacity)
+    return rate_limiter
+
+
+def parse_retry_after(retry_after: str) -> float:
+    """Parse a Retry-After header, which can be either a number of seconds or an HTTP date.
+
+    :param retry_after: The value of the header, or None.
+    :return: The number of seconds to wait, or None if there was no usable header.
+    """
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After, up to a maximum number of attempts."""
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ):
+        """
+        :param max_attempts: The most times to try a call, including the first.
+        :param base_delay: The longest wait, in seconds, before the first retry.
+        :param max_delay: The longest wait, in seconds, before any retry.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, retry_after: float = None) -> float:
+        """Work out how long to wait before the next attempt.
+
+        :param attempt: The number of the attempt that just failed, starting at 1.
+        :param retry_after: The number of seconds the server asked for, if it asked.
+        :return: The number of seconds to wait.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def call(
+        self,
+        function,
+        get_retry_info,
+        rate_limiter: TokenBucket = None,
+        description: str = "",
+        on_retry=None,
+    ):
+        """Call an async function, retrying it while it fails in a retryable way.
+
+        :param function: An async function that takes no arguments.
+        :param get_retry_info: A function that takes an exception raised by the function, and returns a tuple of
+            whether it is worth retrying, and the Retry-After delay in seconds if the server gave one.
+        :param rate_limiter: The TokenBucket to wait on before every attempt.
+        :param description: A description of the call for the logs.
+        :param on_retry: A function that takes the exception that is about to be retried, called before every retry.
+        :return: The result of the function.
+        """
+        attempt = 1
+        while True:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                return await function()
+            except Exception as e:
+                retryable, retry_after = get_retry_info(e)
+                if not retryable or attempt >= self.max_attempts:
+                    raise e
+                delay = self.get_delay(attempt, retry_after)
+                if retry_after is not None and rate_limiter is not None:
+                    # The server's limit applies to every caller, not just this one.
+                    rate_limiter.pause(delay)
+                logger.info(f"Attempt {attempt} of {description} failed with {e!r}. Retrying in {delay:.1f}s...")
+                if on_retry is not None:
+                    on_retry(e)
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -0,0 +1,116 @@
+"""Decide which characters are worth fetching from the Lodestone again, and which can be served from the store.
+A character is refreshed once their details are older than a time to live (TTL). Every fetch that finds nothing new
+multiplies the TTL by a backoff factor, up to a maximum, so inactive characters are fetched less and less often, and
+go back to the base TTL as soon as a fetch finds a change.
+"""
+import logging
+import time
+
+from ffxiv_automated_collectible_tracker.store import CollectionStore
+
+
+logger = logging.getLogger(__name__)
+
+
+# Hours. A TTL of 0 refreshes every character on every run.
+DEFAULT_REFRESH_TTL = 0.0
+DEFAULT_MAX_REFRESH_TTL = 24.0 * 30
+DEFAULT_REFRESH_BACKOFF = 2.0
+
+SECONDS_PER_HOUR = 60 * 60
+
+
+class RefreshScheduler:
+    """Work out when each character is next due a refresh, from their history in the collection store."""
+    def __init__(
+        self,
+        collection_store: CollectionStore,
+        ttl: float = DEFAULT_REFRESH_TTL,
+        max_ttl: float = DEFAULT_MAX_REFRESH_TTL,
+        backoff: float = DEFAULT_REFRESH_BACKOFF,
+    ):
+        """
+        :param collection_store: The CollectionStore holding every character's fetch history.
+        :param ttl: How many hours a character's details stay fresh, while they are changing.
+        :param max_ttl: The most hours a character's details stay fresh, however long they have gone without changing.
+        :param backoff: What to multiply the TTL by for every fetch in a row that found nothing new.
+        """
+        self.collection_store = collection_store
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.backoff = backoff
+
+    def get_refresh_interval(self, unchanged_fetches: int) -> float:
+        """Work out how long a character's details stay fresh.
+
+        :param unchanged_fetches: The number of fetches in a row that found nothing new.
+        :return: The number of seconds the details stay fresh for.
+        """
+        if not self.ttl:
+            return 0.0
+        # Capping the exponent keeps the power from overflowing for characters that never change.
+        ttl = self.ttl * self.backoff ** min(unchanged_fetches, 64)
+        return min(ttl, max(self.ttl, self.max_ttl)) * SECONDS_PER_HOUR
+
+    def get_next_refreshes(self, characters_list: [str], required_keys: [str] = ()) -> {str: float}:
+        """Work out when each of a list of characters is next due a refresh.
+
+        :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+        :param required_keys: The keys the characters' details need to have, such as "Mounts". A character whose
+            stored details are missing one is due now, unless they were not found on the Lodestone.
+        :return: A dictionary of each character to the UNIX timestamp they are due at. 0 for a character who has never
+            been fetched.
+        """
+        refresh_states = self.collection_store.get_refresh_states(characters_list)
+        next_refreshes = {}
+        for char_and_world in characters_list:
+            last_fetched_at, unchanged_fetches, stored_keys = refresh_states.get(char_and_world, (None, 0, set()))
+            if last_fetched_at is None:
+                next_refreshes[char_and_world] = 0.0
+            elif stored_keys is not None and any(required_key not in stored_keys for required_key in required_keys):
+                next_refreshes[char_and_world] = 0.0
+            else:
+                next_refreshes[char_and_world] = last_fetched_at + self.get_refresh_interval(unchanged_fetches)
+        return next_refreshes
+
+    def get_next_refresh(self, char_and_world: str, required_keys: [str] = ()) -> float:
+        """Work out when a character is next due a refresh.
+
+        :param char_and_world: The character, in the form {name}@{world}.
+        :param required_keys: The keys the character's details need to have, such as "Mounts".
+        :return: The UNIX timestamp the character is due at. 0 if the character has never been fetched.
+        """
+        return self.get_next_refreshes([char_and_world], required_keys)[char_and_world]
+
+    def get_due_characters(self, characters_list: [str], required_keys: [str] = (), now: float = None) -> [str]:
+        """Get the characters that are due a refresh.
+
+        :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+        :param required_keys: The keys the character's details need to have, such as "Mounts".
+        :param now: The UNIX timestamp to check against. Defaults to now.
+        :return: The characters that are due, in the order they were listed.
+        """
+        if now is None:
+            now = time.time()
+        unique_characters = list(dict.fromkeys(characters_list))
+        next_refreshes = self.get_next_refreshes(unique_characters, required_keys)
+        due_characters = [
+            char_and_world for char_and_world in unique_characters if next_refreshes[char_and_world] <= now
+        ]
+        logger.info(
+            f"{len(due_characters)} of {len(unique_characters)} characters are due a refresh. "
+            f"Serving the rest from the collection store."
+        )
+        return due_characters
+
+    def get_next_due(self, characters_list: [str], required_keys: [str] = ()) -> float:
+        """Work out when the first of a list of characters is next due a refresh.
+
+        :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+        :param required_keys: The keys the character's details need to have, such as "Mounts".
+        :return: The earliest UNIX timestamp any of the characters is due at.
+        """
+        return min(
+            self.get_next_refreshes(list(dict.fromkeys(characters_list)), required_keys).values(),
+            default=float("inf"),
+        )
@@ -0,0 +1,734 @@
+"""Local stand-ins for the Lodestone and the Google Sheets API, so the performance of a run can be measured without
+touching either.
+The Lodestone pages are generated for a synthetic roster of characters, with the same markup the extractors read, and
+padded out to the weight of a real page. The Sheets API keeps its spreadsheets in memory, and understands the
+spreadsheets.get and spreadsheets.batchUpdate calls that GSheets makes. Both can be slowed down, and made to answer
+some requests with "Too Many Requests".
+Every request is counted, along with the bytes it sent and received, and the counts can be read from /standin/stats.
+
+The server can be run on its own with:
+    python -m ffxiv_automated_collectible_tracker.standin --roster-size 100
+"""
+import asyncio
+import click
+import hashlib
+import logging
+import random
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_ROSTER_SIZE = 100
+DEFAULT_MOUNTS_PER_CHARACTER = 30
+DEFAULT_ACHIEVEMENTS_PER_CHARACTER = 120
+DEFAULT_WORLD = "Phantom"
+DEFAULT_FC_NAME = "The Benchmark Company"
+# Seconds. Sent with every "Too Many Requests" response.
+DEFAULT_RETRY_AFTER = 1.0
+# Bytes of markup around the parts of a page the extractors read. Real Lodestone pages are mostly navigation, scripts,
+# and other characters' details, and BeautifulSoup still has to tokenise all of it.
+DEFAULT_PAGE_PADDING = 48 * 1024
+
+# How many of each kind of item exist, as a multiple of the number of that item each character has.
+ITEM_POOL_FACTOR = 4
+# The page sizes of the Lodestone's paged lists.
+ACHIEVEMENTS_PER_PAGE = 50
+FC_MEMBERS_PER_PAGE = 50
+FIRST_CHARACTER_ID = 30000000
+FC_ID = "9229001536389012345"
+DEFAULT_SHEET_NAME = "Sheet1"
+# Google rejects BatchUpdate payloads over 10MB.
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+
+CONTROL_PATH = "/standin"
+STATS_PATH = f"{CONTROL_PATH}/stats"
+RESET_PATH = f"{CONTROL_PATH}/reset"
+
+# Re-used Strings
+PROPERTIES = "properties"
+SHEETID = "sheetId"
+REQUESTS = "requests"
+THROTTLED = "throttled"
+BYTES_IN = "bytes_in"
+BYTES_OUT = "bytes_out"
+
+
+class SyntheticRoster:
+    """A made up Free Company of characters, with the mounts and achievements each of them has.
+    The same arguments always make the same roster, so a benchmark can build the roster that a stand-in server in
+    another process is serving.
+    """
+    def __init__(
+        self,
+        size: int = DEFAULT_ROSTER_SIZE,
+        mounts_per_character: int = DEFAULT_MOUNTS_PER_CHARACTER,
+        achievements_per_character: int = DEFAULT_ACHIEVEMENTS_PER_CHARACTER,
+        world: str = DEFAULT_WORLD,
+        fc_name: str = DEFAULT_FC_NAME,
+        seed: int = 0,
+    ):
+        """
+        :param size: The number of characters.
+        :param mounts_per_character: The number of mounts each character has.
+        :param achievements_per_character: The number of achievements each character has.
+        :param world: The name of the world every character is on.
+        :param fc_name: The name of the Free Company every character is in.
+        :param seed: The seed for choosing which items each character has.
+        """
+        rng = random.Random(seed)
+        self.world = world
+        self.fc_name = fc_name
+        self.mount_names = [f"Benchmark Mount {number}" for number in range(mounts_per_character * ITEM_POOL_FACTOR)]
+        self.achievement_names = [
+            f"Benchmark Achievement {number}" for number in range(achievements_per_character * ITEM_POOL_FACTOR)
+        ]
+        # Mount tooltips are keyed by a hash, like the Lodestone's.
+        self.mount_keys = {
+            hashlib.sha1(mount_name.encode("utf-8")).hexdigest(): mount_name for mount_name in self.mount_names
+        }
+        self.characters = {}
+        self.character_ids = {}
+        for number in range(size):
+            char_id = str(FIRST_CHARACTER_ID + number)
+            char_name = f"Tester{number:04d} Benchmark"
+            self.characters[char_id] = {
+                "Name": char_name,
+                "Mounts": rng.sample(self.mount_names, mounts_per_character),
+                # Newest first, as the Lodestone lists them.
+                "Achievements": rng.sample(self.achievement_names, achievements_per_character),
+            }
+            self.character_ids[char_name] = char_id
+
+    @property
+    def characters_list(self) -> [str]:
+        """
+        :return: Every character of the roster, in the form {name}@{world}.
+        """
+        return [f"{character['Name']}@{self.world}" for character in self.characters.values()]
+
+
+def _get_total_pages(item_count: int, items_per_page: int) -> int:
+    """
+    :param item_count: The number of items in a paged list.
+    :param items_per_page: The most items on a page of the list.
+    :return: The number of pages the list takes up.
+    """
+    return -(-item_count // items_per_page)
+
+
+def _get_pager(page: int, total_pages: int) -> str:
+    """
+    :param page: The number of the current page, starting at 1.
+    :param total_pages: The number of pages.
+    :return: The markup of the pager of a paged Lodestone list.
+    """
+    return (
+        '<ul class="btn__pager">'
+        '<li><a href="?page=1" class="btn__pager__prev--all js__tooltip"></a></li>'
+        f'<li class="btn__pager__current">Page {page} of {total_pages}</li>'
+        f'<li><a href="?page={total_pages}" class="btn__pager__next--all js__tooltip"></a></li>'
+        '</ul>'
+    )
+
+
+class InvalidRequest(Exception):
+    """A Sheets API request that the real API would reject with 400 Bad Request."""
+
+
+class StandInServer:
+    """An aiohttp server standing in for both the Lodestone and the Google Sheets API."""
+    def __init__(
+        self,
+        roster: SyntheticRoster,
+        latency: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = DEFAULT_RETRY_AFTER,
+        page_padding: int = DEFAULT_PAGE_PADDING,
+        seed: int = 0,
+    ):
+        """
+        :param roster: The characters to serve Lodestone pages for.
+        :param latency: How many seconds to wait before answering each request.
+        :param throttle_rate: The fraction of requests to answer with 429 Too Many Requests, between 0 and 1.
+        :param retry_after: The number of seconds to ask for in the Retry-After header of a 429, or None to leave the
+            header out.
+        :param page_padding: The bytes of markup to add to every Lodestone page, around the parts the extractors read.
+        :param seed: The seed for choosing which requests to throttle.
+        """
+        self.roster = roster
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        nav_item = '<li class="ldst-nav__item"><a href="/lodestone/topics/">Topics</a></li>'
+        self.padding = f'<ul class="ldst-nav">{nav_item * (page_padding // len(nav_item))}</ul>'
+        self.spreadsheets = {}
+        self.stats = {}
+        self.runner = None
+
+        self.app = web.Application(middlewares=[self.handle_request], client_max_size=MAX_REQUEST_BYTES)
+        lodestone_routes = (
+            ("/lodestone/character", self.character_search),
+            ("/lodestone/character/{char_id}/mount", self.mount_list),
+            ("/lodestone/character/{char_id}/mount/tooltip/{mount_key}", self.mount_tooltip),
+            ("/lodestone/character/{char_id}/achievement", self.achievement_page),
+            ("/lodestone/freecompany", self.fc_search),
+            ("/lodestone/freecompany/{fc_id}/member", self.fc_member_page),
+        )
+        for path, handler in lodestone_routes:
+            # The Lodestone answers with or without a trailing slash, and page links have one.
+            self.app.router.add_get(path, handler)
+            self.app.router.add_get(path + "/", handler)
+        self.app.router.add_get("/v4/spreadsheets/{spreadsheet_id:[^/:]+}", self.spreadsheets_get)
+        self.app.router.add_post("/v4/spreadsheets/{spreadsheet_id:[^/:]+}:batchUpdate", self.spreadsheets_batch_update)
+        self.app.router.add_get(STATS_PATH, self.get_stats)
+        self.app.router.add_post(RESET_PATH, self.reset)
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> str:
+        """Start serving.
+
+        :param host: The address to listen on.
+        :param port: The port to listen on. 0 picks any free port.
+        :return: The base URL of the server, such as "http://127.0.0.1:8080".
+        """
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_host, bound_port = self.runner.addresses[0][:2]
+        return f"http://{bound_host}:{bound_port}"
+
+    async def stop(self) -> None:
+        """Stop serving, and close every open connection."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    @web.middleware
+    async def handle_request(self, request: web.Request, handler) -> web.Response:
+        """Delay, throttle, and count every Lodestone and Sheets API request.
+
+        :param request: The request.
+        :param handler: The handler for the request's route.
+        :return: The response.
+        """
+        if request.path.startswith(CONTROL_PATH):
+            return await handler(request)
+        resource = request.match_info.route.resource
+        endpoint = f"{request.method} {resource.canonical.rstrip('/') if resource is not None else request.path}"
+        request_body = await request.read()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint_stats = self.stats.setdefault(endpoint, {REQUESTS: 0, THROTTLED: 0, BYTES_IN: 0, BYTES_OUT: 0})
+        if self.throttle_rate and self.rng.random() < self.throttle_rate:
+            endpoint_stats[THROTTLED] += 1
+            response = self.too_many_requests(request)
+        else:
+            try:
+                response = await handler(request)
+            except web.HTTPException as e:
+                response = web.Response(status=e.status, text=e.text, headers=e.headers)
+        endpoint_stats[REQUESTS] += 1
+        endpoint_stats[BYTES_IN] += len(request_body)
+        endpoint_stats[BYTES_OUT] += len(response.body or b"")
+        return response
+
+    def too_many_requests(self, request: web.Request) -> web.Response:
+        """
+        :param request: The request being throttled.
+        :return: A 429 response, in the format of whichever service the request was for.
+        """
+        headers = {} if self.retry_after is None else {"Retry-After": f"{self.retry_after:g}"}
+        if request.path.startswith("/v4/"):
+            return self._sheets_error(429, "Quota exceeded.", "RESOURCE_EXHAUSTED", headers)
+        return web.Response(status=429, text="Too Many Requests", headers=headers)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        """
+        :param request: The request.
+        :return: The counts of requests, throttled requests, and bytes in and out, for every endpoint.
+        """
+        return web.json_response(self.stats)
+
+    async def reset(self, request: web.Request) -> web.Response:
+        """Zero the counts. With ?spreadsheets=true, also forget every spreadsheet.
+
+        :param request: The request.
+        :return: An empty response.
+        """
+        self.stats = {}
+        if request.query.get("spreadsheets") == "true":
+            self.spreadsheets = {}
+        return web.json_response({})
+
+    # Lodestone
+
+    def _page(self, content: str) -> web.Response:
+        """
+        :param content: The markup the extractors read.
+        :return: A Lodestone page, with the content inside its main window.
+        """
+        return web.Response(
+            text=(
+                '<!DOCTYPE html><html lang="en-gb"><head><title>The Lodestone</title></head><body>'
+                f'<header>{self.padding}</header>'
+                f'<div class="ldst__contents"><div class="ldst__main"><div class="ldst__window">{content}</div></div>'
+                '</div></body></html>'
+            ),
+            content_type="text/html",
+        )
+
+    def _get_character(self, request: web.Request) -> dict:
+        """
+        :param request: A request for one of a character's pages.
+        :return: The character from the roster.
+        :raises web.HTTPNotFound: If there is no such character.
+        """
+        character = self.roster.characters.get(request.match_info["char_id"])
+        if character is None:
+            raise web.HTTPNotFound(text="Not Found")
+        return character
+
+    async def character_search(self, request: web.Request) -> web.Response:
+        """
+        :param request: A character search, with the name in quotes as "q", and the world as "worldname".
+        :return: A page of results, with the character if they are in the roster.
+        """
+        char_name = request.query.get("q", "").strip('"')
+        char_id = self.roster.character_ids.get(char_name)
+        entries = ""
+        if char_id is not None and request.query.get("worldname") in (None, self.roster.world):
+            entries = (
+                f'<div class="entry"><a href="/lodestone/character/{char_id}/" class="entry__link">'
+                '<div class="entry__chara__face"><img src="" alt=""></div>'
+                f'<div class="entry__box entry__box--world"><p class="entry__name">{char_name}</p>'
+                f'<p class="entry__world">{self.roster.world} [Chaos]</p></div></a></div>'
+            )
+        return self._page(entries)
+
+    async def mount_list(self, request: web.Request) -> web.Response:
+        """
+        :param request: A request for a character's mount page.
+        :return: The page, with a tooltip link for each of the character's mounts.
+        """
+        char_id = request.match_info["char_id"]
+        character = self._get_character(request)
+        mount_keys = {mount_name: mount_key for mount_key, mount_name in self.roster.mount_keys.items()}
+        entries = "".join(
+            f'<li class="mount__list_icon js__tooltip" '
+            f'data-tooltip_href="/lodestone/character/{char_id}/mount/tooltip/{mount_keys[mount_name]}">'
+            '<img src="" width="40" height="40" alt=""></li>'
+            for mount_name in character["Mounts"]
+        )
+        return self._page(f'<ul class="mount__list">{entries}</ul>')
+
+    async def mount_tooltip(self, request: web.Request) -> web.Response:
+        """
+        :param request: A request for a mount tooltip.
+        :return: The tooltip, with the name of the mount.
+        """
+        self._get_character(request)
+        mount_name = self.roster.mount_keys.get(request.match_info["mount_key"])
+        if mount_name is None:
+            raise web.HTTPNotFound(text="Not Found")
+        # Tooltips are fragments, not whole pages.
+        return web.Response(
+            text=f'<div class="mount__header"><h4 class="mount__name">{mount_name}</h4></div>',
+            content_type="text/html",
+        )
+
+    async def achievement_page(self, request: web.Request) -> web.Response:
+        """
+        :param request: A request for a page of a character's achievements, with the page number as "page".
+        :return: The page of achievements, newest first, with a pager.
+        """
+        character = self._get_character(request)
+        achievements = character["Achievements"]
+        total_pages = _get_total_pages(len(achievements), ACHIEVEMENTS_PER_PAGE)
+        page = int(request.query.get("page", 1))
+        page_achievements = achievements[(page - 1) * ACHIEVEMENTS_PER_PAGE:page * ACHIEVEMENTS_PER_PAGE]
+        entries = "".join(
+            '<li class="entry"><div class="entry__achievement"><div class="entry__activity">'
+            f'<p class="entry__activity__txt">{character["Name"]} earned the achievement "{achievement}" earned!</p>'
+            '<time class="entry__activity__time"></time></div></div></li>'
+            for achievement in page_achievements
+        )
+        pager = _get_pager(page, total_pages) if total_pages else ""
+        return self._page(f'<ul class="ldst__achievement">{entries}</ul>{pager}')
+
+    async def fc_search(self, request: web.Request) -> web.Response:
+        """
+        :param request: A Free Company search, with the name as "q", and the world as "worldname".
+        :return: A page of results, with the roster's Free Company if it matches.
+        """
+        entries = ""
+        in_world = request.query.get("worldname") in (None, self.roster.world)
+        if request.query.get("q") == self.roster.fc_name and in_world:
+            entries = (
+                f'<div class="entry"><a href="/lodestone/freecompany/{FC_ID}/" class="entry__block">'
+                f'<div class="entry__freecompany__box"><p class="entry__name">{self.roster.fc_name}</p>'
+                f'<p class="entry__world">{self.roster.world} [Chaos]</p></div></a></div>'
+            )
+        return self._page(entries)
+
+    async def fc_member_page(self, request: web.Request) -> web.Response:
+        """
+        :param request: A request for a page of the Free Company's members, with the page number as "page".
+        :return: The page of members, with a pager.
+        """
+        if request.match_info["fc_id"] != FC_ID:
+            raise web.HTTPNotFound(text="Not Found")
+        members = list(self.roster.characters.items())
+        total_pages = _get_total_pages(len(members), FC_MEMBERS_PER_PAGE)
+        page = int(request.query.get("page", 1))
+        entries = "".join(
+            f'<li class="entry"><a href="/lodestone/character/{char_id}/" class="entry__bind">'
+            '<div class="entry__chara__face"><img src="" alt=""></div>'
+            f'<div class="entry__freecompany__center"><p class="entry__name">{character["Name"]}</p>'
+            '<ul class="entry__freecompany__info"><li><span>Member</span></li></ul></div></a></li>'
+            for char_id, character in members[(page - 1) * FC_MEMBERS_PER_PAGE:page * FC_MEMBERS_PER_PAGE]
+        )
+        return self._page(f'<ul>{entries}</ul>{_get_pager(page, total_pages)}')
+
+    # Google Sheets
+
+    @staticmethod
+    def _sheets_error(status: int, message: str, status_name: str, headers: dict = None) -> web.Response:
+        """
+        :param status: The HTTP status.
+        :param message: What went wrong.
+        :param status_name: The Google name of the status, such as "INVALID_ARGUMENT".
+        :param headers: Any headers to add to the response.
+        :return: An error response, in the format of the Google APIs.
+        """
+        return web.json_response(
+            {"error": {"code": status, "message": message, "status": status_name}}, status=status, headers=headers
+        )
+
+    def _get_spreadsheet(self, spreadsheet_id: str) -> dict:
+        """Get a spreadsheet, creating it with a single blank sheet if this is the first request for it.
+
+        :param spreadsheet_id: The ID of the spreadsheet.
+        :return: The spreadsheet.
+        """
+        if spreadsheet_id not in self.spreadsheets:
+            self.spreadsheets[spreadsheet_id] = {"sheets": [self._new_sheet(0, DEFAULT_SHEET_NAME)]}
+        return self.spreadsheets[spreadsheet_id]
+
+    @staticmethod
+    def _new_sheet(sheet_id: int, title: str) -> dict:
+        """
+        :param sheet_id: The ID of the sheet.
+        :param title: The name of the sheet.
+        :return: A blank sheet. Its cells are kept by (row index, column index).
+        """
+        return {
+            PROPERTIES: {
+                SHEETID: sheet_id,
+                "title": title,
+                "index": 0,
+                "sheetType": "GRID",
+                "gridProperties": {"rowCount": 1000, "columnCount": 26},
+            },
+            "conditionalFormats": [],
+            "cells": {},
+        }
+
+    @staticmethod
+    def _get_sheet(spreadsheet: dict, sheet_id: int) -> dict:
+        """
+        :param spreadsheet: The spreadsheet.
+        :param sheet_id: The ID of one of its sheets.
+        :return: The sheet.
+        :raises InvalidRequest: If there is no such sheet.
+        """
+        for sheet in spreadsheet["sheets"]:
+            if sheet[PROPERTIES][SHEETID] == sheet_id:
+                return sheet
+        raise InvalidRequest(f"No grid with id: {sheet_id}")
+
+    @staticmethod
+    def _render_cell(cell: dict) -> dict:
+        """
+        :param cell: A stored cell.
+        :return: The cell as the API returns it, with the value it shows.
+        """
+        rendered_cell = dict(cell)
+        value = dict(cell.get("userEnteredValue", {}))
+        if "formulaValue" in value:
+            value = {"stringValue": value["formulaValue"]}
+        if value:
+            rendered_cell["effectiveValue"] = value
+        return rendered_cell
+
+    def _render_sheet(self, sheet: dict, include_grid_data: bool) -> dict:
+        """
+        :param sheet: A stored sheet.
+        :param include_grid_data: Boolean. Include the sheet's cells.
+        :return: The sheet as the API returns it.
+        """
+        rendered_sheet = {PROPERTIES: sheet[PROPERTIES]}
+        if sheet["conditionalFormats"]:
+            rendered_sheet["conditionalFormats"] = sheet["conditionalFormats"]
+        if include_grid_data:
+            cells = sheet["cells"]
+            row_count = max((row_index for row_index, _ in cells), default=-1) + 1
+            column_counts = {}
+            for row_index, col_index in cells:
+                column_counts[row_index] = max(column_counts.get(row_index, 0), col_index + 1)
+            grid_data = {}
+            if row_count:
+                grid_data["rowData"] = [
+                    {"values": [
+                        self._render_cell(cells.get((row_index, col_index), {}))
+                        for col_index in range(column_counts[row_index])
+                    ]} if row_index in column_counts else {}
+                    for row_index in range(row_count)
+                ]
+            rendered_sheet["data"] = [grid_data]
+        return rendered_sheet
+
+    async def spreadsheets_get(self, request: web.Request) -> web.Response:
+        """spreadsheets.get. The "fields" mask is ignored, so every field is always returned.
+
+        :param request: The request, with the "ranges" and "includeGridData" query parameters.
+        :return: The spreadsheet.
+        """
+        spreadsheet_id = request.match_info["spreadsheet_id"]
+        spreadsheet = self._get_spreadsheet(spreadsheet_id)
+        sheets = spreadsheet["sheets"]
+        ranges = request.query.getall("ranges", [])
+        if ranges:
+            sheets_by_title = {sheet[PROPERTIES]["title"]: sheet for sheet in sheets}
+            sheets = []
+            for sheet_range in ranges:
+                # Only whole sheet ranges, such as 'Sheet1', are used by GSheets.
+                title = sheet_range.split("!")[0].strip("'")
+                if title not in sheets_by_title:
+                    return self._sheets_error(400, f"Unable to parse range: {sheet_range}", "INVALID_ARGUMENT")
+                sheets.append(sheets_by_title[title])
+        include_grid_data = request.query.get("includeGridData") == "true"
+        return web.json_response({
+            "spreadsheetId": spreadsheet_id,
+            "sheets": [self._render_sheet(sheet, include_grid_data) for sheet in sheets],
+        })
+
+    async def spreadsheets_batch_update(self, request: web.Request) -> web.Response:
+        """spreadsheets.batchUpdate, for the request types that GSheets makes.
+
+        :param request: The request, with the BatchUpdate JSON as its body.
+        :return: A reply for each request, or a 400 error for the first request that the real API would reject.
+        """
+        spreadsheet_id = request.match_info["spreadsheet_id"]
+        spreadsheet = self._get_spreadsheet(spreadsheet_id)
+        body = await request.json()
+        request_handlers = {
+            "addSheet": self._add_sheet,
+            "deleteSheet": self._delete_sheet,
+            "updateSheetProperties": self._update_sheet_properties,
+            "addConditionalFormatRule": self._add_conditional_format_rule,
+            "deleteConditionalFormatRule": self._delete_conditional_format_rule,
+            "updateCells": self._update_cells,
+            # Neither of these changes anything GSheets reads back.
+            "repeatCell": lambda spreadsheet, params: {},
+            "autoResizeDimensions": lambda spreadsheet, params: {},
+        }
+        replies = []
+        # Unlike the real API, the requests before one that fails are still applied.
+        for request_number, sheets_request in enumerate(body.get("requests", [])):
+            request_type, params = next(iter(sheets_request.items()))
+            if request_type not in request_handlers:
+                return self._sheets_error(400, f"Unsupported request type: {request_type}", "INVALID_ARGUMENT")
+            try:
+                replies.append(request_handlers[request_type](spreadsheet, params))
+            except (InvalidRequest, KeyError, IndexError, TypeError, ValueError) as e:
+                message = f"Invalid requests[{request_number}].{request_type}: {e}"
+                return self._sheets_error(400, message, "INVALID_ARGUMENT")
+        return web.json_response({"spreadsheetId": spreadsheet_id, "replies": replies})
+
+    @staticmethod
+    def _reindex_sheets(spreadsheet: dict) -> None:
+        """Number the sheets of a spreadsheet in the order they are in.
+
+        :param spreadsheet: The spreadsheet.
+        :return: None
+        """
+        for index, sheet in enumerate(spreadsheet["sheets"]):
+            sheet[PROPERTIES]["index"] = index
+
+    def _add_sheet(self, spreadsheet: dict, params: dict) -> dict:
+        """Add a sheet, at the end unless an index is given.
+
+        :param spreadsheet: The spreadsheet.
+        :param params: The parameters of the request.
+        :return: The reply to the request.
+        """
+        properties = params.get(PROPERTIES, {})
+        sheets = spreadsheet["sheets"]
+        title = properties.get("title", f"Sheet{len(sheets) + 1}")
+        if any(sheet[PROPERTIES]["title"] == title for sheet in sheets):
+            raise InvalidRequest(f'A sheet with the name "{title}" already exists. Please enter another name.')
+        sheet_id = properties.get(SHEETID, max(sheet[PROPERTIES][SHEETID] for sheet in sheets) + 1)
+        if any(sheet[PROPERTIES][SHEETID] == sheet_id for sheet in sheets):
+            raise InvalidRequest(f"A sheet with the id {sheet_id} already exists.")
+        sheet = self._new_sheet(sheet_id, title)
+        sheets.insert(properties.get("index", len(sheets)), sheet)
+        self._reindex_sheets(spreadsheet)
+        return {"addSheet": {PROPERTIES: sheet[PROPERTIES]}}
+
+    def _delete_sheet(self, spreadsheet: dict, params: dict) -> dict:
+        """Delete a sheet.
+
+        :param spreadsheet: The spreadsheet.
+        :param params: The parameters of the request.
+        :return: The reply to the request.
+        """
+        sheet = self._get_sheet(spreadsheet, params[SHEETID])
+        if len(spreadsheet["sheets"]) == 1:
+            raise InvalidRequest("You can't remove all the sheets in a document.")
+        spreadsheet["sheets"].remove(sheet)
+        self._reindex_sheets(spreadsheet)
+        return {}
+
+    def _update_sheet_properties(self, spreadsheet: dict, params: dict) -> dict:
+        """Change the properties of a sheet named by the request's field mask.
+
+        :param spreadsheet: The spreadsheet.
+        :param params: The parameters of the request.
+        :return: The reply to the request.
+        """
+        properties = params[PROPERTIES]
+        sheet = self._get_sheet(spreadsheet, properties[SHEETID])
+        for field in params["fields"].split(","):
+            if field == "index":
+                spreadsheet["sheets"].remove(sheet)
+                spreadsheet["sheets"].insert(properties.get("index", 0), sheet)
+                self._reindex_sheets(spreadsheet)
+                continue
+            *parent_keys, key = field.split(".")
+            source = properties
+            target = sheet[PROPERTIES]
+            for parent_key in parent_keys:
+                source = source.get(parent_key, {})
+                target = target.setdefault(parent_key, {})
+            if key in source:
+                target[key] = source[key]
+            else:
+                target.pop(key, None)
+        return {}
+
+    def _add_conditional_format_rule(self, spreadsheet: dict, params: dict) -> dict:
+        """Add a conditional formatting rule to the sheet of its first range.
+
+        :param spreadsheet: The spreadsheet.
+        :param params: The parameters of the request.
+        :return: The reply to the request.
+        """
+        rule = params["rule"]
+        sheet = self._get_sheet(spreadsheet, rule["ranges"][0][SHEETID])
+        sheet["conditionalFormats"].insert(params.get("index", 0), rule)
+        return {}
+
+    def _delete_conditional_format_rule(self, spreadsheet: dict, params: dict) -> dict:
+        """Delete a conditional formatting rule.
+
+        :param spreadsheet: The spreadsheet.
+        :param params: The parameters of the request.
+        :return: The reply to the request.
+        """
+        sheet = self._get_sheet(spreadsheet, params[SHEETID])
+        index = params.get("index", 0)
+        if index >= len(sheet["conditionalFormats"]):
+            raise InvalidRequest(f"No conditional format on sheet: {params[SHEETID]} at index: {index}")
+        return {"deleteConditionalFormatRule": {"rule": sheet["conditionalFormats"].pop(index)}}
+
+    def _update_cells(self, spreadsheet: dict, params: dict) -> dict:
+        """Write cells, starting at a cell, replacing the parts of each cell named by the field mask.
+
+        :param spreadsheet: The spreadsheet.
+        :param params: The parameters of the request.
+        :return: The reply to the request.
+        """
+        start = params["start"]
+        sheet = self._get_sheet(spreadsheet, start[SHEETID])
+        fields = params["fields"]
+        updated_keys = None if fields == "*" else {field.split(".")[0] for field in fields.split(",")}
+        for row_offset, row in enumerate(params.get("rows", [])):
+            for col_offset, cell in enumerate(row.get("values", [])):
+                position = (start.get("rowIndex", 0) + row_offset, start.get("columnIndex", 0) + col_offset)
+                if updated_keys is None:
+                    new_cell = dict(cell)
+                else:
+                    new_cell = dict(sheet["cells"].get(position, {}))
+                    for key in updated_keys:
+                        if key in cell:
+                            new_cell[key] = cell[key]
+                        else:
+                            new_cell.pop(key, None)
+                # The API drops empty values, so a cell written with "" reads back as having no value.
+                if new_cell.get("userEnteredValue") in ({}, {"stringValue": ""}):
+                    del new_cell["userEnteredValue"]
+                if new_cell:
+                    sheet["cells"][position] = new_cell
+                else:
+                    sheet["cells"].pop(position, None)
+        return {}
+
+
+@click.command()
+@click.option("--host", type=str, default=DEFAULT_HOST)
+@click.option("--port", type=click.IntRange(min=0), default=DEFAULT_PORT, help="0 picks any free port.")
+@click.option("--roster-size", type=click.IntRange(min=1), default=DEFAULT_ROSTER_SIZE)
+@click.option("--mounts-per-character", type=click.IntRange(min=0), default=DEFAULT_MOUNTS_PER_CHARACTER)
+@click.option("--achievements-per-character", type=click.IntRange(min=0), default=DEFAULT_ACHIEVEMENTS_PER_CHARACTER)
+@click.option(
+    "--latency",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    help="Seconds to wait before answering each request.",
+)
+@click.option(
+    "--throttle-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    help="The fraction of requests to answer with 429 Too Many Requests.",
+)
+@click.option("--retry-after", type=click.FloatRange(min=0), default=DEFAULT_RETRY_AFTER)
+@click.option("--page-padding", type=click.IntRange(min=0), default=DEFAULT_PAGE_PADDING)
+def main(
+    host,
+    port,
+    roster_size,
+    mounts_per_character,
+    achievements_per_character,
+    latency,
+    throttle_rate,
+    retry_after,
+    page_padding,
+):
+    """Serve a stand-in Lodestone and Google Sheets API for a synthetic roster, until stopped."""
+    roster = SyntheticRoster(roster_size, mounts_per_character, achievements_per_character)
+    server = StandInServer(roster, latency, throttle_rate, retry_after, page_padding)
+
+    async def serve():
+        base_url = await server.start(host, port)
+        # The first line of output is the base URL, for anything that started this in a subprocess.
+        click.echo(base_url)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""A local SQLite record of every character's collections, kept across runs.
+Every fetch from the Lodestone is recorded. A new snapshot of a character's details is only kept when they differ from
+the character's previous snapshot, so the history stays small while still answering "what changed since" locally.
+"""
+import json
+import logging
+import sqlite3
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_STORE_FILE = "collections.sqlite3"
+
+# The keys of the character details that hold collections, as made by lodestone.get_char_details().
+COLLECTION_KEYS = ("Mounts", "Achievements")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_id INTEGER PRIMARY KEY,
+    character TEXT NOT NULL,
+    taken_at REAL NOT NULL,
+    details TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_character_taken_at ON snapshots (character, taken_at);
+CREATE TABLE IF NOT EXISTS fetches (
+    character TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (snapshot_id)
+);
+CREATE INDEX IF NOT EXISTS fetches_character_fetched_at ON fetches (character, fetched_at);
+"""
+
+
+class CollectionStore:
+    """Every character's fetched details, keyed by {name}@{world}, with the history of how they have changed."""
+    def __init__(self, filepath: str):
+        """
+        :param filepath: The path to the SQLite database file. It is created on first use.
+        """
+        self.filepath = filepath
+        self.connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database, creating its tables if they do not exist yet.
+
+        :return: The open connection.
+        """
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.filepath)
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def close(self) -> None:
+        """Close the database, if it is open."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _get_latest_snapshot(self, char_and_world: str, before: float = None) -> (int, dict):
+        """Get a character's most recent snapshot.
+
+        :param char_and_world: The character, in the form {name}@{world}.
+        :param before: Only consider snapshots taken at or before this UNIX timestamp, if given.
+        :return: A tuple of the snapshot ID and the character's details, or (None, None) if there is no snapshot.
+        """
+        query = "SELECT snapshot_id, details FROM snapshots WHERE character = ?"
+        parameters = [char_and_world]
+        if before is not None:
+            query += " AND taken_at <= ?"
+            parameters.append(before)
+        query += " ORDER BY taken_at DESC, snapshot_id DESC LIMIT 1"
+        row = self.connect().execute(query, parameters).fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def record(self, char_and_world: str, character_details: dict, fetched_at: float = None) -> bool:
+        """Record a fetch of a character's details, keeping a new snapshot if they have changed.
+
+        :param char_and_world: The character, in the form {name}@{world}.
+        :param character_details: A dictionary of the character's lodestone details.
+        :param fetched_at: The UNIX timestamp of the fetch. Defaults to now.
+        :return: Boolean. The details differ from the character's previous snapshot.
+        """
+        if fetched_at is None:
+            fetched_at = time.time()
+        connection = self.connect()
+        with connection:
+            snapshot_id, latest_details = self._get_latest_snapshot(char_and_world)
+            changed = latest_details != character_details
+            if changed:
+                cursor = connection.execute(
+                    "INSERT INTO snapshots (character, taken_at, details) VALUES (?, ?, ?)",
+                    (char_and_world, fetched_at, json.dumps(character_details)),
+                )
+                snapshot_id = cursor.lastrowid
+            connection.execute(
+                "INSERT INTO fetches (character, fetched_at, snapshot_id) VALUES (?, ?, ?)",
+                (char_and_world, fetched_at, snapshot_id),
+            )
+        logger.debug(f"Recorded {'changed' if changed else 'unchanged'} details for '{char_and_world}'.")
+        return changed
+
+    def get_details(self, char_and_world: str, at: float = None) -> dict:
+        """Get a character's details, as last fetched.
+
+        :param char_and_world: The character, in the form {name}@{world}.
+        :param at: Get the details as they were at this UNIX timestamp, rather than now.
+        :return: A dictionary of the character's lodestone details, or None if they have never been fetched.
+        """
+        return self._get_latest_snapshot(char_and_world, before=at)[1]
+
+    def get_refresh_states(self, characters_list: [str]) -> {str: (float, int, set)}:
+        """Get when each of a list of characters was last fetched, how many fetches in a row since then have found
+        nothing new, and which collections their details hold, in a single query.
+
+        :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+        :return: A dictionary of each character that has been fetched to a tuple of the UNIX timestamp of the last
+            fetch, the number of fetches since the character's details last changed, and the set of collection keys
+            their details have. The set is None for a character who was not found on the Lodestone, and so has no
+            collections to hold.
+        """
+        key_columns = "".join(f", json_type(snapshots.details, '$.{key}') IS NOT NULL" for key in COLLECTION_KEYS)
+        rows = self.connect().execute(
+            "SELECT snapshots.character, MAX(fetches.fetched_at), COUNT(*), "
+            f"json_type(snapshots.details, '$.ID') = 'null'{key_columns} "
+            "FROM snapshots JOIN fetches ON fetches.snapshot_id = snapshots.snapshot_id "
+            "WHERE snapshots.character IN (SELECT value FROM json_each(?)) "
+            "AND snapshots.snapshot_id = ("
+            "SELECT latest.snapshot_id FROM snapshots AS latest WHERE latest.character = snapshots.character "
+            "ORDER BY latest.taken_at DESC, latest.snapshot_id DESC LIMIT 1"
+            ") GROUP BY snapshots.character",
+            (json.dumps(list(characters_list)),),
+        )
+        refresh_states = {}
+        for char_and_world, last_fetched_at, fetches_of_snapshot, not_found, *has_keys in rows:
+            stored_keys = None if not_found else {key for key, has_key in zip(COLLECTION_KEYS, has_keys) if has_key}
+            # The first fetch of a snapshot is the one that found the change.
+            refresh_states[char_and_world] = (last_fetched_at, fetches_of_snapshot - 1, stored_keys)
+        return refresh_states
+
+    def get_characters(self) -> [str]:
+        """Get every character that has ever been fetched.
+
+        :return: A list of characters, in the form {name}@{world}, in alphabetical order.
+        """
+        rows = self.connect().execute("SELECT DISTINCT character FROM snapshots ORDER BY character")
+        return [row[0] for row in rows]
+
+    def get_changes(self, char_and_world: str, since: float) -> {str: ([str], [str])}:
+        """Work out how a character's collections have changed since a point in time.
+        A character first fetched after that point counts as having gained everything they have.
+
+        :param char_and_world: The character, in the form {name}@{world}.
+        :param since: The UNIX timestamp to compare against.
+        :return: A dictionary of collection key to a tuple of the items gained and the items lost, in the order the
+            Lodestone lists them. Collections with no changes are left out.
+        """
+        then_details = self.get_details(char_and_world, at=since) or {}
+        now_details = self.get_details(char_and_world) or {}
+        changes = {}
+        for collection_key in COLLECTION_KEYS:
+            if collection_key not in now_details or (then_details and collection_key not in then_details):
+                # The collection was not fetched at one of the two points, so nothing is known about how it changed.
+                continue
+            then_items = then_details.get(collection_key) or []
+            now_items = now_details[collection_key] or []
+            then_items_set = set(then_items)
+            now_items_set = set(now_items)
+            gained = [item for item in now_items if item not in then_items_set]
+            lost = [item for item in then_items if item not in now_items_set]
+            if gained or lost:
+                changes[collection_key] = (gained, lost)
+        return changes
+
+
+collection_store = CollectionStore(DEFAULT_STORE_FILE)
+
+
+def set_store_file(filepath: str) -> None:
+    """Point the collection store at a different database file.
+
+    :param filepath: The path to the SQLite database file.
+    :return: None
+    """
+    global collection_store
+    collection_store.close()
+    collection_store = CollectionStore(filepath)
@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import pytest
+
+import ffxiv_automated_collectible_tracker.lodestone as lodestoneapi
+import ffxiv_automated_collectible_tracker.store as store
+from ffxiv_automated_collectible_tracker.cache import DEFAULT_CACHE_DIR
+from ffxiv_automated_collectible_tracker.ffxiv_gsheet_updater import ACHIEVEMENT, MOUNT, update_spreadsheets
+from ffxiv_automated_collectible_tracker.gsheets import GSheets
+from ffxiv_automated_collectible_tracker.journal import set_journal_dir
+from ffxiv_automated_collectible_tracker.standin import StandInServer, SyntheticRoster
+from ffxiv_automated_collectible_tracker.store import DEFAULT_STORE_FILE, set_store_file
+
+
+LODESTONE_WEBSITE_URL = "https://eu.finalfantasyxiv.com"
+SPREADSHEET_ID = "test-spreadsheet"
+# High enough that the rate limits never slow a test down.
+REQUESTS_PER_SECOND = 10000.0
+COLOURS = {
+    "ColourHeading": {"r": 255, "g": 178, "b": 253},
+    "ColourHasItem": {"r": 0, "g": 159, "b": 129},
+    "ColourNotItem": {"r": 226, "g": 1, "b": 52},
+    "ColourCharCol": {"r": 0, "g": 194, "b": 249},
+    "ColourAllItem": {"r": 0, "g": 141, "b": 249},
+}
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    """Keep the caches, run journal, and collection store in a temporary directory for the test."""
+    lodestoneapi.set_cache_dir(str(tmp_path))
+    set_journal_dir(str(tmp_path))
+    set_store_file(str(tmp_path / "collections.sqlite3"))
+    yield tmp_path
+    store.collection_store.close()
+    lodestoneapi.set_cache_dir(DEFAULT_CACHE_DIR)
+    lodestoneapi.set_lodestone_url(LODESTONE_WEBSITE_URL)
+    set_journal_dir(DEFAULT_CACHE_DIR)
+    set_store_file(DEFAULT_STORE_FILE)
+
+
+@pytest.fixture
+def roster():
+    return SyntheticRoster(size=3, mounts_per_character=2, achievements_per_character=2)
+
+
+def get_sheets_config(roster: SyntheticRoster) -> dict:
+    """
+    :param roster: The SyntheticRoster being served.
+    :return: A config with a sheet of every mount, and a sheet of every achievement, of the roster.
+    """
+    def get_headings(item_names: [str], item_type: str) -> [dict]:
+        return [{"DisplayName": item_name, "ItemName": item_name, "ItemType": item_type} for item_name in item_names]
+
+    return {
+        "Colours": COLOURS,
+        "HeadingsRow": 1,
+        "NamesColumn": "A",
+        "Spreadsheets": [{
+            "spreadsheetId": SPREADSHEET_ID,
+            "sheets": [
+                {"title": "Mounts", "Values": get_headings(roster.mount_names, MOUNT)},
+                {"title": "Achievements", "Values": get_headings(roster.achievement_names, ACHIEVEMENT)},
+            ],
+        }],
+    }
+
+
+@contextlib.asynccontextmanager
+async def serve_stand_in(server: StandInServer):
+    """Start a stand-in server, and point a LodestoneClient and a GSheets object at it.
+
+    :param server: The StandInServer to start.
+    :return: An async context manager of a tuple of the LodestoneClient and the GSheets object.
+    """
+    base_url = await server.start(port=0)
+    lodestoneapi.set_lodestone_url(base_url)
+    gsheets = GSheets(None, requests_per_second=REQUESTS_PER_SECOND, api_endpoint=base_url + "/")
+    try:
+        async with lodestoneapi.LodestoneClient(requests_per_second=REQUESTS_PER_SECOND) as lodestone_client:
+            yield lodestone_client, gsheets
+    finally:
+        gsheets.close()
+        await server.stop()
+
+
+def fill_sheet_data(server: StandInServer, sheets_config: dict, characters_list: [str], **kwargs) -> None:
+    """Run update_spreadsheets against a stand-in server, started for the run.
+
+    :param server: The StandInServer to run against.
+    :param sheets_config: The configuration dictionary for the Spreadsheets.
+    :param characters_list: A list of Final Fantasy XIV character names, in the form {name}@{world}.
+    :param kwargs: Any further keyword arguments for update_spreadsheets.
+    :return: None
+    """
+    async def run():
+        async with serve_stand_in(server) as (lodestone_client, gsheets):
+            await update_spreadsheets(lodestone_client, None, sheets_config, characters_list, gsheets=gsheets, **kwargs)
+
+    asyncio.run(run())
+
+
+def get_sheet_cells(server: StandInServer, sheet_title: str) -> dict:
+    """
+    :param server: The StandInServer the spreadsheet was filled in on.
+    :param sheet_title: The name of a sheet of the spreadsheet.
+    :return: The cells of the sheet, by (row index, column index).
+    """
+    for sheet in server.spreadsheets[SPREADSHEET_ID]["sheets"]:
+        if sheet["properties"]["title"] == sheet_title:
+            return sheet["cells"]
+    raise KeyError(sheet_title)
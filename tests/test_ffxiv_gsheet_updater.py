@@ -0,0 +1,221 @@
+import asyncio
+import pytest
+
+import ffxiv_automated_collectible_tracker.ffxiv_gsheet_updater as ffxiv_gsheet_updater
+import ffxiv_automated_collectible_tracker.lodestone as lodestoneapi
+import ffxiv_automated_collectible_tracker.store as store
+from ffxiv_automated_collectible_tracker.gsheets import rule_matches
+from ffxiv_automated_collectible_tracker.standin import ACHIEVEMENTS_PER_PAGE, REQUESTS, StandInServer, SyntheticRoster
+
+from conftest import SPREADSHEET_ID, fill_sheet_data, get_sheet_cells, get_sheets_config, serve_stand_in
+
+
+UNKNOWN_CHARACTER = "Nobody Atall@Phantom"
+FETCH_TASK_NAME = "iter_characters_details.<locals>.get_char_details"
+ACHIEVEMENT_PAGE_ENDPOINT = "GET /lodestone/character/{char_id}/achievement"
+
+
+def get_cell_value(cells: dict, row_index: int, col_index: int) -> str:
+    return cells.get((row_index, col_index), {}).get("userEnteredValue", {}).get("stringValue", "")
+
+
+def fill_sheet_data_again(
+    server: StandInServer, sheets_config: dict, characters_list: [str], **kwargs
+) -> StandInServer:
+    """Run update_spreadsheets again, on the spreadsheets left by an earlier run.
+    A server's application is bound to the event loop it first ran on, so each run needs a new one.
+
+    :return: The StandInServer the run was made against.
+    """
+    next_server = StandInServer(server.roster, page_padding=0)
+    next_server.spreadsheets = server.spreadsheets
+    fill_sheet_data(next_server, sheets_config, characters_list, **kwargs)
+    return next_server
+
+
+def get_sheet_ids(server: StandInServer) -> dict:
+    """
+    :return: The ID of each sheet of the spreadsheet, by name, in the order of the sheets.
+    """
+    sheets = sorted(server.spreadsheets[SPREADSHEET_ID]["sheets"], key=lambda sheet: sheet["properties"]["index"])
+    return {sheet["properties"]["title"]: sheet["properties"]["sheetId"] for sheet in sheets}
+
+
+def test_unknown_character_still_fills_sheet(work_dir, roster):
+    server = StandInServer(roster, page_padding=0)
+    characters_list = roster.characters_list[:1] + [UNKNOWN_CHARACTER] + roster.characters_list[1:]
+
+    fill_sheet_data(server, get_sheets_config(roster), characters_list)
+
+    mount_cells = get_sheet_cells(server, "Mounts")
+    for charnum, char_and_world in enumerate(characters_list, start=1):
+        assert mount_cells[(charnum, 0)]["note"] == char_and_world
+        values = [get_cell_value(mount_cells, charnum, col_index + 1) for col_index in range(len(roster.mount_names))]
+        if char_and_world == UNKNOWN_CHARACTER:
+            assert values == [""] * len(roster.mount_names)
+        else:
+            character = roster.characters[roster.character_ids[char_and_world.split("@")[0]]]
+            expected = ["Y" if mount_name in character["Mounts"] else "N" for mount_name in roster.mount_names]
+            assert values == expected
+
+
+def test_failed_run_cancels_fetches_in_flight(work_dir, roster, monkeypatch):
+    server = StandInServer(roster, latency=0.01, page_padding=0)
+
+    def fail_to_render(*args, **kwargs):
+        raise RuntimeError("Render failed.")
+
+    monkeypatch.setattr(ffxiv_gsheet_updater, "update_formatted_spreadsheet", fail_to_render)
+
+    async def run() -> list:
+        async with serve_stand_in(server) as (lodestone_client, gsheets):
+            with pytest.raises(RuntimeError):
+                await ffxiv_gsheet_updater.update_spreadsheets(
+                    lodestone_client,
+                    None,
+                    get_sheets_config(roster),
+                    roster.characters_list,
+                    max_concurrent_characters=1,
+                    gsheets=gsheets,
+                )
+            # Checked before the client is closed, which would make any fetch left running fail soon after.
+            return [
+                task for task in asyncio.all_tasks()
+                if not task.done() and task.get_coro().__qualname__ == FETCH_TASK_NAME
+            ]
+
+    assert asyncio.run(run()) == []
+
+
+def test_unsupported_item_type_is_left_blank(work_dir, roster):
+    server = StandInServer(roster, page_padding=0)
+    sheets_config = get_sheets_config(roster)
+    minion_heading = {"DisplayName": "Wind-up Airship", "ItemName": "Wind-up Airship", "ItemType": "Minion"}
+    sheets_config["Spreadsheets"][0]["sheets"].append({"title": "Minions", "Values": [minion_heading]})
+
+    fill_sheet_data(server, sheets_config, roster.characters_list)
+
+    mount_cells = get_sheet_cells(server, "Mounts")
+    minion_cells = get_sheet_cells(server, "Minions")
+    for charnum, char_and_world in enumerate(roster.characters_list, start=1):
+        assert get_cell_value(mount_cells, charnum, 1) in ("Y", "N")
+        assert minion_cells[(charnum, 0)]["note"] == char_and_world
+        assert get_cell_value(minion_cells, charnum, 1) == ""
+
+
+def test_stored_achievements_survive_deleting_caches(work_dir):
+    # Enough achievements for several pages each, so a refresh that stops early reads fewer pages.
+    roster = SyntheticRoster(size=2, mounts_per_character=1, achievements_per_character=ACHIEVEMENTS_PER_PAGE * 3)
+    server = StandInServer(roster, page_padding=0)
+    sheets_config = get_sheets_config(roster)
+    fill_sheet_data(server, sheets_config, roster.characters_list)
+    assert server.stats[ACHIEVEMENT_PAGE_ENDPOINT][REQUESTS] == 3 * len(roster.characters)
+    achievement_cells = get_sheet_cells(server, "Achievements")
+
+    for cache_file in work_dir.glob("*.json"):
+        cache_file.unlink()
+    # Load the caches again, as a new process would.
+    lodestoneapi.set_cache_dir(str(work_dir))
+    # A server's application is bound to the event loop it first ran on, so the second run needs a new one.
+    warm_server = StandInServer(roster, page_padding=0)
+    warm_server.spreadsheets = server.spreadsheets
+    fill_sheet_data(warm_server, sheets_config, roster.characters_list)
+
+    # Only the first page is read, since the newest achievement is already in the collection store.
+    assert warm_server.stats[ACHIEVEMENT_PAGE_ENDPOINT][REQUESTS] == len(roster.characters)
+    assert get_sheet_cells(warm_server, "Achievements") == achievement_cells
+
+
+def test_renamed_sheet_with_same_headings_is_reused(work_dir, roster):
+    server = StandInServer(roster, page_padding=0)
+    sheets_config = get_sheets_config(roster)
+    fill_sheet_data(server, sheets_config, roster.characters_list)
+    sheet_ids = get_sheet_ids(server)
+    mount_cells = get_sheet_cells(server, "Mounts")
+
+    sheets_config = get_sheets_config(roster)
+    sheets_config["Spreadsheets"][0]["sheets"][0]["title"] = "Mount Farm"
+    server = fill_sheet_data_again(server, sheets_config, roster.characters_list)
+
+    assert get_sheet_ids(server) == {"Mount Farm": sheet_ids["Mounts"], "Achievements": sheet_ids["Achievements"]}
+    assert get_sheet_cells(server, "Mount Farm") == mount_cells
+
+
+def test_renamed_sheet_with_other_headings_is_replaced(work_dir, roster):
+    server = StandInServer(roster, page_padding=0)
+    sheets_config = get_sheets_config(roster)
+    fill_sheet_data(server, sheets_config, roster.characters_list)
+    sheet_ids = get_sheet_ids(server)
+
+    sheets_config = get_sheets_config(roster)
+    goals_config = sheets_config["Spreadsheets"][0]["sheets"][1]
+    goals_config["title"] = "Goals"
+    goals_config["Values"] = goals_config["Values"][:2]
+    server = fill_sheet_data_again(server, sheets_config, roster.characters_list)
+
+    new_sheet_ids = get_sheet_ids(server)
+    assert list(new_sheet_ids) == ["Mounts", "Goals"]
+    assert new_sheet_ids["Mounts"] == sheet_ids["Mounts"]
+    assert new_sheet_ids["Goals"] not in sheet_ids.values()
+    goals_cells = get_sheet_cells(server, "Goals")
+    assert [get_cell_value(goals_cells, 0, col_index) for col_index in range(1, 4)] == (
+        [heading["DisplayName"] for heading in goals_config["Values"]] + [""]
+    )
+
+
+def test_sheets_are_moved_and_deleted_to_match_config(work_dir, roster):
+    server = StandInServer(roster, page_padding=0)
+    sheets_config = get_sheets_config(roster)
+    sheets_config["Spreadsheets"][0]["sheets"].append(
+        {"title": "Spare", "Values": sheets_config["Spreadsheets"][0]["sheets"][0]["Values"][:1]}
+    )
+    fill_sheet_data(server, sheets_config, roster.characters_list)
+    sheet_ids = get_sheet_ids(server)
+    assert list(sheet_ids) == ["Mounts", "Achievements", "Spare"]
+
+    sheets_config = get_sheets_config(roster)
+    sheets_config["Spreadsheets"][0]["sheets"].reverse()
+    server = fill_sheet_data_again(server, sheets_config, roster.characters_list)
+
+    assert get_sheet_ids(server) == {"Achievements": sheet_ids["Achievements"], "Mounts": sheet_ids["Mounts"]}
+
+
+def test_changed_colours_replace_conditional_formatting(work_dir, roster):
+    server = StandInServer(roster, page_padding=0)
+    fill_sheet_data(server, get_sheets_config(roster), roster.characters_list)
+
+    sheets_config = get_sheets_config(roster)
+    sheets_config["Colours"] = dict(sheets_config["Colours"], ColourHasItem={"r": 10, "g": 20, "b": 30})
+    server = fill_sheet_data_again(server, sheets_config, roster.characters_list)
+
+    _, _, colourhasitem, colournotitem, colourallitem = ffxiv_gsheet_updater.get_colours(sheets_config)
+    for sheet in server.spreadsheets[SPREADSHEET_ID]["sheets"]:
+        rules = ffxiv_gsheet_updater.get_conditional_format_rules(
+            sheet["properties"]["sheetId"], 0, colourhasitem, colournotitem, colourallitem
+        )
+        # Each rule is added ahead of the others, so they end up in the reverse order.
+        assert len(sheet["conditionalFormats"]) == len(rules)
+        assert all(rule_matches(existing, rule) for existing, rule in zip(sheet["conditionalFormats"], rules[::-1]))
+
+
+def test_resumed_run_renders_character_not_on_lodestone(work_dir, roster, monkeypatch):
+    server = StandInServer(roster, page_padding=0)
+    characters_list = roster.characters_list + [UNKNOWN_CHARACTER]
+    render_character = ffxiv_gsheet_updater.update_formatted_spreadsheet
+
+    def fail_to_render_unknown(*args, **kwargs):
+        if UNKNOWN_CHARACTER in args:
+            raise RuntimeError("Render failed.")
+        return render_character(*args, **kwargs)
+
+    monkeypatch.setattr(ffxiv_gsheet_updater, "update_formatted_spreadsheet", fail_to_render_unknown)
+    with pytest.raises(RuntimeError):
+        fill_sheet_data(server, get_sheets_config(roster), characters_list)
+    monkeypatch.setattr(ffxiv_gsheet_updater, "update_formatted_spreadsheet", render_character)
+
+    # Loaded again, as a new process would, since a run fills in the sheet IDs of its config.
+    server = fill_sheet_data_again(server, get_sheets_config(roster), characters_list, resume=True)
+
+    # The character was journaled as fetched, so they are not looked up again, but their row is still filled in.
+    assert store.collection_store.get_refresh_states([UNKNOWN_CHARACTER])[UNKNOWN_CHARACTER][1:] == (0, None)
+    assert get_sheet_cells(server, "Mounts")[(len(characters_list), 0)]["note"] == UNKNOWN_CHARACTER
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import pytest
+
+import ffxiv_automated_collectible_tracker.gsheets as gsheets
+
+
+def value_cell(value: str, **fields) -> dict:
+    return dict({"userEnteredValue": {"stringValue": value}}, **fields)
+
+
+@pytest.mark.parametrize("existing, desired, field_name, matches", [
+    # The API fills in properties that were not asked for.
+    ({"style": "SOLID", "width": 1}, {"style": "SOLID"}, None, True),
+    # The API leaves out properties at their default value.
+    (None, 0, "red", True),
+    (None, "", "stringValue", True),
+    (None, False, "bold", True),
+    (None, 1, "alpha", True),
+    (None, 0.5, "alpha", False),
+    (None, 0.5, "red", False),
+    (None, True, "bold", False),
+    (None, None, "note", True),
+    # Numbers.
+    (1, 1.0, "red", True),
+    (0.33333, 1 / 3, "red", True),
+    (0.3, 0.4, "red", False),
+    ("0.5", 0.5, "red", False),
+    # Strings.
+    ("Y", "Y", "stringValue", True),
+    ("N", "Y", "stringValue", False),
+    ("", "Y", "stringValue", False),
+    # Booleans.
+    (True, True, "bold", True),
+    (False, True, "bold", False),
+    (True, False, "bold", False),
+    # Nested values.
+    ({"rgbColor": {"red": 0.5}}, {"rgbColor": {"red": 0.5, "green": 0}}, None, True),
+    ({"rgbColor": {"red": 0.5}}, {"rgbColor": {"red": 0.5, "green": 0.2}}, None, False),
+    ("SOLID", {"style": "SOLID"}, None, False),
+])
+def test_value_matches(existing, desired, field_name, matches):
+    assert gsheets._value_matches(existing, desired, field_name) is matches
+
+
+def test_cell_matches_compares_every_written_field():
+    desired = value_cell("Y", userEnteredFormat={"textFormat": {"bold": True}})
+
+    assert gsheets.cell_matches(
+        value_cell("Y", userEnteredFormat={"textFormat": {"bold": True, "fontSize": 10}}, effectiveValue={}), desired
+    )
+    assert not gsheets.cell_matches(value_cell("Y"), desired)
+    assert not gsheets.cell_matches(value_cell("N", userEnteredFormat={"textFormat": {"bold": True}}), desired)
+    # Writing the desired cell would clear a note it does not have.
+    assert not gsheets.cell_matches(dict(desired, note="Farming this"), desired)
+    assert gsheets.cell_matches(dict(desired, note=""), desired)
+    # An empty cell is already blank.
+    assert gsheets.cell_matches({}, value_cell(""))
+    assert not gsheets.cell_matches(value_cell("", userEnteredFormat={"textFormat": {"bold": True}}), value_cell(""))
+
+
+def test_get_changed_runs():
+    existing = [value_cell("Y"), value_cell("N"), value_cell("N"), value_cell("Y"), value_cell("Y")]
+    desired = [value_cell("Y"), value_cell("Y"), value_cell("Y"), value_cell("Y"), value_cell("N"), value_cell("N")]
+
+    assert gsheets.get_changed_runs(existing, desired) == [(1, desired[1:3]), (4, desired[4:])]
+    assert gsheets.get_changed_runs(existing, existing) == []
+    assert gsheets.get_changed_runs([], desired[:2]) == [(0, desired[:2])]
+    # Cells past the desired cells are left alone.
+    assert gsheets.get_changed_runs(existing, existing[:2]) == []
+
+
+def test_add_row_only_writes_compared_fields():
+    batchupdate = gsheets.BatchUpdate(None, "test-spreadsheet")
+    existing = [value_cell("Y"), value_cell("N", effectiveValue={"stringValue": "N"})]
+    desired = [value_cell("Y"), value_cell("Y")]
+
+    batchupdate.add_row_changes(7, 2, 1, desired, existing)
+
+    assert batchupdate.body["requests"] == [{"updateCells": {
+        "fields": "userEnteredValue,userEnteredFormat,note",
+        "start": {"sheetId": 7, "rowIndex": 2, "columnIndex": 2},
+        "rows": [{"values": desired[1:]}],
+    }}]
+
+
+class FakeBatchUpdateResource:
+    def batchUpdate(self, spreadsheetId: str, body: dict) -> dict:
+        return body
+
+
+class FakeGSheets:
+    """Records each BatchUpdate POST, instead of sending it, and fails the ones it is told to."""
+    def __init__(self, failing_posts: tuple = ()):
+        self.spreadsheets_resource = FakeBatchUpdateResource()
+        self.failing_posts = failing_posts
+        self.posts = []
+        self.finished_posts = []
+
+    async def execute_request(self, body: dict, idempotent: bool = True) -> dict:
+        post_number = len(self.posts)
+        self.posts.append([request["repeatCell"]["name"] for request in body["requests"]])
+        # Earlier POSTs are slower, so any later POST that did not wait for them would finish first.
+        await asyncio.sleep(0.01 * max(0, 3 - post_number))
+        if post_number in self.failing_posts:
+            raise RuntimeError(f"POST {post_number} failed.")
+        self.finished_posts.append(post_number)
+        return {"replies": [{} for _ in body["requests"]]}
+
+
+def make_request(name: str, size: int = 0) -> dict:
+    return {"repeatCell": {"name": name, "padding": "x" * size}}
+
+
+def run_batchupdate(fake_gsheets: FakeGSheets, requests: list, **budget) -> dict:
+    async def run():
+        batchupdate = gsheets.BatchUpdate(fake_gsheets, "test-spreadsheet", **budget)
+        for request in requests:
+            batchupdate.add_new_request(request)
+            # Let any POST already scheduled start, as the calling code would while building the next row.
+            await asyncio.sleep(0)
+        return await batchupdate.execute()
+
+    return asyncio.run(run())
+
+
+def test_request_budget_splits_posts():
+    fake_gsheets = FakeGSheets()
+
+    run_batchupdate(fake_gsheets, [make_request(str(number)) for number in range(7)], max_requests=3)
+
+    assert fake_gsheets.posts == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+
+
+def test_byte_budget_splits_posts():
+    requests = [make_request(str(number), size=100) for number in range(5)]
+    request_bytes = len(json.dumps(requests[0]))
+    fake_gsheets = FakeGSheets()
+
+    # Room for two requests, but not three.
+    run_batchupdate(fake_gsheets, requests, max_bytes=request_bytes * 2 + request_bytes // 2)
+
+    assert fake_gsheets.posts == [["0", "1"], ["2", "3"], ["4"]]
+
+
+def test_oversized_request_is_sent_on_its_own():
+    requests = [make_request("small"), make_request("huge", size=1000), make_request("after")]
+    fake_gsheets = FakeGSheets()
+
+    run_batchupdate(fake_gsheets, requests, max_bytes=500)
+
+    assert fake_gsheets.posts == [["small"], ["huge"], ["after"]]
+
+
+def test_failed_post_stops_later_posts():
+    fake_gsheets = FakeGSheets(failing_posts=(0,))
+
+    with pytest.raises(RuntimeError, match="POST 0 failed"):
+        run_batchupdate(fake_gsheets, [make_request(str(number)) for number in range(7)], max_requests=3)
+
+    # The later requests are never sent ahead of, or without, the ones before them.
+    assert fake_gsheets.posts == [["0", "1", "2"]]
+
+
+def test_posts_are_sent_in_order():
+    fake_gsheets = FakeGSheets()
+
+    response = run_batchupdate(fake_gsheets, [make_request(str(number)) for number in range(7)], max_requests=2)
+
+    assert fake_gsheets.posts == [["0", "1"], ["2", "3"], ["4", "5"], ["6"]]
+    assert fake_gsheets.finished_posts == [0, 1, 2, 3]
+    assert response == {"replies": [{}]}
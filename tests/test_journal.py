@@ -0,0 +1,53 @@
+from ffxiv_automated_collectible_tracker.journal import RunJournal
+
+
+RUN_KEY = "run-key"
+SPREADSHEET_ID = "test-spreadsheet"
+
+
+def record_progress(run_journal: RunJournal) -> None:
+    run_journal.mark_prepared(SPREADSHEET_ID)
+    run_journal.mark_fetched("Tester One@Phantom")
+    run_journal.mark_fetched("Tester Two@Phantom")
+    run_journal.add_pending(SPREADSHEET_ID, "Tester One@Phantom", 2)
+    run_journal.add_pending(SPREADSHEET_ID, "Tester Two@Phantom", 4)
+    run_journal.mark_sent(SPREADSHEET_ID, 2)
+
+
+def test_resume_replays_journal(tmp_path):
+    journal_filepath = tmp_path / "run_journal.jsonl"
+    record_progress(RunJournal(journal_filepath, RUN_KEY))
+    line_count = len(journal_filepath.read_text(encoding="utf-8").splitlines())
+
+    resumed_journal = RunJournal(journal_filepath, RUN_KEY, resume=True)
+
+    # Every step was appended as a line of its own, after the run key.
+    assert line_count == 5
+    assert resumed_journal.is_prepared(SPREADSHEET_ID)
+    assert resumed_journal.fetched == {"Tester One@Phantom", "Tester Two@Phantom"}
+    assert resumed_journal.is_committed(SPREADSHEET_ID, "Tester One@Phantom")
+    assert not resumed_journal.is_committed(SPREADSHEET_ID, "Tester Two@Phantom")
+
+
+def test_resume_ignores_record_cut_short(tmp_path):
+    journal_filepath = tmp_path / "run_journal.jsonl"
+    record_progress(RunJournal(journal_filepath, RUN_KEY))
+    with open(journal_filepath, "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"fetched": "Tester Thr')
+
+    resumed_journal = RunJournal(journal_filepath, RUN_KEY, resume=True)
+    resumed_journal.mark_fetched("Tester Three@Phantom")
+
+    assert resumed_journal.fetched == {"Tester One@Phantom", "Tester Two@Phantom", "Tester Three@Phantom"}
+    assert RunJournal(journal_filepath, RUN_KEY, resume=True).fetched == resumed_journal.fetched
+
+
+def test_other_run_starts_afresh(tmp_path):
+    journal_filepath = tmp_path / "run_journal.jsonl"
+    record_progress(RunJournal(journal_filepath, RUN_KEY))
+
+    other_journal = RunJournal(journal_filepath, "other-run-key", resume=True)
+
+    assert not other_journal.is_prepared(SPREADSHEET_ID)
+    assert other_journal.fetched == set()
+    assert not other_journal.is_committed(SPREADSHEET_ID, "Tester One@Phantom")
@@ -0,0 +1,127 @@
+import asyncio
+from bs4 import BeautifulSoup as bs
+from pathlib import Path
+import pytest
+
+import ffxiv_automated_collectible_tracker.lodestone as lodestoneapi
+from ffxiv_automated_collectible_tracker.standin import ACHIEVEMENTS_PER_PAGE, REQUESTS, StandInServer, SyntheticRoster
+
+from conftest import serve_stand_in
+
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "lodestone"
+ACHIEVEMENT_PAGE_ENDPOINT = "GET /lodestone/character/{char_id}/achievement"
+# Each extractor, the fixture page it reads, and any further arguments for it.
+EXTRACTOR_CASES = (
+    (lodestoneapi.extract_char_id, "character_search.html", ("Tester One",)),
+    (lodestoneapi.extract_char_id, "character_search.html", ("Nobody Atall",)),
+    (lodestoneapi.extract_mount_hrefs, "mount_list.html", ()),
+    (lodestoneapi.extract_mount_name, "mount_tooltip.html", ()),
+    (lodestoneapi.extract_achievement_page, "achievement_page.html", ()),
+    (lodestoneapi.extract_fc_id, "fc_search.html", ("The BLUs Brothers",)),
+    (lodestoneapi.extract_fc_member_page, "fc_member_page.html", ()),
+)
+
+
+def _parse_full_tree(html: str, strainer) -> bs:
+    """Parse the whole page with python's own parser, ignoring the strainer, as every page used to be parsed."""
+    return bs(html, "html.parser")
+
+
+@pytest.fixture(params=["lxml", "html.parser"])
+def html_parser(request):
+    default_html_parser = lodestoneapi.html_parser
+    lodestoneapi.set_html_parser(request.param)
+    yield request.param
+    lodestoneapi.set_html_parser(default_html_parser)
+
+
+@pytest.mark.parametrize(
+    "extractor, fixture_filename, extractor_args",
+    EXTRACTOR_CASES,
+    ids=[f"{extractor.__name__}-{args[0] if args else ''}" for extractor, _, args in EXTRACTOR_CASES],
+)
+def test_strained_extraction_matches_full_parse(html_parser, monkeypatch, extractor, fixture_filename, extractor_args):
+    html = (FIXTURES_DIR / fixture_filename).read_text(encoding="utf-8")
+    strained_result = extractor(html, *extractor_args)
+    monkeypatch.setattr(lodestoneapi, "_parse", _parse_full_tree)
+    assert strained_result == extractor(html, *extractor_args)
+
+
+def test_extractors_read_fixtures(html_parser):
+    def read_fixture(fixture_filename: str) -> str:
+        return (FIXTURES_DIR / fixture_filename).read_text(encoding="utf-8")
+
+    assert lodestoneapi.extract_char_id(read_fixture("character_search.html"), "Tester One") == "27182818"
+    assert lodestoneapi.extract_mount_hrefs(read_fixture("mount_list.html")) == [
+        "/lodestone/character/27182818/mount/tooltip/7b6a6cde0d5c9e1b0d2a3f4e5d6c7b8a9e0f1a2b",
+        "/lodestone/character/27182818/mount/tooltip/0a1b2c3d4e5f60718293a4b5c6d7e8f901234567",
+        "/lodestone/character/27182818/mount/tooltip/ffeeddccbbaa99887766554433221100ffeeddcc",
+    ]
+    assert lodestoneapi.extract_mount_name(read_fixture("mount_tooltip.html")) == "Company Chocobo"
+    assert lodestoneapi.extract_achievement_page(read_fixture("achievement_page.html")) == (
+        ["Blue Mage: Level 80", "Mask Carnivale: Stage 25", "To Crush Your Enemies I", 'Just "Helping" Out'],
+        7,
+    )
+    assert lodestoneapi.extract_fc_id(read_fixture("fc_search.html"), "The BLUs Brothers") == "9229283011365743624"
+    assert lodestoneapi.extract_fc_member_page(read_fixture("fc_member_page.html")) == (
+        [("Tester One", "27182818"), ("Tester Onesie", "31415926"), ("Hidden Member", None)],
+        2,
+    )
+
+
+def test_concurrent_characters_share_mount_tooltips(work_dir):
+    # More characters than mounts, so every mount is owned by several characters fetched at the same time.
+    roster = SyntheticRoster(size=8, mounts_per_character=2, achievements_per_character=1)
+    server = StandInServer(roster, latency=0.01)
+
+    async def run():
+        async with serve_stand_in(server) as (lodestone_client, _):
+            return await asyncio.gather(
+                *[lodestoneapi.get_char_mounts(lodestone_client, char_id) for char_id in roster.characters]
+            )
+
+    char_mounts = asyncio.run(run())
+    assert [sorted(mounts) for mounts in char_mounts] == [
+        sorted(character["Mounts"]) for character in roster.characters.values()
+    ]
+    owned_mounts = {mount_name for character in roster.characters.values() for mount_name in character["Mounts"]}
+    tooltip_stats = server.stats["GET /lodestone/character/{char_id}/mount/tooltip/{mount_key}"]
+    assert tooltip_stats[REQUESTS] == len(owned_mounts)
+
+
+def get_achievements_reading_pages(known_index: int) -> ([str], [str], int):
+    """Get a character's achievements from a stand-in server, knowing all but their newest few.
+
+    :param known_index: The index, newest first, of the newest achievement already known.
+    :return: A tuple of the character's achievements on the server, the achievements got, and the pages read.
+    """
+    roster = SyntheticRoster(size=1, mounts_per_character=1, achievements_per_character=ACHIEVEMENTS_PER_PAGE * 3)
+    server = StandInServer(roster, page_padding=0)
+    char_id, character = next(iter(roster.characters.items()))
+
+    async def run():
+        async with serve_stand_in(server) as (lodestone_client, _):
+            return await lodestoneapi.get_char_achievements(
+                lodestone_client, char_id, character["Achievements"][known_index:]
+            )
+
+    achievements = asyncio.run(run())
+    return character["Achievements"], achievements, server.stats[ACHIEVEMENT_PAGE_ENDPOINT][REQUESTS]
+
+
+def test_one_new_achievement_reads_one_page(work_dir):
+    character_achievements, achievements, pages_read = get_achievements_reading_pages(known_index=1)
+
+    assert achievements == character_achievements
+    assert pages_read == 1
+
+
+def test_known_achievement_off_first_page_reads_on(work_dir):
+    # More new achievements than fit on a page, so the newest known one has moved to the second page.
+    character_achievements, achievements, pages_read = get_achievements_reading_pages(
+        known_index=ACHIEVEMENTS_PER_PAGE + 5
+    )
+
+    assert achievements == character_achievements
+    assert pages_read == 2
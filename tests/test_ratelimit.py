@@ -0,0 +1,245 @@
+import asyncio
+import datetime
+import email.utils
+import pytest
+
+import ffxiv_automated_collectible_tracker.ratelimit as ratelimit
+
+
+def test_rate_limiter_follows_latest_parameters(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_rate_limiters", {})
+    rate_limiter = ratelimit.get_rate_limiter("lodestone.test", 10, 5)
+    rate_limiter.tokens = 1
+
+    assert ratelimit.get_rate_limiter("lodestone.test", 2, 5) is rate_limiter
+    assert (rate_limiter.rate, rate_limiter.capacity) == (2, 5)
+    ratelimit.get_rate_limiter("lodestone.test", 2, 3)
+    assert (rate_limiter.rate, rate_limiter.capacity) == (2, 3)
+    assert rate_limiter.tokens <= 3
+    assert ratelimit.get_rate_limiter("sheets.test", 1, 1) is not rate_limiter
+
+
+def test_rate_limiter_works_on_a_new_event_loop(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_rate_limiters", {})
+    rate_limiter = ratelimit.get_rate_limiter("lodestone.test", 1000, 2)
+
+    async def acquire_together():
+        # Enough callers at once that they queue on the bucket's lock.
+        await asyncio.gather(*[rate_limiter.acquire() for _ in range(4)])
+
+    asyncio.run(acquire_together())
+    asyncio.run(acquire_together())
+
+
+class FlakyCall:
+    """An async function that fails a set number of times before it succeeds."""
+    def __init__(self, failures: int, exception: Exception):
+        self.failures = failures
+        self.exception = exception
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exception
+        return "done"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record every delay asked of asyncio.sleep, instead of waiting."""
+    delays = []
+
+    async def fake_sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def get_retry_info(retry_after: float = None):
+    def get_info(exception: Exception) -> (bool, float):
+        return isinstance(exception, ConnectionError), retry_after
+    return get_info
+
+
+def test_retry_stops_at_max_attempts(sleeps):
+    flaky_call = FlakyCall(failures=10, exception=ConnectionError("down"))
+    retried = []
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(ratelimit.RetryPolicy(max_attempts=4).call(flaky_call, get_retry_info(), on_retry=retried.append))
+
+    assert flaky_call.calls == 4
+    assert len(sleeps) == 3
+    assert len(retried) == 3
+
+
+def test_retry_succeeds_after_failures(sleeps):
+    flaky_call = FlakyCall(failures=2, exception=ConnectionError("down"))
+
+    assert asyncio.run(ratelimit.RetryPolicy(max_attempts=4).call(flaky_call, get_retry_info())) == "done"
+    assert flaky_call.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_non_retryable_error_is_raised_at_once(sleeps):
+    flaky_call = FlakyCall(failures=1, exception=ValueError("bad request"))
+    retried = []
+
+    with pytest.raises(ValueError):
+        asyncio.run(ratelimit.RetryPolicy().call(flaky_call, get_retry_info(), on_retry=retried.append))
+
+    assert flaky_call.calls == 1
+    assert sleeps == []
+    assert retried == []
+
+
+def test_full_jitter_bounds(monkeypatch):
+    bounds = []
+
+    def fake_uniform(low: float, high: float) -> float:
+        bounds.append((low, high))
+        return high
+
+    monkeypatch.setattr(ratelimit.random, "uniform", fake_uniform)
+    retry_policy = ratelimit.RetryPolicy(base_delay=1.0, max_delay=10.0)
+
+    delays = [retry_policy.get_delay(attempt) for attempt in range(1, 7)]
+
+    assert bounds == [(0, 1.0), (0, 2.0), (0, 4.0), (0, 8.0), (0, 10.0), (0, 10.0)]
+    assert delays == [1.0, 2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+def test_retry_after_replaces_jitter_up_to_max_delay(monkeypatch, sleeps):
+    monkeypatch.setattr(ratelimit.random, "uniform", lambda low, high: pytest.fail("Retry-After was ignored."))
+    retry_policy = ratelimit.RetryPolicy(max_delay=30.0)
+    assert retry_policy.get_delay(1, retry_after=5.0) == 5.0
+    assert retry_policy.get_delay(1, retry_after=120.0) == 30.0
+
+    rate_limiter = ratelimit.TokenBucket(1000, 10)
+    pauses = []
+    monkeypatch.setattr(rate_limiter, "pause", pauses.append)
+    flaky_call = FlakyCall(failures=1, exception=ConnectionError("throttled"))
+    asyncio.run(retry_policy.call(flaky_call, get_retry_info(retry_after=5.0), rate_limiter))
+
+    assert sleeps == [5.0]
+    # Every other caller of the host waits out the Retry-After too.
+    assert pauses == [5.0]
+
+
+def test_parse_retry_after_seconds():
+    assert ratelimit.parse_retry_after("120") == 120.0
+    assert ratelimit.parse_retry_after("1.5") == 1.5
+    assert ratelimit.parse_retry_after("-3") == 0.0
+    assert ratelimit.parse_retry_after(None) is None
+    assert ratelimit.parse_retry_after("") is None
+    assert ratelimit.parse_retry_after("soon") is None
+
+
+def test_parse_retry_after_http_date(monkeypatch):
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+    monkeypatch.setattr(ratelimit.time, "time", now.timestamp)
+
+    in_a_minute = email.utils.format_datetime(now + datetime.timedelta(seconds=60), usegmt=True)
+    assert ratelimit.parse_retry_after(in_a_minute) == 60.0
+    a_minute_ago = email.utils.format_datetime(now - datetime.timedelta(seconds=60), usegmt=True)
+    assert ratelimit.parse_retry_after(a_minute_ago) == 0.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock that only moves when a test moves it."""
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+async def finish_calls(limiter: ratelimit.AdaptiveConcurrencyLimiter, latencies: [float], overloaded: bool = False):
+    """Finish a call for each latency, starting new calls to keep the limiter full, as a busy client does."""
+    for latency in latencies:
+        while limiter.in_flight < int(limiter.limit):
+            await limiter.acquire()
+        await limiter.release(None if overloaded else latency, overloaded)
+
+
+def test_limit_grows_by_about_one_per_round(clock):
+    limiter = ratelimit.AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=32)
+
+    async def run():
+        expected_limit = 4
+        for _ in range(4):
+            expected_limit += 1 / expected_limit
+        await finish_calls(limiter, [0.1] * 4)
+        assert limiter.limit == pytest.approx(expected_limit)
+        assert 4.8 < limiter.limit < 5
+        # Calls finished with room to spare have not shown that the limit can go higher.
+        await limiter.release(0.1)
+        assert limiter.limit == pytest.approx(expected_limit)
+
+    asyncio.run(run())
+
+
+def test_limit_halves_when_overloaded(clock):
+    limiter = ratelimit.AdaptiveConcurrencyLimiter(initial_limit=8)
+
+    async def run():
+        await finish_calls(limiter, [0.1])
+        limit = limiter.limit
+        clock[0] += 1
+        # The calls in flight all report the same overload, but only cut the limit once.
+        await finish_calls(limiter, [None] * 3, overloaded=True)
+        assert limiter.limit == pytest.approx(limit / 2)
+        clock[0] += 1
+        await finish_calls(limiter, [None], overloaded=True)
+        assert limiter.limit == pytest.approx(limit / 4)
+
+    asyncio.run(run())
+
+
+def test_limit_halves_on_slow_response(clock):
+    limiter = ratelimit.AdaptiveConcurrencyLimiter(initial_limit=8, latency_tolerance=2.0)
+
+    async def run():
+        await finish_calls(limiter, [0.1])
+        limit = limiter.limit
+        clock[0] += 1
+        # Slower than usual, but within the tolerance.
+        await finish_calls(limiter, [0.15])
+        assert limiter.limit > limit
+        limit = limiter.limit
+        clock[0] += 1
+        await finish_calls(limiter, [0.5])
+        assert limiter.limit == pytest.approx(limit / 2)
+
+    asyncio.run(run())
+
+
+def test_limit_stays_between_floor_and_ceiling(clock):
+    limiter = ratelimit.AdaptiveConcurrencyLimiter(initial_limit=4, min_limit=2, max_limit=5)
+
+    async def run():
+        await finish_calls(limiter, [0.1] * 50)
+        assert limiter.limit == 5
+        for _ in range(5):
+            clock[0] += 1
+            await finish_calls(limiter, [None], overloaded=True)
+        assert limiter.limit == 2
+
+    asyncio.run(run())
+
+
+def test_limit_caps_calls_in_flight():
+    limiter = ratelimit.AdaptiveConcurrencyLimiter(initial_limit=2)
+
+    async def run():
+        await limiter.acquire()
+        await limiter.acquire()
+        third = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not third.done()
+        await limiter.release(0.1)
+        await third
+        assert limiter.in_flight == 2
+
+    asyncio.run(run())
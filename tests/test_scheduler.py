@@ -0,0 +1,84 @@
+import pytest
+
+from ffxiv_automated_collectible_tracker.scheduler import SECONDS_PER_HOUR, RefreshScheduler
+from ffxiv_automated_collectible_tracker.store import CollectionStore
+
+
+CHARACTER = "Tester0000 Benchmark@Phantom"
+FETCHED_AT = 1_700_000_000.0
+
+
+def get_details(mounts: [str], char_id: str = "1000000") -> dict:
+    return {"ID": char_id, "Name": "Tester0000 Benchmark", "World": "Phantom", "Mounts": mounts}
+
+
+@pytest.fixture
+def collection_store(tmp_path):
+    collection_store = CollectionStore(str(tmp_path / "collections.sqlite3"))
+    yield collection_store
+    collection_store.close()
+
+
+def hours_after(fetched_at: float, hours: float) -> float:
+    return fetched_at + hours * SECONDS_PER_HOUR
+
+
+def test_character_is_due_after_ttl(collection_store):
+    scheduler = RefreshScheduler(collection_store, ttl=6, max_ttl=48, backoff=2)
+    assert scheduler.get_next_refresh(CHARACTER) == 0.0
+
+    collection_store.record(CHARACTER, get_details(["Company Chocobo"]), fetched_at=FETCHED_AT)
+
+    assert scheduler.get_next_refresh(CHARACTER, ["Mounts"]) == hours_after(FETCHED_AT, 6)
+    assert scheduler.get_due_characters([CHARACTER], ["Mounts"], now=hours_after(FETCHED_AT, 5.9)) == []
+    assert scheduler.get_due_characters([CHARACTER], ["Mounts"], now=hours_after(FETCHED_AT, 6)) == [CHARACTER]
+    # Details missing a collection that is now needed are due straight away.
+    assert scheduler.get_next_refresh(CHARACTER, ["Mounts", "Achievements"]) == 0.0
+
+
+def test_ttl_backs_off_up_to_max_and_resets_on_change(collection_store):
+    scheduler = RefreshScheduler(collection_store, ttl=6, max_ttl=48, backoff=2)
+    details = get_details(["Company Chocobo"])
+    fetched_at = FETCHED_AT
+    collection_store.record(CHARACTER, details, fetched_at=fetched_at)
+
+    intervals = []
+    for _ in range(5):
+        fetched_at = scheduler.get_next_refresh(CHARACTER)
+        collection_store.record(CHARACTER, details, fetched_at=fetched_at)
+        intervals.append((scheduler.get_next_refresh(CHARACTER) - fetched_at) / SECONDS_PER_HOUR)
+    assert intervals == [12, 24, 48, 48, 48]
+
+    collection_store.record(CHARACTER, get_details(["Company Chocobo", "Draught Chocobo"]), fetched_at=fetched_at + 1)
+    assert scheduler.get_next_refresh(CHARACTER) == hours_after(fetched_at + 1, 6)
+
+
+def test_ttl_of_zero_is_always_due(collection_store):
+    scheduler = RefreshScheduler(collection_store, ttl=0)
+    collection_store.record(CHARACTER, get_details([]), fetched_at=FETCHED_AT)
+
+    assert scheduler.get_due_characters([CHARACTER], now=FETCHED_AT) == [CHARACTER]
+
+
+def test_character_not_on_lodestone_backs_off(collection_store):
+    scheduler = RefreshScheduler(collection_store, ttl=6, max_ttl=48, backoff=2)
+    not_found = {"ID": None, "Name": "Nobody Atall", "World": "Phantom"}
+    collection_store.record(CHARACTER, not_found, fetched_at=FETCHED_AT)
+    collection_store.record(CHARACTER, not_found, fetched_at=hours_after(FETCHED_AT, 6))
+
+    # Having no collections does not make them due, since there are none to fetch.
+    assert scheduler.get_next_refresh(CHARACTER, ["Mounts"]) == hours_after(FETCHED_AT, 6 + 12)
+
+
+def test_roster_is_checked_in_one_query(collection_store):
+    scheduler = RefreshScheduler(collection_store, ttl=6)
+    characters_list = [f"Tester{number:04d} Benchmark@Phantom" for number in range(20)]
+    for char_and_world in characters_list[:15]:
+        collection_store.record(char_and_world, get_details(["Company Chocobo"]), fetched_at=FETCHED_AT)
+    queries = []
+    collection_store.connect().set_trace_callback(queries.append)
+
+    due_characters = scheduler.get_due_characters(characters_list, ["Mounts"], now=hours_after(FETCHED_AT, 1))
+
+    assert due_characters == characters_list[15:]
+    assert len(queries) == 1